@@ -0,0 +1,353 @@
+import asyncio
+import base64
+import os
+import random
+import socket
+import time
+
+import websockets
+
+from Batcher import SendBatcher
+from Context import Context
+from Message import Message, MessageType
+
+
+class AsyncWSClient:
+    """Client asyncio, compatible avec WSServer, pour les bots et passerelles de capteurs.
+
+    `await client.send(...)` rend la main une fois le message écrit (ou mis dans le lot
+    en cours) ; avec `ack=True`, une fois l'accusé du serveur reçu, et retourne True si
+    livré, False si destinataire introuvable. Pour enchaîner les envois sans attendre
+    chaque accusé : `await asyncio.gather(*(client.send(..., ack=True) for ...))`, les
+    messages partent dans l'ordre.
+    Les messages reçus se lisent avec `async for message in client` ; si personne ne les
+    lit, les plus anciens sont perdus (comptés dans `dropped`) sans bloquer les accusés.
+    """
+
+    MEDIA_TYPES = {
+        'image': (MessageType.ENVOI.IMAGE, "IMG"),
+        'audio': (MessageType.ENVOI.AUDIO, "AUDIO"),
+        'video': (MessageType.ENVOI.VIDEO, "VIDEO"),
+    }
+
+    def __init__(self, ctx, username="Client", auto_ack=True, queue_size=1000):
+        self.ctx = ctx
+        self.username = username
+        self.auto_ack = auto_ack  # accusé cumulé des messages reçus, comme WSClient
+        self.ws = None
+        self.connected_clients = []
+        self.incoming = asyncio.Queue(maxsize=queue_size)
+        self.dropped = 0  # messages reçus perdus, boîte pleine
+        self.pending_acks = {}
+        self.next_seq = 1
+        # Regroupement en trames BATCH (ctx.batch_window_ms), même règles que SendBatcher
+        self.batch = []
+        self.batch_bytes = 0
+        self.batch_handle = None
+        self.reader_task = None
+        self.keepalive_task = None
+        self.awaiting_pong = False
+        self.opened = asyncio.Event()
+        # Reprise de session (voir WSServer.handle_resume)
+        self.session_token = None
+        self.last_seq = 0
+        self.acked_seq = 0
+        self.ack_handle = None
+        self.reconnect_delay = None
+        self.dropped_at = None
+        self.reconnect_attempts = 0
+        self.closing = False
+
+    async def __aenter__(self):
+        await self.connect()
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.close()
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        message = await self.incoming.get()
+        if message is None:
+            raise StopAsyncIteration
+        return message
+
+    async def connect(self):
+        await self._open()
+        self.reader_task = asyncio.create_task(self._read_loop())
+        if self.ctx.keepalive_ms:
+            self.keepalive_task = asyncio.create_task(self._keepalive())
+
+    async def _open(self):
+        # Socket créée à la main pour appliquer les options du profil (TCP_NODELAY, tampons...)
+        loop = asyncio.get_running_loop()
+        sock = await loop.run_in_executor(None, socket.create_connection, (self.ctx.host, self.ctx.port))
+        self.ctx.apply_socket_options(sock)
+        # Pas de ping natif : sa charge binaire est décodée en UTF-8 par websocket_server, dont le
+        # thread du client meurt ; la vivacité passe par SYS PING / PONG (voir _keepalive)
+        self.ws = await websockets.connect(self.ctx.url(), sock=sock, max_size=None, ping_interval=None)
+        self.awaiting_pong = False
+        if self.session_token:
+            declaration = Message.resume(self.username, self.session_token, self.last_seq)
+        else:
+            declaration = Message(MessageType.DECLARATION, emitter=self.username, receiver="", value="")
+        await self.ws.send(declaration.to_json())
+        self.opened.set()
+
+    async def close(self):
+        self.closing = True
+        if self.keepalive_task is not None:
+            self.keepalive_task.cancel()
+        if self.ws is not None:
+            try:
+                await self.flush()
+                disconnect_msg = Message(MessageType.SYS_MESSAGE, emitter=self.username, receiver="", value="Disconnect")
+                await self.ws.send(disconnect_msg.to_json())
+                await self.ws.close()
+            except websockets.ConnectionClosed:
+                pass
+        if self.reader_task is not None:
+            await self.reader_task
+
+    async def recv(self):
+        """Prochain message reçu, None une fois la connexion fermée"""
+        return await self.incoming.get()
+
+    async def send(self, value, dest, ack=False):
+        message = Message(MessageType.ENVOI.TEXT, emitter=self.username, receiver=dest, value=value)
+        return await self.send_message(message, ack)
+
+    async def send_sensor(self, sensor_id, value, dest, ack=False):
+        return await self.send_message(Message.sensor(self.username, sensor_id, value, dest), ack)
+
+    async def send_media(self, kind, source, dest, ack=False):
+        """Envoie une image, un son ou une vidéo (`kind`) depuis un chemin ou des octets"""
+        message_type, prefix = self.MEDIA_TYPES[kind]
+        # Lecture et encodage base64 hors de la boucle d'événements
+        encoded = await asyncio.get_running_loop().run_in_executor(None, self._encode, source)
+        message = Message(message_type, emitter=self.username, receiver=dest, value=f"{prefix}:{encoded}")
+        return await self.send_message(message, ack)
+
+    @staticmethod
+    def _encode(source):
+        if isinstance(source, (str, os.PathLike)):
+            with open(source, "rb") as f:
+                source = f.read()
+        return base64.b64encode(source).decode("utf-8")
+
+    async def send_message(self, message, ack=False):
+        """Envoie un Message ; avec `ack`, attend l'accusé du serveur et retourne True si livré"""
+        future = await self._queue(message, ack)
+        if future is None:
+            return None
+        return await future
+
+    async def _queue(self, message, ack):
+        # Numérote, écrit ou met en lot le message ; retourne le futur de son accusé (ou None)
+        await self.opened.wait()
+        future = None
+        if ack:
+            message.seq = self.next_seq
+            self.next_seq += 1
+            future = asyncio.get_running_loop().create_future()
+            self.pending_acks[message.seq] = future
+
+        if not self.ctx.batch_window_ms:
+            await self._send_now(message)
+            return future
+
+        size = SendBatcher.estimate(message)
+        if size >= self.ctx.batch_max_bytes:
+            await self.flush()
+            await self._send_now(message)
+            return future
+        self.batch.append(message)
+        self.batch_bytes += size
+        if len(self.batch) >= self.ctx.batch_max_messages or self.batch_bytes >= self.ctx.batch_max_bytes:
+            await self.flush()
+        elif self.batch_handle is None:
+            self.batch_handle = asyncio.get_running_loop().call_later(
+                self.ctx.batch_window_ms / 1000.0, lambda: asyncio.ensure_future(self.flush()))
+        return future
+
+    async def flush(self):
+        """Envoie le lot en attente en une seule trame"""
+        if self.batch_handle is not None:
+            self.batch_handle.cancel()
+            self.batch_handle = None
+        if not self.batch:
+            return
+        batch, self.batch, self.batch_bytes = self.batch, [], 0
+        message = batch[0] if len(batch) == 1 else Message.batch(self.username, batch)
+        await self._send_now(message)
+
+    async def _send_now(self, message):
+        # L'accusé cumulé en attente part avec la trame (l'enveloppe d'un lot), comme WSClient.send_now
+        message.ack = self._pending_ack()
+        await self.ws.send(message.to_json())
+        self._confirm_ack(message.ack)
+
+    async def _keepalive(self):
+        """SYS PING au serveur à chaque intervalle ; sans PONG depuis le précédent, la connexion
+        est fermée et _read_loop se reconnecte"""
+        while not self.closing:
+            await asyncio.sleep(self.ctx.keepalive_ms / 1000.0)
+            if not self.opened.is_set():
+                continue
+            ws = self.ws
+            try:
+                if self.awaiting_pong:
+                    await ws.close(code=1011, reason="keepalive")
+                    continue
+                self.awaiting_pong = True
+                ping_msg = Message(MessageType.SYS_MESSAGE, emitter=self.username, receiver="SERVER",
+                                   value=f"PING:{time.monotonic()}")
+                await ws.send(ping_msg.to_json())
+            except websockets.ConnectionClosed:
+                pass
+
+    def _enqueue(self, message):
+        # Ne bloque jamais la lecture : les accusés et les SYS qui suivent doivent être traités
+        if self.incoming.full():
+            self.incoming.get_nowait()
+            self.dropped += 1
+        self.incoming.put_nowait(message)
+
+    def _pending_ack(self):
+        if not self.auto_ack or self.last_seq <= self.acked_seq:
+            return None
+        return self.last_seq
+
+    def _confirm_ack(self, ack):
+        # acked_seq n'avance qu'une fois la trame écrite, comme WSClient.confirm_ack
+        if ack is not None and self.acked_seq < ack <= self.last_seq:
+            self.acked_seq = ack
+
+    def _schedule_ack(self):
+        if self.auto_ack and self.ack_handle is None:
+            self.ack_handle = asyncio.get_running_loop().call_later(
+                self.ctx.ack_interval_ms / 1000.0, lambda: asyncio.ensure_future(self._send_ack()))
+
+    async def _send_ack(self):
+        self.ack_handle = None
+        if not self.opened.is_set():
+            return
+        ack = self._pending_ack()
+        if ack is not None:
+            try:
+                await self.ws.send(Message.cumulative_ack(self.username, ack).to_json())
+                self._confirm_ack(ack)
+            except websockets.ConnectionClosed:
+                pass
+
+    async def _read_loop(self):
+        while True:
+            try:
+                async for raw in self.ws:
+                    await self._dispatch(Message.from_json(raw))
+            except websockets.ConnectionClosed:
+                pass
+            self.opened.clear()
+            self._fail_pending_acks()
+            if self.dropped_at is None:
+                self.dropped_at = time.monotonic()
+
+            delay = self._pending_reconnect()
+            if delay is None:
+                break
+            self.reconnect_delay = None
+            await asyncio.sleep(delay)
+            try:
+                await self._open()
+                self.dropped_at = None
+                self.reconnect_attempts = 0
+            except (OSError, websockets.InvalidHandshake):
+                continue
+        self._enqueue(None)
+
+    def _pending_reconnect(self):
+        if self.closing:
+            return None
+        if self.reconnect_delay is not None:
+            return self.reconnect_delay
+        # Coupure réseau : même délai exponentiel que WSClient.mark_closed
+        delay_ms = min(self.ctx.reconnect_max_ms, self.ctx.reconnect_base_ms * 2 ** min(self.reconnect_attempts, 16))
+        self.reconnect_attempts += 1
+        return random.uniform(0.5, 1.0) * delay_ms / 1000.0
+
+    def _fail_pending_acks(self):
+        # Envois non acquittés avant la coupure : on ne sait pas s'ils ont été routés
+        for future in self.pending_acks.values():
+            if not future.done():
+                future.set_exception(ConnectionError("connexion fermée avant l'accusé"))
+        self.pending_acks.clear()
+
+    async def _dispatch(self, received_msg):
+        if received_msg.seq is not None:
+            if received_msg.seq <= self.last_seq:
+                return  # déjà reçu, rejoué après une reprise
+            self.last_seq = received_msg.seq
+            self._schedule_ack()
+
+        if received_msg.message_type == MessageType.SESSION:
+            self.session_token = received_msg.value['token']
+            if not received_msg.value.get('resumed'):
+                self.last_seq = self.acked_seq = received_msg.value['seq']
+            return
+
+        if received_msg.message_type == MessageType.WARNING and received_msg.value == "RESUME_REFUSED":
+            self.session_token = None
+            self.last_seq = self.acked_seq = 0
+            declaration = Message(MessageType.DECLARATION, emitter=self.username, receiver="", value="")
+            await self.ws.send(declaration.to_json())
+            return
+
+        if received_msg.message_type == MessageType.SYS_MESSAGE:
+            value = str(received_msg.value)
+            if value == "ping":
+                pong_msg = Message(MessageType.SYS_MESSAGE, emitter=self.username, receiver="", value="pong")
+                await self.ws.send(pong_msg.to_json())
+                return
+            if value.startswith("RECONNECT:"):
+                self.reconnect_delay = int(value.split(":", 1)[1]) / 1000.0
+                return
+            if value.startswith("PONG:"):
+                self.awaiting_pong = False
+                return
+            if value.startswith("ACK:") or value.startswith("NACK:"):
+                status, seq = value.split(":", 1)
+                future = self.pending_acks.pop(int(seq), None)
+                if future and not future.done():
+                    future.set_result(status == "ACK")
+                return
+
+        if received_msg.message_type == MessageType.RECEPTION.CLIENT_LIST:
+            self.connected_clients = [c for c in received_msg.value if c != self.username]
+
+        self._enqueue(received_msg)
+
+    @staticmethod
+    def dev(username="Client"):
+        return AsyncWSClient(Context.dev(), username)
+
+    @staticmethod
+    def prod(username="Client"):
+        return AsyncWSClient(Context.prod(), username)
+
+
+async def _demo(username):
+    # Affiche les messages reçus et répond en écho à chaque message texte
+    async with AsyncWSClient(Context.load(default="prod"), username) as client:
+        async for message in client:
+            print(f"[{message.emitter}] {message.value}")
+            if message.message_type == MessageType.RECEPTION.TEXT and message.emitter not in ("SERVER", username):
+                started = time.perf_counter()
+                delivered = await client.send(f"echo: {message.value}", message.emitter, ack=True)
+                print(f"[echo] livré={delivered} en {(time.perf_counter() - started) * 1000:.1f} ms")
+
+
+if __name__ == "__main__":
+    import sys
+    asyncio.run(_demo(sys.argv[1] if len(sys.argv) > 1 else "AsyncClient"))
@@ -0,0 +1,74 @@
+import threading
+
+from Message import Message
+
+
+class SendBatcher:
+    """Regroupe les envois rapprochés en une seule trame BATCH.
+
+    Un lot part dès que `max_messages` ou `max_bytes` est atteint, sinon au bout de
+    `window_ms` après le premier message. Un message trop gros pour un lot (média)
+    part seul, après le lot en attente, pour garder l'ordre d'envoi.
+    """
+
+    # Taille approximative de l'enveloppe JSON d'un message (hors valeur)
+    OVERHEAD = 96
+
+    def __init__(self, emitter, send, window_ms, max_messages=50, max_bytes=64 * 1024):
+        self.emitter = emitter
+        self.send = send  # reçoit un Message (seul ou BATCH)
+        self.window = window_ms / 1000.0
+        self.max_messages = max_messages
+        self.max_bytes = max_bytes
+        self.pending = []
+        self.pending_bytes = 0
+        self.timer = None
+        self.lock = threading.Lock()
+        self.frames = 0
+        self.messages = 0
+
+    @staticmethod
+    def estimate(message):
+        value = message.value
+        return SendBatcher.OVERHEAD + (len(value) if isinstance(value, str) else 64)
+
+    def add(self, message):
+        size = self.estimate(message)
+        with self.lock:
+            if size >= self.max_bytes:
+                self._flush_locked()
+                self._send(message, 1)
+                return
+            self.pending.append(message)
+            self.pending_bytes += size
+            if len(self.pending) >= self.max_messages or self.pending_bytes >= self.max_bytes:
+                self._flush_locked()
+            elif self.timer is None:
+                self.timer = threading.Timer(self.window, self.flush)
+                self.timer.daemon = True
+                self.timer.start()
+
+    def flush(self):
+        with self.lock:
+            self._flush_locked()
+
+    def _flush_locked(self):
+        if self.timer is not None:
+            self.timer.cancel()
+            self.timer = None
+        if not self.pending:
+            return
+        pending, self.pending, self.pending_bytes = self.pending, [], 0
+        if len(pending) == 1:
+            self._send(pending[0], 1)
+        else:
+            self._send(Message.batch(self.emitter, pending), len(pending))
+
+    def _send(self, message, count):
+        # Envoi sous le verrou : les trames partent dans l'ordre des appels à add()
+        self.send(message)
+        self.frames += 1
+        self.messages += count
+
+    def stats(self):
+        return {'frames': self.frames, 'messages': self.messages, 'pending': len(self.pending)}
@@ -0,0 +1,273 @@
+import asyncio
+import random
+import socket
+import time
+
+import websockets
+
+from Batcher import SendBatcher
+from Context import Context
+from Message import Message, MessageType
+
+
+class VirtualUser:
+    """Utilisateur logique porté par un BotHost : un nom et une boîte de réception, sans socket à lui"""
+
+    def __init__(self, gateway, username, inbox_size):
+        self.gateway = gateway
+        self.username = username
+        self.inbox = asyncio.Queue(maxsize=inbox_size)
+        self.dropped = 0  # messages perdus, boîte pleine
+
+    def deliver(self, message):
+        try:
+            self.inbox.put_nowait(message)
+        except asyncio.QueueFull:
+            self.dropped += 1
+
+    async def recv(self):
+        return await self.inbox.get()
+
+    async def send(self, value, dest):
+        await self.gateway.send(Message(MessageType.ENVOI.TEXT, emitter=self.username, receiver=dest, value=value))
+
+    async def send_sensor(self, sensor_id, value, dest):
+        await self.gateway.send(Message.sensor(self.username, sensor_id, value, dest))
+
+
+class Gateway:
+    """Une connexion passerelle : déclare ses utilisateurs d'un coup et répartit ce qu'elle reçoit"""
+
+    def __init__(self, host, name):
+        self.host = host
+        self.name = name
+        self.users = {}
+        self.ws = None
+        self.opened = asyncio.Event()
+        self.reader_task = None
+        self.keepalive_task = None
+        self.awaiting_pong = False
+        self.reconnect_delay = None
+        self.reconnect_attempts = 0
+        # Regroupement en trames BATCH (ctx.batch_window_ms), comme AsyncWSClient
+        self.batch = []
+        self.batch_bytes = 0
+        self.batch_handle = None
+
+    async def open(self):
+        ctx = self.host.ctx
+        loop = asyncio.get_running_loop()
+        sock = await loop.run_in_executor(None, socket.create_connection, (ctx.host, ctx.port))
+        ctx.apply_socket_options(sock)
+        # Pas de ping natif (websocket_server ne sait pas le lire) : vivacité par SYS PING / PONG
+        self.ws = await websockets.connect(ctx.url(), sock=sock, max_size=None, ping_interval=None)
+        self.awaiting_pong = False
+        # Pas de session à reprendre : tous les utilisateurs sont redéclarés à chaque connexion
+        await self.ws.send(Message.gateway(self.name, self.users).to_json())
+        self.opened.set()
+
+    async def declare(self, usernames):
+        if self.opened.is_set():
+            await self.ws.send(Message.gateway(self.name, usernames).to_json())
+
+    async def send(self, message):
+        await self.opened.wait()
+        ctx = self.host.ctx
+        if not ctx.batch_window_ms:
+            await self.ws.send(message.to_json())
+            return
+        size = SendBatcher.estimate(message)
+        if size >= ctx.batch_max_bytes:
+            await self.flush()
+            await self.ws.send(message.to_json())
+            return
+        self.batch.append(message)
+        self.batch_bytes += size
+        if len(self.batch) >= ctx.batch_max_messages or self.batch_bytes >= ctx.batch_max_bytes:
+            await self.flush()
+        elif self.batch_handle is None:
+            self.batch_handle = asyncio.get_running_loop().call_later(
+                ctx.batch_window_ms / 1000.0, lambda: asyncio.ensure_future(self.flush()))
+
+    async def flush(self):
+        if self.batch_handle is not None:
+            self.batch_handle.cancel()
+            self.batch_handle = None
+        if not self.batch:
+            return
+        batch, self.batch, self.batch_bytes = self.batch, [], 0
+        message = batch[0] if len(batch) == 1 else Message.batch(self.name, batch)
+        await self.ws.send(message.to_json())
+
+    async def keepalive(self):
+        """SYS PING au serveur à chaque intervalle ; sans PONG depuis le précédent, la connexion
+        est fermée et read_loop se reconnecte (comme AsyncWSClient._keepalive)"""
+        while not self.host.closing:
+            await asyncio.sleep(self.host.ctx.keepalive_ms / 1000.0)
+            if not self.opened.is_set():
+                continue
+            ws = self.ws
+            try:
+                if self.awaiting_pong:
+                    await ws.close(code=1011, reason="keepalive")
+                    continue
+                self.awaiting_pong = True
+                ping_msg = Message(MessageType.SYS_MESSAGE, emitter=self.name, receiver="SERVER",
+                                   value=f"PING:{time.monotonic()}")
+                await ws.send(ping_msg.to_json())
+            except websockets.ConnectionClosed:
+                pass
+
+    async def read_loop(self):
+        while True:
+            try:
+                async for raw in self.ws:
+                    await self.dispatch(Message.from_json(raw))
+            except websockets.ConnectionClosed:
+                pass
+            self.opened.clear()
+            if self.host.closing:
+                break
+            delay = self.reconnect_delay
+            if delay is None:
+                ctx = self.host.ctx
+                delay_ms = min(ctx.reconnect_max_ms, ctx.reconnect_base_ms * 2 ** min(self.reconnect_attempts, 16))
+                delay = random.uniform(0.5, 1.0) * delay_ms / 1000.0
+                self.reconnect_attempts += 1
+            self.reconnect_delay = None
+            await asyncio.sleep(delay)
+            try:
+                await self.open()
+                self.host.stats['reconnects'] += 1
+                self.reconnect_attempts = 0
+            except (OSError, websockets.InvalidHandshake):
+                continue
+
+    async def dispatch(self, received_msg):
+        self.host.stats['received'] += 1
+        if received_msg.message_type == MessageType.SYS_MESSAGE:
+            value = str(received_msg.value)
+            if value == "ping":
+                pong_msg = Message(MessageType.SYS_MESSAGE, emitter=self.name, receiver="", value="pong")
+                await self.ws.send(pong_msg.to_json())
+                return
+            if value.startswith("RECONNECT:"):
+                self.reconnect_delay = int(value.split(":", 1)[1]) / 1000.0
+                return
+            if value.startswith("PONG:"):
+                self.awaiting_pong = False
+                return
+
+        if received_msg.message_type == MessageType.RECEPTION.CLIENT_LIST:
+            self.host.connected_clients = received_msg.value
+            return
+
+        # Le serveur n'envoie qu'une copie des messages "ALL" par passerelle
+        if received_msg.receiver == "ALL":
+            for user in self.users.values():
+                user.deliver(received_msg)
+            return
+        user = self.users.get(received_msg.receiver)
+        if user is not None:
+            user.deliver(received_msg)
+
+
+class BotHost:
+    """Héberge des milliers d'utilisateurs virtuels (bots, capteurs, simulateurs) dans un seul processus.
+
+    Les utilisateurs sont répartis sur `connections` connexions passerelles : chacune se
+    déclare au serveur avec la liste de ses utilisateurs (Message.gateway), reçoit une
+    seule copie des messages "ALL" et les distribue aux boîtes de réception locales.
+    Pas de thread ni de socket par utilisateur. Nécessite `websockets`.
+    """
+
+    def __init__(self, ctx, name="bots", connections=1, inbox_size=100):
+        self.ctx = ctx
+        self.name = name
+        self.inbox_size = inbox_size
+        self.gateways = [Gateway(self, f"{name}#{i}") for i in range(connections)]
+        self.users = {}
+        self.connected_clients = []
+        self.closing = False
+        self.stats = {'received': 0, 'reconnects': 0}
+
+    async def __aenter__(self):
+        await self.start()
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.close()
+
+    async def start(self):
+        await asyncio.gather(*(gateway.open() for gateway in self.gateways))
+        for gateway in self.gateways:
+            gateway.reader_task = asyncio.create_task(gateway.read_loop())
+            if self.ctx.keepalive_ms:
+                gateway.keepalive_task = asyncio.create_task(gateway.keepalive())
+
+    async def close(self):
+        self.closing = True
+        for gateway in self.gateways:
+            if gateway.keepalive_task is not None:
+                gateway.keepalive_task.cancel()
+            if gateway.ws is not None:
+                try:
+                    await gateway.flush()
+                    await gateway.ws.close()
+                except websockets.ConnectionClosed:
+                    pass
+        await asyncio.gather(*(g.reader_task for g in self.gateways if g.reader_task is not None))
+
+    async def add_users(self, usernames):
+        """Crée les utilisateurs (répartis entre les connexions), une déclaration par connexion"""
+        added = {}
+        for username in usernames:
+            if username in self.users:
+                continue
+            gateway = self.gateways[len(self.users) % len(self.gateways)]
+            user = VirtualUser(gateway, username, self.inbox_size)
+            gateway.users[username] = user
+            self.users[username] = user
+            added.setdefault(gateway, []).append(username)
+        await asyncio.gather(*(gateway.declare(names) for gateway, names in added.items()))
+        return [self.users[username] for username in usernames]
+
+    async def add_user(self, username):
+        return (await self.add_users([username]))[0]
+
+    async def remove_user(self, username):
+        user = self.users.pop(username, None)
+        if user is None:
+            return
+        del user.gateway.users[username]
+        if user.gateway.opened.is_set():
+            disconnect_msg = Message(MessageType.SYS_MESSAGE, emitter=username, receiver="", value="Disconnect")
+            await user.gateway.send(disconnect_msg)
+
+    def user(self, username):
+        return self.users[username]
+
+    def report(self):
+        return {
+            'users': len(self.users),
+            'connections': len(self.gateways),
+            'received': self.stats['received'],
+            'reconnects': self.stats['reconnects'],
+            'dropped': sum(user.dropped for user in self.users.values()),
+        }
+
+
+async def _demo(count, connections):
+    # Capteurs simulés : chacun publie une mesure, puis on lit ce qu'ils ont reçu
+    async with BotHost(Context.load(default="prod"), connections=connections) as host:
+        users = await host.add_users([f"capteur_{i}" for i in range(count)])
+        for i, user in enumerate(users):
+            await user.send_sensor("temp", 20 + i % 10, "SERVER")
+        await users[0].send("bonjour de la passerelle", "ALL")
+        await asyncio.sleep(1)
+        print(host.report())
+
+
+if __name__ == "__main__":
+    import sys
+    asyncio.run(_demo(int(sys.argv[1]) if len(sys.argv) > 1 else 1000, int(sys.argv[2]) if len(sys.argv) > 2 else 1))
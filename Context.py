@@ -1,15 +1,183 @@
+import json
+import os
+import socket
+
+
 class Context:
-    def __init__(self, host, port):
+    # Réglages transport ; None = valeur par défaut du système / de la bibliothèque
+    TUNING_DEFAULTS = {
+        'tcp_nodelay': False,
+        'sndbuf': None,            # SO_SNDBUF (octets)
+        'rcvbuf': None,            # SO_RCVBUF (octets)
+        'backlog': 5,              # file d'attente listen() (défaut de socketserver)
+        'max_connections': None,   # connexions simultanées acceptées par le serveur
+        'read_chunk_size': None,   # taille du tampon de lecture côté serveur (octets)
+        # Seuils de délestage (voir Overload.py)
+        'overload_inflight': 64,       # messages en cours de traitement simultanément
+        'overload_latency_ms': 50,     # latence moyenne de traitement d'un message
+        'overload_connections': None,  # connexions simultanées
+        # Reprise de session (voir Session.py)
+        'session_buffer': 256,  # messages gardés par session pour le rejeu
+        'session_buffer_mb': 8,  # ... dans la limite de ce volume de JSON (médias compris)
+        'session_ttl': 30,      # secondes de grâce avant de considérer un client parti
+        # Reconnexion automatique des clients (voir WSClient.mark_closed)
+        'reconnect_base_ms': 500,     # premier délai, doublé à chaque échec
+        'reconnect_max_ms': 30000,    # plafond du délai
+        'outbound_buffer': 100,       # messages gardés pendant une coupure, les plus anciens sont perdus
+        # Regroupement des envois en trames BATCH (voir Batcher.py) ; None = un message par trame
+        'batch_window_ms': None,
+        'batch_max_messages': 50,
+        'batch_max_bytes': 64 * 1024,
+        # Accusés de réception cumulés (plus haut seq reçu), au plus un par intervalle
+        'ack_interval_ms': 200,
+        # Vivacité des clients asyncio : SYS PING au serveur, connexion fermée sans PONG dans l'intervalle
+        'keepalive_ms': 20000,
+        # Cache des médias reçus (voir MediaCache.py)
+        'media_cache_mb': 64,
+        'media_cache_disk_mb': 512,
+        'media_dedup_min_bytes': 64 * 1024,  # en dessous, le média est envoyé sans demander au serveur
+        'attach_buffer_mb': 16,  # pièces jointes lues et encodées une seule fois en mémoire (voir EncodedMedia)
+        # Aperçus des images côté serveur (voir Preview.py, nécessite Pillow), sur demande :
+        # threads du pool, None ou 0 = désactivé (images routées telles quelles)
+        'preview_workers': None,
+        'preview_width': 250,
+        'preview_min_bytes': 64 * 1024,  # en dessous, l'image est routée telle quelle
+        'media_store_mb': 128,           # originaux gardés par le serveur pour MEDIA_FETCH (mémoire)
+        'media_store_disk_mb': 1024,     # ... et sur disque
+        # Point HTTP des médias (voir MediaHTTP.py), sur demande (WS_MEDIA_HTTP=1) : un port de plus ouvert ;
+        # port None = choisi par le système, annoncé dans SESSION
+        'media_http': False,
+        'media_http_port': None,
+        'media_http_min_bytes': 1024 * 1024,  # au-delà, les clients passent par HTTP et n'envoient qu'une référence
+    }
+
+    # Profils prêts à l'emploi, comparés avec `python -m bench.load --profile ...`
+    PROFILES = {
+        'default': {},
+        'low_latency': {
+            'tcp_nodelay': True,
+            'sndbuf': 64 * 1024,
+            'rcvbuf': 64 * 1024,
+            'backlog': 128,
+            'read_chunk_size': 4 * 1024,
+        },
+        'high_throughput': {
+            'tcp_nodelay': False,
+            'sndbuf': 4 * 1024 * 1024,
+            'rcvbuf': 4 * 1024 * 1024,
+            'backlog': 1024,
+            'read_chunk_size': 256 * 1024,
+        },
+    }
+
+    # Réglages où 0 veut dire désactivé (comme None), plutôt qu'une valeur refusée
+    ZERO_DISABLES = ('batch_window_ms', 'preview_workers', 'keepalive_ms')
+
+    # Variables d'environnement reconnues par Context.load()
+    ENV_PREFIX = "WS_"
+
+    def __init__(self, host, port, profile="default", **tuning):
         self.host = host
         self.port = port
+        self.profile = profile
+        if profile not in self.PROFILES:
+            raise ValueError(f"Profil inconnu: {profile} (disponibles: {', '.join(self.PROFILES)})")
+        values = dict(self.TUNING_DEFAULTS)
+        values.update(self.PROFILES[profile])
+        values.update(tuning)
+        for key, value in values.items():
+            if key not in self.TUNING_DEFAULTS:
+                raise ValueError(f"Réglage inconnu: {key}")
+            setattr(self, key, self._validate(key, value))
+
+    @classmethod
+    def _validate(cls, key, value):
+        if isinstance(cls.TUNING_DEFAULTS[key], bool):
+            if isinstance(value, str):
+                return value.strip().lower() in ("1", "true", "yes", "on")
+            return bool(value)
+        if value is None or value == "":
+            return None
+        value = int(value)
+        if value == 0 and key in cls.ZERO_DISABLES:
+            return None
+        if value <= 0:
+            raise ValueError(f"{key} doit être strictement positif (reçu {value})")
+        return value
 
     def url(self):
         return f"ws://{self.host}:{self.port}"
 
+    def tuning(self):
+        return {key: getattr(self, key) for key in self.TUNING_DEFAULTS}
+
+    def to_dict(self):
+        return dict(self.tuning(), host=self.host, port=self.port, profile=self.profile)
+
+    def with_profile(self, profile, **tuning):
+        return Context(self.host, self.port, profile, **tuning)
+
+    def socket_options(self):
+        """Options (niveau, option, valeur) à appliquer sur une socket, client ou serveur"""
+        options = []
+        if self.tcp_nodelay:
+            options.append((socket.IPPROTO_TCP, socket.TCP_NODELAY, 1))
+        if self.sndbuf:
+            options.append((socket.SOL_SOCKET, socket.SO_SNDBUF, self.sndbuf))
+        if self.rcvbuf:
+            options.append((socket.SOL_SOCKET, socket.SO_RCVBUF, self.rcvbuf))
+        return options
+
+    def apply_socket_options(self, sock):
+        for level, option, value in self.socket_options():
+            try:
+                sock.setsockopt(level, option, value)
+            except OSError as e:
+                print(f"[warning] option socket {option} ignorée: {e}")
+
+    @staticmethod
+    def dev(profile="default"):
+        return Context("127.0.0.1", 8000, profile)
+
+    @staticmethod
+    def prod(profile="default"):
+        return Context("192.168.4.230", 9000, profile)
+
+    @staticmethod
+    def read_file(path):
+        """Contenu d'un fichier JSON : {"host", "port", "profile", <réglages>...}"""
+        with open(path) as f:
+            return json.load(f)
+
     @staticmethod
-    def dev():
-        return Context("127.0.0.1", 8000)
+    def from_file(path, base=None):
+        """Charge un fichier JSON : {"host", "port", "profile", <réglages>...}"""
+        data = Context.read_file(path)
+        base = base or Context.dev()
+        host = data.pop('host', base.host)
+        port = int(data.pop('port', base.port))
+        profile = data.pop('profile', base.profile)
+        return Context(host, port, profile, **data)
 
     @staticmethod
-    def prod():
-        return Context("192.168.4.230", 9000)
\ No newline at end of file
+    def load(path=None, default="dev"):
+        """dev()/prod(), puis le fichier (`path` ou $WS_CONFIG), puis les variables WS_*.
+
+        Les réglages sont appliqués dans cet ordre : valeurs par défaut, profil retenu
+        (celui de WS_PROFILE s'il est donné), réglages explicites du fichier, variables WS_*.
+        """
+        base = Context.prod() if default == "prod" else Context.dev()
+        path = path or os.environ.get(Context.ENV_PREFIX + "CONFIG")
+        tuning = Context.read_file(path) if path else {}
+        host = tuning.pop('host', base.host)
+        port = tuning.pop('port', base.port)
+        profile = tuning.pop('profile', base.profile)
+
+        env = lambda name: os.environ.get(Context.ENV_PREFIX + name.upper())
+        host = env('host') or host
+        port = int(env('port') or port)
+        profile = env('profile') or profile
+        for key in Context.TUNING_DEFAULTS:
+            if env(key) is not None:
+                tuning[key] = env(key)
+        return Context(host, port, profile, **tuning)
@@ -0,0 +1,244 @@
+import base64
+import hashlib
+import os
+import tempfile
+import threading
+from collections import OrderedDict
+
+
+class EncodedMedia:
+    """Fichier média lu et encodé en base64 une seule fois.
+
+    Porte à la fois la valeur du message (`prefix:<base64>`), son empreinte MediaCache
+    et les octets bruts : l'envoi et l'aperçu local partagent la même lecture.
+    """
+
+    def __init__(self, prefix, key, encoded, data):
+        self.prefix = prefix
+        self.key = key
+        self.encoded = encoded  # base64 (str)
+        self.data = data        # octets bruts
+
+    def value(self):
+        return f"{self.prefix}:{self.encoded}"
+
+    @staticmethod
+    def from_file(path, prefix, progress=None, chunk_size=3 * 64 * 1024):
+        """Lit `path` par blocs ; `progress(octets lus, taille)` est appelé après chaque bloc"""
+        size = os.path.getsize(path)
+        digest = hashlib.sha256((prefix + ":").encode("ascii"))
+        blocks, parts = [], []
+        done = 0
+        with open(path, "rb") as f:
+            while True:
+                block = f.read(chunk_size)
+                if not block:
+                    break
+                encoded = base64.b64encode(block)
+                digest.update(encoded)
+                blocks.append(block)
+                parts.append(encoded)
+                done += len(block)
+                if progress:
+                    progress(done, size)
+        return EncodedMedia(prefix, digest.hexdigest(), b"".join(parts).decode("ascii"), b"".join(blocks))
+
+
+class MediaCache:
+    """Cache des médias reçus, en mémoire puis sur disque, indexé par empreinte.
+
+    L'empreinte est le sha256 de la valeur du message ("IMG:<base64>", "AUDIO:..."):
+    l'émetteur la calcule en lisant son fichier par blocs, le récepteur et le serveur
+    directement sur la valeur reçue. Chaque niveau a son budget en octets et évince les entrées
+    les moins récemment utilisées. Un média n'est donc décodé et écrit sur disque
+    qu'une seule fois, les lectures audio / vidéo se font depuis le fichier du cache.
+    """
+
+    DEFAULT_DIR = os.path.join(os.path.expanduser("~"), ".cache", "WebSocketPython", "media")
+
+    def __init__(self, memory_budget=64 * 1024 * 1024, disk_budget=512 * 1024 * 1024, directory=None):
+        self.memory_budget = memory_budget
+        self.disk_budget = disk_budget
+        self.directory = directory or self.DEFAULT_DIR
+        self.memory = OrderedDict()  # empreinte -> octets décodés
+        self.memory_size = 0
+        self.disk = OrderedDict()    # empreinte -> taille du fichier
+        self.disk_size = 0
+        self.lock = threading.Lock()
+        self.stats = {'hits': 0, 'disk_hits': 0, 'misses': 0, 'decodes': 0}
+        self._load_disk_index()
+
+    @staticmethod
+    def from_context(ctx, directory=None):
+        return MediaCache(ctx.media_cache_mb * 1024 * 1024, ctx.media_cache_disk_mb * 1024 * 1024, directory)
+
+    def _load_disk_index(self):
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            entries = []
+            for name in os.listdir(self.directory):
+                path = os.path.join(self.directory, name)
+                if len(name) == 64 and os.path.isfile(path):
+                    stat = os.stat(path)
+                    entries.append((stat.st_mtime, name, stat.st_size))
+        except OSError as e:
+            print(f"[warning] cache média sur disque indisponible: {e}")
+            self.disk_budget = 0
+            return
+        # Du plus ancien au plus récent, comme l'ordre LRU
+        for _, name, size in sorted(entries):
+            self.disk[name] = size
+            self.disk_size += size
+        self._evict_disk()
+
+    @staticmethod
+    def key(value):
+        """Empreinte d'un média à partir de la valeur du message ("IMG:<base64>")"""
+        if isinstance(value, str):
+            value = value.encode("ascii")
+        return hashlib.sha256(value).hexdigest()
+
+    @staticmethod
+    def key_for_file(path, prefix, chunk_size=3 * 64 * 1024, progress=None):
+        """Même empreinte que key(f"{prefix}:<base64>"), calculée en lisant le fichier par blocs"""
+        size = os.path.getsize(path) if progress else 0
+        digest = hashlib.sha256((prefix + ":").encode("ascii"))
+        done = 0
+        with open(path, "rb") as f:
+            while True:
+                block = f.read(chunk_size)
+                if not block:
+                    break
+                digest.update(base64.b64encode(block))
+                done += len(block)
+                if progress:
+                    progress(done, size)
+        return digest.hexdigest()
+
+    def path(self, key):
+        return os.path.join(self.directory, key)
+
+    def __contains__(self, key):
+        with self.lock:
+            return key in self.memory or key in self.disk
+
+    def get(self, key):
+        """Octets décodés du média, ou None"""
+        with self.lock:
+            data = self.memory.get(key)
+            if data is not None:
+                self.memory.move_to_end(key)
+                self.stats['hits'] += 1
+                return data
+            on_disk = key in self.disk
+        if not on_disk:
+            with self.lock:
+                self.stats['misses'] += 1
+            return None
+        try:
+            with open(self.path(key), "rb") as f:
+                data = f.read()
+        except OSError:
+            with self.lock:
+                self._forget_disk(key)
+                self.stats['misses'] += 1
+            return None
+        with self.lock:
+            self.stats['disk_hits'] += 1
+            self.disk.move_to_end(key)
+            self._put_memory(key, data)
+        return data
+
+    def file_for(self, key):
+        """Chemin du fichier en cache (lecture audio / vidéo sans copie), ou None"""
+        with self.lock:
+            if key in self.disk:
+                self.disk.move_to_end(key)
+                return self.path(key)
+            data = self.memory.get(key)
+        if data is None:
+            return None
+        return self._write_disk(key, data)
+
+    def put_data(self, key, data):
+        """Met en cache (mémoire) un média dont on a déjà les octets et l'empreinte, sans décodage"""
+        with self.lock:
+            self._put_memory(key, data)
+
+    def put_value(self, value, key=None):
+        """Décode et met en cache un média reçu ("IMG:<base64>") ; retourne son empreinte"""
+        key = key or self.key(value)
+        with self.lock:
+            known = key in self.memory or key in self.disk
+        if not known:
+            data = base64.b64decode(value.partition(":")[2])
+            with self.lock:
+                self.stats['decodes'] += 1
+                self._put_memory(key, data)
+            self._write_disk(key, data)
+        return key
+
+    def adopt_file(self, key, tmp_path):
+        """Range dans le cache disque un fichier complet déjà écrit dans son répertoire
+        (envoi ou téléchargement HTTP, voir MediaHTTP) ; retourne son chemin, ou None"""
+        size = os.path.getsize(tmp_path)
+        if size > self.disk_budget:
+            os.remove(tmp_path)
+            return None
+        path = self.path(key)
+        os.replace(tmp_path, path)
+        with self.lock:
+            if key in self.disk:
+                self.disk_size -= self.disk[key]
+            self.disk[key] = size
+            self.disk_size += size
+            self.disk.move_to_end(key)
+            self._evict_disk()
+        return path
+
+    def _put_memory(self, key, data):
+        if len(data) > self.memory_budget:
+            return
+        if key in self.memory:
+            self.memory.move_to_end(key)
+            return
+        self.memory[key] = data
+        self.memory_size += len(data)
+        while self.memory_size > self.memory_budget:
+            _, evicted = self.memory.popitem(last=False)
+            self.memory_size -= len(evicted)
+
+    def _write_disk(self, key, data):
+        if len(data) > self.disk_budget:
+            return None
+        path = self.path(key)
+        try:
+            # Écriture atomique : un autre client peut partager le même répertoire
+            fd, tmp = tempfile.mkstemp(dir=self.directory)
+            with os.fdopen(fd, "wb") as f:
+                f.write(data)
+            os.replace(tmp, path)
+        except OSError as e:
+            print(f"[warning] écriture du cache média impossible: {e}")
+            return None
+        with self.lock:
+            if key not in self.disk:
+                self.disk[key] = len(data)
+                self.disk_size += len(data)
+            self.disk.move_to_end(key)
+            self._evict_disk()
+        return path
+
+    def _evict_disk(self):
+        while self.disk_size > self.disk_budget and self.disk:
+            key = next(iter(self.disk))
+            self._forget_disk(key)
+            try:
+                os.remove(self.path(key))
+            except OSError:
+                pass
+
+    def _forget_disk(self, key):
+        size = self.disk.pop(key, None)
+        if size is not None:
+            self.disk_size -= size
@@ -0,0 +1,251 @@
+import base64
+import hashlib
+import http.client
+import mmap
+import os
+import re
+import tempfile
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+# Multiple de 3 : l'empreinte (sha256 du base64) se calcule bloc par bloc, comme MediaCache.key_for_file
+CHUNK_SIZE = 3 * 64 * 1024
+
+
+def media_url(host, port, key):
+    return f"http://{host}:{port}/media/{key}"
+
+
+def parse_range(header, size):
+    """(début, fin incluse) d'un en-tête "Range: bytes=..." ; None si hors du fichier,
+    (0, size - 1) si l'en-tête est ignoré (plusieurs intervalles, syntaxe inconnue)"""
+    match = re.fullmatch(r"bytes=(\d*)-(\d*)", header.strip())
+    if not match or match.groups() == ("", ""):
+        return 0, size - 1
+    first, last = match.groups()
+    if first == "":
+        # bytes=-N : les N derniers octets
+        length = int(last)
+        if length == 0:
+            return None
+        return max(0, size - length), size - 1
+    start = int(first)
+    end = min(int(last), size - 1) if last else size - 1
+    if start >= size or end < start:
+        return None
+    return start, end
+
+
+class MediaRequestHandler(BaseHTTPRequestHandler):
+    """GET / HEAD /media/<empreinte> (en-tête Range accepté) et PUT /media/<empreinte>?prefix=VIDEO"""
+
+    protocol_version = "HTTP/1.1"
+    KEY_PATH = re.compile(r"/media/([0-9a-f]{64})")
+
+    def log_message(self, format, *args):
+        pass
+
+    def media_key(self):
+        match = self.KEY_PATH.fullmatch(urlsplit(self.path).path)
+        if match is None:
+            self.send_error(404)
+            return None
+        return match.group(1)
+
+    def do_HEAD(self):
+        self.serve(head=True)
+
+    def do_GET(self):
+        self.serve()
+
+    def serve(self, head=False):
+        key = self.media_key()
+        if key is None:
+            return
+        path = self.server.store.file_for(key)
+        try:
+            media = open(path, "rb") if path else None
+        except OSError:
+            media = None
+        if media is None:
+            self.send_error(404)
+            return
+        with media:
+            size = os.fstat(media.fileno()).st_size
+            start, end = 0, size - 1
+            header = self.headers.get("Range")
+            if header and size:
+                interval = parse_range(header, size)
+                if interval is None:
+                    self.send_response(416)
+                    self.send_header("Content-Range", f"bytes */{size}")
+                    self.send_header("Content-Length", "0")
+                    self.end_headers()
+                    return
+                start, end = interval
+            partial = (start, end) != (0, size - 1)
+            length = end - start + 1
+            self.send_response(206 if partial else 200)
+            self.send_header("Content-Type", "application/octet-stream")
+            self.send_header("Accept-Ranges", "bytes")
+            self.send_header("Content-Length", str(length))
+            if partial:
+                self.send_header("Content-Range", f"bytes {start}-{end}/{size}")
+            self.end_headers()
+            if head:
+                return
+            if length > 0:
+                self.send_body(media, start, length)
+            self.server.stats['partial' if partial else 'full'] += 1
+            self.server.stats['sent_bytes'] += length
+
+    def send_body(self, media, offset, length):
+        self.wfile.flush()
+        if hasattr(os, "sendfile"):
+            # os.sendfile : du cache de pages du noyau à la socket, sans copie par Python
+            self.connection.sendfile(media, offset, length)
+            return
+        # Sans sendfile : le fichier projeté en mémoire part par tranches de la projection
+        with mmap.mmap(media.fileno(), 0, access=mmap.ACCESS_READ) as mapped, memoryview(mapped) as view, \
+                view[offset:offset + length] as part:
+            self.connection.sendall(part)
+
+    def do_PUT(self):
+        key = self.media_key()
+        if key is None:
+            return
+        token = self.headers.get("Authorization", "")
+        if not token.startswith("Bearer ") or not self.server.authorize(token[7:]):
+            self.send_error(403)
+            return
+        prefix = parse_qs(urlsplit(self.path).query).get("prefix", [""])[0]
+        length = self.headers.get("Content-Length")
+        if not prefix.isalpha() or length is None or not length.isdigit():
+            self.send_error(400)
+            return
+        length = int(length)
+        store = self.server.store
+        if length > store.disk_budget:
+            self.send_error(413)
+            return
+        if key in store:
+            # Déjà reçu : le corps n'est pas lu, la connexion est fermée
+            self.close_connection = True
+            self.send_response(200)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+
+        digest = hashlib.sha256((prefix + ":").encode("ascii"))
+        fd, tmp = tempfile.mkstemp(dir=store.directory)
+        remaining = length
+        with os.fdopen(fd, "wb") as out:
+            while remaining:
+                block = self.rfile.read(min(CHUNK_SIZE, remaining))
+                if not block:
+                    break
+                digest.update(base64.b64encode(block))
+                out.write(block)
+                remaining -= len(block)
+        # L'empreinte est vérifiée : personne ne peut déposer un autre contenu sous une empreinte donnée
+        if remaining or digest.hexdigest() != key:
+            os.remove(tmp)
+            self.close_connection = True
+            self.send_error(400, "empreinte invalide")
+            return
+        store.adopt_file(key, tmp)
+        self.server.stats['uploads'] += 1
+        self.send_response(201)
+        self.send_header("Content-Length", "0")
+        self.end_headers()
+
+
+class MediaHTTPServer(ThreadingHTTPServer):
+    """Point HTTP local des médias du serveur, hors du canal WebSocket.
+
+    Les fichiers du cache disque de WSServer (MediaCache) sont servis par empreinte, avec
+    l'en-tête Range : un lecteur vidéo commence à lire avant la fin du téléchargement et
+    un client reprend un téléchargement interrompu. Les envois (PUT) sont réservés aux
+    clients qui ont une session (`authorize(jeton)`), et leur empreinte est vérifiée.
+    """
+
+    daemon_threads = True
+
+    def __init__(self, host, port, store, authorize):
+        super().__init__((host, port or 0), MediaRequestHandler)
+        self.store = store
+        self.authorize = authorize
+        self.stats = {'full': 0, 'partial': 0, 'sent_bytes': 0, 'uploads': 0}
+        self.thread = None
+
+    @property
+    def port(self):
+        return self.server_address[1]
+
+    def start(self):
+        self.thread = threading.Thread(target=self.serve_forever, daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        if self.thread is not None:
+            self.shutdown()
+        self.server_close()
+
+
+def upload(host, port, key, prefix, path, token, timeout=30):
+    """Dépose `path` sur le point HTTP du serveur (sauf s'il l'a déjà) ; True si le serveur l'a"""
+    conn = http.client.HTTPConnection(host, port, timeout=timeout)
+    try:
+        conn.request("HEAD", f"/media/{key}")
+        response = conn.getresponse()
+        response.read()
+        if response.status == 200:
+            return True
+        with open(path, "rb") as media:
+            size = os.fstat(media.fileno()).st_size
+            conn.putrequest("PUT", f"/media/{key}?prefix={prefix}")
+            conn.putheader("Content-Length", str(size))
+            conn.putheader("Authorization", f"Bearer {token}")
+            conn.endheaders()
+            # Le fichier part directement sur la socket (os.sendfile quand il existe)
+            conn.sock.sendfile(media)
+        response = conn.getresponse()
+        response.read()
+        return response.status in (200, 201)
+    finally:
+        conn.close()
+
+
+def download(url, path, progress=None, timeout=30):
+    """Télécharge `url` dans `path` ; un `path` partiel est complété (Range) plutôt que recommencé"""
+    done = os.path.getsize(path) if os.path.exists(path) else 0
+    parts = urlsplit(url)
+    conn = http.client.HTTPConnection(parts.hostname, parts.port, timeout=timeout)
+    try:
+        conn.request("GET", parts.path, headers={"Range": f"bytes={done}-"} if done else {})
+        response = conn.getresponse()
+        if response.status == 416 and done:
+            # Partiel plus long que le média : on repart de zéro
+            response.read()
+            os.remove(path)
+            return download(url, path, progress, timeout)
+        if response.status not in (200, 206):
+            raise OSError(f"HTTP {response.status} pour {url}")
+        if response.status == 200:
+            done = 0
+        total = done + int(response.getheader("Content-Length"))
+        with open(path, "ab" if done else "wb") as out:
+            while True:
+                block = response.read(CHUNK_SIZE)
+                if not block:
+                    break
+                out.write(block)
+                done += len(block)
+                if progress:
+                    progress(done, total)
+        if done != total:
+            raise OSError(f"téléchargement incomplet ({done}/{total} octets)")
+    finally:
+        conn.close()
+    return path
@@ -0,0 +1,77 @@
+import base64
+import json
+import os
+import struct
+
+from websocket import ABNF
+
+
+class MediaStream:
+    """Envoi d'un fichier média sans le charger en mémoire.
+
+    Le message JSON est écrit dans une seule trame texte dont la longueur est connue
+    d'avance (taille base64 calculée depuis la taille du fichier) : le fichier est lu
+    par blocs, chaque bloc est encodé en base64 puis masqué et écrit directement sur
+    la socket. La mémoire utilisée ne dépend que de `chunk_size`, pas du fichier.
+    WSServer reçoit un message identique à celui de Message.to_json().
+    """
+
+    # Multiple de 3 : chaque bloc s'encode en base64 sans remplissage intermédiaire
+    CHUNK_SIZE = 3 * 64 * 1024
+
+    def __init__(self, path, message, prefix, chunk_size=CHUNK_SIZE):
+        """`message` est le Message à envoyer, sa valeur est remplacée par `prefix:<fichier en base64>`"""
+        if chunk_size % 3:
+            raise ValueError("chunk_size doit être un multiple de 3")
+        self.path = path
+        self.chunk_size = chunk_size
+        self.size = os.path.getsize(path)
+
+        # Enveloppe JSON autour de la valeur ; le base64 n'a aucun caractère à échapper
+        marker = "\x00MEDIA\x00"
+        saved, message.value = message.value, marker
+        head, tail = message.to_json().split(json.dumps(marker))
+        message.value = saved
+        self.head = (head + '"' + prefix + ":").encode("utf-8")
+        self.tail = ('"' + tail).encode("utf-8")
+
+    @staticmethod
+    def encoded_size(size):
+        return 4 * ((size + 2) // 3)
+
+    def payload_length(self):
+        return len(self.head) + self.encoded_size(self.size) + len(self.tail)
+
+    def header(self, mask_key):
+        """En-tête de trame texte (FIN, masquée) pour la longueur totale"""
+        length = self.payload_length()
+        first = bytes([0x80 | ABNF.OPCODE_TEXT])
+        if length < 126:
+            return first + bytes([0x80 | length]) + mask_key
+        if length < 1 << 16:
+            return first + bytes([0x80 | 126]) + struct.pack("!H", length) + mask_key
+        return first + bytes([0x80 | 127]) + struct.pack("!Q", length) + mask_key
+
+    def chunks(self):
+        """Morceaux du contenu de la trame (non masqués)"""
+        yield self.head
+        with open(self.path, "rb") as f:
+            while True:
+                block = f.read(self.chunk_size)
+                if not block:
+                    break
+                yield base64.b64encode(block)
+        yield self.tail
+
+    def send(self, ws):
+        """Écrit la trame sur `ws` (websocket.WebSocket), sous son verrou d'envoi"""
+        mask_key = os.urandom(4)
+        with ws.lock:
+            ws.sock.sendall(self.header(mask_key))
+            offset = 0
+            for chunk in self.chunks():
+                # La clé tourne avec la position du morceau dans la trame
+                shift = offset % 4
+                ws.sock.sendall(ABNF.mask(mask_key[shift:] + mask_key[:shift], chunk))
+                offset += len(chunk)
+        return offset
@@ -21,6 +21,11 @@ class ADMIN_TYPE:
     CLIENT_CONNECTED = "ADMIN_CLIENT_CONNECTED"
     CLIENT_DISCONNECTED = "ADMIN_CLIENT_DISCONNECTED"
     CLIENT_LIST_FULL = "ADMIN_CLIENT_LIST_FULL"
+    STATS = "ADMIN_STATS"
+    PROFILE_START = "ADMIN_PROFILE_START"
+    PROFILE_STOP = "ADMIN_PROFILE_STOP"
+    PROFILE_RESULT = "ADMIN_PROFILE_RESULT"
+    OVERLOAD = "ADMIN_OVERLOAD"
 
 class SensorId:
     LIGHT = "LIGHT"
@@ -31,6 +36,12 @@ class SensorId:
 
 class MessageType:
     DECLARATION = "DECLARATION"
+    SESSION = "SESSION"
+    RESUME = "RESUME"
+    BATCH = "BATCH"
+    MEDIA_QUERY = "MEDIA_QUERY"
+    MEDIA_FETCH = "MEDIA_FETCH"
+    ACK = "ACK"
     ENVOI = ENVOI_TYPE
     RECEPTION = RECEPTION_TYPE
     WARNING = "WARNING"
@@ -38,12 +49,14 @@ class MessageType:
     ADMIN = ADMIN_TYPE
 
 class Message:
-    def __init__(self, message_type: MessageType, value, emitter, receiver=None, sensor_id=None):
+    def __init__(self, message_type: MessageType, value, emitter, receiver=None, sensor_id=None, seq=None, ack=None):
         self.message_type = message_type
         self.value = value
         self.emitter = emitter
         self.receiver = receiver
         self.sensor_id = sensor_id
+        self.seq = seq
+        self.ack = ack  # accusé cumulé joint à un envoi du client (plus haut seq reçu)
 
     @staticmethod
     def default_message():
@@ -77,21 +90,125 @@ class Message:
     def ping():
         return Message(MessageType.SYS_MESSAGE, "ping", "SERVER", "")
 
+    @staticmethod
+    def reconnect(delay_ms):
+        """Demande au client de se reconnecter après `delay_ms` (drain / restart du serveur)"""
+        return Message(MessageType.SYS_MESSAGE, f"RECONNECT:{delay_ms}", "SERVER", "")
+
+    @staticmethod
+    def ack(seq, delivered=True):
+        """Accusé du serveur pour un ENVOI numéroté par le client (NACK : destinataire introuvable)"""
+        return Message(MessageType.SYS_MESSAGE, f"{'ACK' if delivered else 'NACK'}:{seq}", "SERVER", "")
+
+    @staticmethod
+    def cumulative_ack(emitter, seq):
+        """Accusé cumulé du client : tous les messages jusqu'à `seq` ont été reçus"""
+        return Message(MessageType.ACK, seq, emitter, "SERVER")
+
+    @staticmethod
+    def session(receiver, token, seq, resumed=False, media_port=None):
+        """Jeton de reprise envoyé au client (après DECLARATION ou RESUME), avec le port du point HTTP des médias"""
+        value = {'token': token, 'seq': seq, 'resumed': resumed}
+        if media_port is not None:
+            value['media_port'] = media_port
+        return Message(MessageType.SESSION, value, "SERVER", receiver)
+
+    @staticmethod
+    def resume(emitter, token, last_seq):
+        """Reprise de session à la place d'une nouvelle DECLARATION"""
+        return Message(MessageType.RESUME, {'token': token, 'last_seq': last_seq}, emitter, "SERVER")
+
+    @staticmethod
+    def gateway(emitter, users):
+        """DECLARATION d'une passerelle : tous les utilisateurs virtuels qu'elle porte (voir BotHost)"""
+        return Message(MessageType.DECLARATION, {'users': list(users)}, emitter, "SERVER")
+
+    @staticmethod
+    def media_query(emitter, key, receiver):
+        """Demande au serveur si `receiver` a déjà le média d'empreinte `key` (voir MediaCache)"""
+        return Message(MessageType.MEDIA_QUERY, key, emitter, receiver)
+
+    @staticmethod
+    def media_ref(prefix, key):
+        """Valeur d'un média déjà connu du destinataire : IMG#<empreinte> au lieu de IMG:<base64>"""
+        return f"{prefix}#{key}"
+
+    @staticmethod
+    def parse_media_ref(value):
+        """(préfixe, empreinte) si la valeur est une référence de média, sinon None"""
+        if isinstance(value, str) and len(value) <= 80:
+            prefix, sep, key = value.partition("#")
+            if sep and len(key) == 64 and ":" not in prefix:
+                return prefix, key
+        return None
+
+    @staticmethod
+    def media_preview(prefix, key, preview):
+        """Aperçu d'un média gardé par le serveur : IMG#<empreinte>:<base64 de l'aperçu>.
+        L'original se demande par MEDIA_FETCH ; un ancien client affiche l'aperçu comme un IMG:<base64>"""
+        return f"{prefix}#{key}:{preview}"
+
+    @staticmethod
+    def parse_media_preview(value):
+        """(préfixe, empreinte, aperçu base64) si la valeur est un aperçu, sinon None"""
+        if isinstance(value, str):
+            head = value[:80]
+            prefix, sep, rest = head.partition("#")
+            if sep and ":" not in prefix and len(rest) > 65 and rest[64] == ":":
+                return prefix, rest[:64], value[len(prefix) + 66:]
+        return None
+
+    @staticmethod
+    def media_link(prefix, key):
+        """Média déposé sur le point HTTP du serveur (voir MediaHTTP) : VIDEO@<empreinte>"""
+        return f"{prefix}@{key}"
+
+    @staticmethod
+    def parse_media_link(value):
+        """(préfixe, empreinte) si la valeur est un lien vers le point HTTP des médias, sinon None"""
+        if isinstance(value, str) and len(value) <= 80:
+            prefix, sep, key = value.partition("@")
+            if sep and len(key) == 64 and prefix.isalpha():
+                return prefix, key
+        return None
+
+    @staticmethod
+    def media_fetch(emitter, key):
+        """Demande au serveur l'original d'un média reçu en aperçu"""
+        return Message(MessageType.MEDIA_FETCH, key, emitter, "SERVER")
+
     @staticmethod
     def sensor(emitter, sensor_id, value, receiver):
         return Message(MessageType.ENVOI.SENSOR, value, emitter, receiver, sensor_id)
 
+    @staticmethod
+    def batch(emitter, messages):
+        """Enveloppe plusieurs messages dans une seule trame (un seul document JSON)"""
+        return Message(MessageType.BATCH, [m.to_dict() for m in messages], emitter, "SERVER")
+
+    def unpack(self):
+        """Messages contenus dans un BATCH"""
+        return [Message.from_dict(data) for data in self.value]
+
     @staticmethod
     def from_json(json_data):
-        data = json.loads(json_data)
+        return Message.from_dict(json.loads(json_data))
+
+    @staticmethod
+    def from_dict(data):
         message_type = data['message_type']
         emitter = data['data']['emitter']
         receiver = data['data'].get('receiver', None)
         value = data['data']['value']
         sensor_id = data['data'].get('sensor_id', None)
-        return Message(message_type, value, emitter, receiver, sensor_id)
+        seq = data['data'].get('seq', None)
+        ack = data['data'].get('ack', None)
+        return Message(message_type, value, emitter, receiver, sensor_id, seq, ack)
 
     def to_json(self):
+        return json.dumps(self.to_dict())
+
+    def to_dict(self):
         data = {
             'message_type': self.message_type,
             'data': {
@@ -102,5 +219,9 @@ class Message:
         }
         if self.sensor_id:
             data['data']['sensor_id'] = self.sensor_id
+        if self.seq is not None:
+            data['data']['seq'] = self.seq
+        if self.ack is not None:
+            data['data']['ack'] = self.ack
 
-        return json.dumps(data)
\ No newline at end of file
+        return data
\ No newline at end of file
@@ -0,0 +1,171 @@
+import os
+import queue
+import sqlite3
+import threading
+import time
+
+
+class MessageStore:
+    """Historique local des messages du client graphique, dans une base SQLite.
+
+    Chaque message a sa position dans l'historique de son propriétaire (`pos`, de 0 à n-1) :
+    une page se relit par un intervalle sur l'index (owner, pos), sans OFFSET, quelle que
+    soit la taille de l'historique. Un second index (owner, peer, ts) sert aux conversations.
+    Les écritures passent par un thread dédié, regroupées en une transaction par rafale :
+    l'interface n'attend jamais le disque, et relit en mémoire ce qui n'est pas encore écrit.
+    """
+
+    DEFAULT_PATH = os.path.join(os.path.expanduser("~"), ".cache", "WebSocketPython", "history.sqlite3")
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS messages (
+            owner TEXT NOT NULL,
+            pos INTEGER NOT NULL,
+            peer TEXT NOT NULL,
+            ts REAL NOT NULL,
+            sender TEXT NOT NULL,
+            receiver TEXT NOT NULL,
+            content TEXT NOT NULL,
+            timestamp TEXT NOT NULL,
+            msg_type TEXT NOT NULL
+        );
+        CREATE UNIQUE INDEX IF NOT EXISTS messages_owner_pos ON messages (owner, pos);
+        CREATE INDEX IF NOT EXISTS messages_owner_peer_ts ON messages (owner, peer, ts);
+    """
+
+    COLUMNS = "sender, receiver, content, timestamp, msg_type"
+
+    # Messages écrits au plus par transaction
+    WRITE_BATCH = 500
+
+    def __init__(self, path=None):
+        self.path = path or self.DEFAULT_PATH
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        # Lectures depuis le thread qui a créé le store (l'interface), écritures depuis le writer
+        self.db = self._connect()
+        self.db.executescript(self.SCHEMA)
+        self.pending = {}  # (owner, pos) -> valeurs pas encore écrites
+        self.lock = threading.Lock()
+        self.queue = queue.Queue()
+        self.stats = {'written': 0, 'transactions': 0}
+        self.writer = threading.Thread(target=self._write_loop, daemon=True)
+        self.writer.start()
+
+    def _connect(self):
+        db = sqlite3.connect(self.path)
+        # WAL : les lectures de l'interface ne sont pas bloquées par les écritures
+        db.execute("PRAGMA journal_mode=WAL")
+        db.execute("PRAGMA synchronous=NORMAL")
+        return db
+
+    def count(self, owner):
+        """Nombre de messages de `owner`, écrits ou en attente d'écriture"""
+        # En attente lu avant la base : une écriture entre les deux est vue d'un côté ou de l'autre
+        with self.lock:
+            positions = [pos for key_owner, pos in self.pending if key_owner == owner]
+        row = self.db.execute("SELECT MAX(pos) FROM messages WHERE owner = ?", (owner,)).fetchone()
+        return max(positions + [-1 if row[0] is None else row[0]]) + 1
+
+    def append(self, owner, pos, peer, values):
+        """Ajoute un message (sender, receiver, content, timestamp, msg_type) à la position `pos`"""
+        values = tuple(values)
+        with self.lock:
+            self.pending[(owner, pos)] = values
+        self.queue.put(('insert', (owner, pos, peer, time.time()) + values))
+
+    def fetch(self, owner, start, end):
+        """Messages de `owner` aux positions [start, end), dans l'ordre"""
+        with self.lock:
+            pending = {pos: values for (key_owner, pos), values in self.pending.items()
+                       if key_owner == owner and start <= pos < end}
+        cursor = self.db.execute(f"SELECT pos, {self.COLUMNS} FROM messages WHERE owner = ? AND pos >= ? AND pos < ?",
+                                 (owner, start, end))
+        rows = {row[0]: row[1:] for row in cursor}
+        rows.update(pending)
+        return [rows[pos] for pos in sorted(rows)]
+
+    def conversation(self, owner, peer, limit=200, before=None):
+        """Derniers messages échangés avec `peer` ("ALL" pour le salon), avant le timestamp `before`"""
+        query = f"SELECT {self.COLUMNS} FROM messages WHERE owner = ? AND peer = ?"
+        params = [owner, peer]
+        if before is not None:
+            query += " AND ts < ?"
+            params.append(before)
+        query += " ORDER BY ts DESC LIMIT ?"
+        params.append(limit)
+        return self.db.execute(query, params).fetchall()[::-1]
+
+    def delete(self, owner):
+        """Oublie tout l'historique de `owner`"""
+        with self.lock:
+            for key in [key for key in self.pending if key[0] == owner]:
+                del self.pending[key]
+        self.queue.put(('delete', owner))
+
+    def flush(self):
+        """Attend que tout ce qui a été ajouté soit écrit"""
+        self.queue.join()
+
+    def close(self):
+        self.queue.put(None)
+        self.writer.join()
+        self.db.close()
+
+    def _write_loop(self):
+        db = self._connect()
+        while True:
+            item = self.queue.get()
+            batch = [item]
+            # Tout ce qui attend déjà part dans la même transaction
+            while item is not None and len(batch) < self.WRITE_BATCH:
+                try:
+                    item = self.queue.get_nowait()
+                except queue.Empty:
+                    break
+                batch.append(item)
+            try:
+                self._write(db, batch)
+            except sqlite3.Error as e:
+                print(f"[warning] écriture de l'historique impossible: {e}")
+            finally:
+                for _ in batch:
+                    self.queue.task_done()
+            if batch[-1] is None:
+                db.close()
+                return
+
+    def _write(self, db, batch):
+        inserts = []
+        written = []
+        with db:
+            for item in batch:
+                if item is None:
+                    break
+                kind, data = item
+                if kind == 'insert':
+                    inserts.append(data)
+                    continue
+                # Suppression : les insertions qui la précèdent sont écrites avant
+                self._insert(db, inserts)
+                written += inserts
+                inserts = []
+                db.execute("DELETE FROM messages WHERE owner = ?", (data,))
+            self._insert(db, inserts)
+            written += inserts
+        self.stats['transactions'] += 1
+        self.stats['written'] += len(written)
+        # Relus depuis la base une fois la transaction validée, plus depuis la mémoire
+        with self.lock:
+            for data in written:
+                key = (data[0], data[1])
+                # Une position réutilisée après delete() garde sa nouvelle valeur
+                if self.pending.get(key) == data[4:]:
+                    del self.pending[key]
+
+    @staticmethod
+    def _insert(db, inserts):
+        if inserts:
+            db.executemany("INSERT OR REPLACE INTO messages (owner, pos, peer, ts, sender, receiver, content, timestamp, msg_type) "
+                           "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)", inserts)
@@ -0,0 +1,92 @@
+import math
+import threading
+import time
+
+
+class OverloadController:
+    """Calcule un niveau de dégradation à partir de la charge du serveur.
+
+    La pression est le maximum de trois ratios (messages en cours de traitement,
+    latence moyenne de traitement, nombre de connexions) rapportés à leur seuil.
+    Chaque niveau coupe une fonction de plus, les messages de chat et capteurs
+    ne sont jamais délestés.
+    """
+
+    NORMAL = 0
+    SHED_ROUTING_LOGS = 1    # plus de logs de routage vers les admins
+    SHED_PRESENCE = 2        # listes de clients regroupées jusqu'au retour au calme
+    REFUSE_CONNECTIONS = 3   # nouvelles connexions refusées avec un délai de retour
+
+    LEVEL_NAMES = {
+        NORMAL: "NORMAL",
+        SHED_ROUTING_LOGS: "SHED_ROUTING_LOGS",
+        SHED_PRESENCE: "SHED_PRESENCE",
+        REFUSE_CONNECTIONS: "REFUSE_CONNECTIONS",
+    }
+
+    # Pression à partir de laquelle on entre dans chaque niveau
+    ENTER_PRESSURE = {SHED_ROUTING_LOGS: 1.0, SHED_PRESENCE: 1.5, REFUSE_CONNECTIONS: 2.0}
+    # Hystérésis : on ne redescend que sous 80% du seuil d'entrée
+    EXIT_FACTOR = 0.8
+
+    def __init__(self, max_inflight=64, max_latency_ms=50, max_connections=None, retry_after_ms=5000):
+        self.max_inflight = max_inflight
+        self.max_latency_ms = max_latency_ms
+        self.max_connections = max_connections
+        self.retry_after_ms = retry_after_ms
+        self.level = self.NORMAL
+        self.pressure = 0.0
+        self.latency_ewma_ms = 0.0
+        self.last_sample = time.monotonic()
+        self.lock = threading.Lock()
+
+    @staticmethod
+    def from_context(ctx):
+        return OverloadController(
+            max_inflight=ctx.overload_inflight,
+            max_latency_ms=ctx.overload_latency_ms,
+            max_connections=ctx.overload_connections,
+        )
+
+    def observe_latency(self, elapsed_ns):
+        with self.lock:
+            self.latency_ewma_ms = self._decayed_latency() * 0.9 + (elapsed_ns / 1e6) * 0.1
+            self.last_sample = time.monotonic()
+
+    def _decayed_latency(self):
+        # Sans nouveau message, la latence mesurée perd la moitié de son poids chaque seconde
+        idle = time.monotonic() - self.last_sample
+        return self.latency_ewma_ms * math.pow(0.5, idle)
+
+    def update(self, inflight, connections):
+        """Recalcule le niveau ; retourne True s'il a changé"""
+        with self.lock:
+            ratios = [
+                inflight / self.max_inflight if self.max_inflight else 0.0,
+                self._decayed_latency() / self.max_latency_ms if self.max_latency_ms else 0.0,
+                connections / self.max_connections if self.max_connections else 0.0,
+            ]
+            self.pressure = max(ratios)
+
+            level = self.level
+            while level < self.REFUSE_CONNECTIONS and self.pressure >= self.ENTER_PRESSURE[level + 1]:
+                level += 1
+            while level > self.NORMAL and self.pressure < self.ENTER_PRESSURE[level] * self.EXIT_FACTOR:
+                level -= 1
+
+            changed = level != self.level
+            self.level = level
+            return changed
+
+    def sheds(self, level):
+        return self.level >= level
+
+    def status(self, inflight=None, connections=None):
+        return {
+            'level': self.level,
+            'name': self.LEVEL_NAMES[self.level],
+            'pressure': round(self.pressure, 2),
+            'latency_ms': round(self._decayed_latency(), 2),
+            'inflight': inflight,
+            'connections': connections,
+        }
@@ -0,0 +1,147 @@
+import base64
+import io
+import threading
+import time
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
+
+try:
+    from PIL import Image
+except ImportError:  # Pillow est optionnel : sans lui, les images sont routées en entier
+    Image = None
+
+
+def make_preview(data, width=250, quality=70):
+    """JPEG d'au plus `width` pixels de large à partir des octets d'une image, ou None"""
+    if Image is None:
+        return None
+    try:
+        with Image.open(io.BytesIO(data)) as image:
+            height = max(1, image.height * width // max(1, image.width))
+            # JPEG : décodé directement à 1/2, 1/4 ou 1/8 de sa taille, sans passer par l'original
+            image.draft("RGB", (width, height))
+            image.thumbnail((width, height))
+            out = io.BytesIO()
+            image.convert("RGB").save(out, "JPEG", quality=quality)
+            return out.getvalue()
+    except (OSError, ValueError, Image.DecompressionBombError):
+        return None
+
+
+class PreviewPool:
+    """Aperçus des images envoyées, générés sur un pool de threads hors du chemin de routage.
+
+    `submit` rend la main tout de suite : l'aperçu est calculé sur le pool, puis le message
+    est routé depuis le thread du pool. L'ordre de chaque émetteur est conservé : ce qu'il
+    envoie pendant qu'une de ses images est en cours attend derrière elle (voir `defer`).
+    Les aperçus déjà calculés sont gardés par empreinte : une image renvoyée n'est pas redécodée.
+    """
+
+    CACHE_MAX = 256  # aperçus gardés (empreinte -> base64)
+
+    def __init__(self, workers=2, width=250, quality=70, min_ratio=0.5):
+        self.width = width
+        self.quality = quality
+        self.min_ratio = min_ratio  # aperçu gardé seulement s'il fait moins de min_ratio de l'original
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="preview")
+        self.cache = OrderedDict()
+        self.queues = {}  # émetteur -> deque de tâches à router dans l'ordre
+        self.draining = set()
+        self.lock = threading.Lock()
+        self.stats = {'previews': 0, 'cached': 0, 'skipped': 0, 'bytes_in': 0, 'bytes_out': 0, 'time_ms': 0.0}
+
+    @staticmethod
+    def available():
+        return Image is not None
+
+    @staticmethod
+    def from_context(ctx):
+        return PreviewPool(ctx.preview_workers, ctx.preview_width)
+
+    def cached(self, key):
+        """Aperçu base64 déjà calculé, "" si l'image n'en vaut pas la peine, None si inconnue"""
+        with self.lock:
+            preview = self.cache.get(key)
+            if preview is not None:
+                self.cache.move_to_end(key)
+                self.stats['cached'] += 1
+            return preview
+
+    def make(self, key, data):
+        """Calcule (sur le thread appelant) et garde l'aperçu base64 de l'image `data`"""
+        started = time.perf_counter()
+        preview = make_preview(data, self.width, self.quality)
+        if preview is None or len(preview) > len(data) * self.min_ratio:
+            encoded = ""
+        else:
+            encoded = base64.b64encode(preview).decode("ascii")
+        with self.lock:
+            self.stats['time_ms'] += (time.perf_counter() - started) * 1000
+            self.stats['bytes_in'] += len(data)
+            if encoded:
+                self.stats['previews'] += 1
+                self.stats['bytes_out'] += len(preview)
+            else:
+                self.stats['skipped'] += 1
+            self.cache[key] = encoded
+            if len(self.cache) > self.CACHE_MAX:
+                self.cache.popitem(last=False)
+        return encoded
+
+    def submit(self, emitter, work, route, fallback=None):
+        """Exécute `work()` sur le pool, puis `route(résultat)` dans l'ordre des envois de `emitter` ;
+        si `work` échoue, `route(fallback)` : le message part quand même"""
+        task = {'ready': False, 'run': None}
+        with self.lock:
+            self.queues.setdefault(emitter, deque()).append(task)
+        self.executor.submit(self._run, emitter, task, work, route, fallback)
+
+    def defer(self, emitter, route):
+        """Place `route()` derrière les images en cours de `emitter` ; False s'il n'y en a pas"""
+        with self.lock:
+            queue = self.queues.get(emitter)
+            if not queue:
+                return False
+            queue.append({'ready': True, 'run': route})
+        return True
+
+    def _run(self, emitter, task, work, route, fallback):
+        try:
+            result = work()
+        except Exception as e:
+            print(f"[warning] aperçu impossible: {e}")
+            result = fallback
+        run = lambda: route(result)
+        with self.lock:
+            task['ready'] = True
+            task['run'] = run
+        self._drain(emitter)
+
+    def _drain(self, emitter):
+        """Route les tâches prêtes en tête de file ; un seul thread à la fois par émetteur"""
+        with self.lock:
+            if emitter in self.draining:
+                return
+            self.draining.add(emitter)
+        while True:
+            with self.lock:
+                queue = self.queues.get(emitter)
+                if not queue or not queue[0]['ready']:
+                    # La tâche en tête relancera _drain quand elle sera prête
+                    self.draining.discard(emitter)
+                    if queue is not None and not queue:
+                        del self.queues[emitter]
+                    return
+                task = queue[0]
+            try:
+                if task['run'] is not None:
+                    task['run']()
+            except Exception as e:
+                print(f"[warning] routage après aperçu impossible: {e}")
+            finally:
+                # Retirée seulement après le routage : defer() attend derrière elle jusque-là
+                with self.lock:
+                    queue.popleft()
+
+    def shutdown(self):
+        self.executor.shutdown(wait=True)
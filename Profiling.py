@@ -0,0 +1,130 @@
+import os
+import sys
+import threading
+import time
+from collections import Counter
+
+
+class DispatchStats:
+    """Compteurs et histogrammes de duree de traitement, par type de message."""
+
+    # Bornes superieures des seaux de l'histogramme (ms), le dernier seau est "au-dela"
+    BUCKETS_MS = (0.1, 0.5, 1, 5, 10, 50, 100, 500, 1000)
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.stats = {}
+
+    def record(self, message_type, elapsed_ns):
+        elapsed_ms = elapsed_ns / 1e6
+        bucket = len(self.BUCKETS_MS)
+        for i, bound in enumerate(self.BUCKETS_MS):
+            if elapsed_ms <= bound:
+                bucket = i
+                break
+        with self.lock:
+            entry = self.stats.get(message_type)
+            if entry is None:
+                entry = {'count': 0, 'total_ns': 0, 'max_ns': 0, 'buckets': [0] * (len(self.BUCKETS_MS) + 1)}
+                self.stats[message_type] = entry
+            entry['count'] += 1
+            entry['total_ns'] += elapsed_ns
+            if elapsed_ns > entry['max_ns']:
+                entry['max_ns'] = elapsed_ns
+            entry['buckets'][bucket] += 1
+
+    def snapshot(self):
+        """Copie serialisable en JSON (durees en ms)."""
+        with self.lock:
+            items = [(k, dict(v, buckets=list(v['buckets']))) for k, v in self.stats.items()]
+        result = {}
+        for message_type, entry in items:
+            result[message_type] = {
+                'count': entry['count'],
+                'avg_ms': round(entry['total_ns'] / entry['count'] / 1e6, 3),
+                'max_ms': round(entry['max_ns'] / 1e6, 3),
+                'total_ms': round(entry['total_ns'] / 1e6, 1),
+                'buckets_ms': list(self.BUCKETS_MS) + ['inf'],
+                'histogram': entry['buckets'],
+            }
+        return result
+
+    def reset(self):
+        with self.lock:
+            self.stats = {}
+
+
+class StackSampler:
+    """Echantillonne les piles de tous les threads et produit un format "collapsed"
+    (une ligne `racine;...;feuille nombre`), lisible par flamegraph.pl / speedscope."""
+
+    def __init__(self, interval=0.005):
+        self.interval = interval
+        self.samples = Counter()
+        self.sample_count = 0
+        self.started_at = None
+        self.stopped_at = None
+        self.thread = None
+        self.stop_event = threading.Event()
+        self.on_finished = None
+
+    @property
+    def running(self):
+        return self.thread is not None and self.thread.is_alive()
+
+    def start(self, duration, on_finished=None, interval=None):
+        """Demarre une session de `duration` secondes ; `on_finished(result)` est
+        appele depuis le thread d'echantillonnage a la fin (ou apres stop())."""
+        if self.running:
+            return False
+        if interval:
+            self.interval = interval
+        self.samples = Counter()
+        self.sample_count = 0
+        self.on_finished = on_finished
+        self.stop_event.clear()
+        self.started_at = time.time()
+        self.stopped_at = None
+        self.thread = threading.Thread(target=self._run, args=(duration,), name="stack-sampler", daemon=True)
+        self.thread.start()
+        return True
+
+    def stop(self):
+        self.stop_event.set()
+
+    def _run(self, duration):
+        own_id = threading.get_ident()
+        deadline = time.perf_counter() + duration
+        names = {}
+        while not self.stop_event.is_set() and time.perf_counter() < deadline:
+            for thread in threading.enumerate():
+                names[thread.ident] = thread.name
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own_id:
+                    continue
+                self.samples[self._collapse(names.get(thread_id, str(thread_id)), frame)] += 1
+            self.sample_count += 1
+            self.stop_event.wait(self.interval)
+        self.stopped_at = time.time()
+        if self.on_finished:
+            self.on_finished(self.result())
+
+    @staticmethod
+    def _collapse(thread_name, frame):
+        stack = []
+        while frame is not None:
+            code = frame.f_code
+            stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)})")
+            frame = frame.f_back
+        stack.append(thread_name)
+        return ";".join(reversed(stack))
+
+    def result(self):
+        lines = [f"{stack} {count}" for stack, count in self.samples.most_common()]
+        end = self.stopped_at or time.time()
+        return {
+            'collapsed': "\n".join(lines),
+            'samples': self.sample_count,
+            'interval_ms': round(self.interval * 1000, 2),
+            'duration': round(end - self.started_at, 2) if self.started_at else 0,
+        }
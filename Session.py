@@ -0,0 +1,124 @@
+import secrets
+import threading
+import time
+from collections import deque
+
+
+class Session:
+    """Session d'un utilisateur : numéros de séquence et messages récents à rejouer."""
+
+    def __init__(self, username, token, buffer_size, buffer_bytes=None):
+        self.username = username
+        self.token = token
+        self.next_seq = 1
+        self.acked_seq = 0  # plus haut numéro confirmé par le client
+        # Tampon borné en nombre de messages et en octets : un média de plusieurs Mo
+        # pèse autant que des milliers de messages texte
+        self.buffer = deque()  # (seq, json)
+        self.buffer_size = buffer_size
+        self.buffer_bytes = buffer_bytes
+        self.size = 0  # octets de JSON dans le tampon
+        self.client = None
+        self.detached_at = None
+        self.expiry_timer = None
+        self.lock = threading.Lock()
+
+    @property
+    def last_seq(self):
+        return self.next_seq - 1
+
+    @property
+    def detached(self):
+        return self.client is None
+
+    def stamp(self, message):
+        """Attribue le prochain numéro au message, le garde pour un éventuel rejeu et
+        retourne son JSON."""
+        with self.lock:
+            message.seq = self.next_seq
+            self.next_seq += 1
+            data = message.to_json()
+            self.buffer.append((message.seq, data))
+            self.size += len(data)
+            # Les plus anciens sortent ; replay_after signale alors le trou (RESUME_GAP)
+            while self.buffer and (len(self.buffer) > self.buffer_size or
+                                   (self.buffer_bytes and self.size > self.buffer_bytes)):
+                self.size -= len(self.buffer.popleft()[1])
+            return data
+
+    @property
+    def unacked(self):
+        return self.last_seq - self.acked_seq
+
+    def ack(self, seq):
+        """Accusé cumulé : les messages jusqu'à `seq` sont livrés, plus besoin de les rejouer"""
+        with self.lock:
+            seq = min(seq, self.last_seq)
+            if seq <= self.acked_seq:
+                return False
+            self.acked_seq = seq
+            while self.buffer and self.buffer[0][0] <= seq:
+                self.size -= len(self.buffer.popleft()[1])
+            return True
+
+    def replay_after(self, last_seq):
+        """Messages de numéro > last_seq, et False si certains ont déjà quitté le tampon"""
+        with self.lock:
+            if last_seq >= self.last_seq:
+                return [], True
+            complete = bool(self.buffer) and self.buffer[0][0] <= last_seq + 1
+            return [data for seq, data in self.buffer if seq > last_seq], complete
+
+    def attach(self, client):
+        self.client = client
+        self.detached_at = None
+        if self.expiry_timer:
+            self.expiry_timer.cancel()
+            self.expiry_timer = None
+
+    def detach(self):
+        self.client = None
+        self.detached_at = time.monotonic()
+
+
+class SessionStore:
+    """Sessions par utilisateur, retrouvables par jeton de reprise."""
+
+    def __init__(self, buffer_size=256, ttl=30, buffer_bytes=None):
+        self.buffer_size = buffer_size
+        self.buffer_bytes = buffer_bytes
+        self.ttl = ttl
+        self.by_username = {}
+        self.by_token = {}
+        self.lock = threading.Lock()
+
+    def create(self, username, client):
+        session = Session(username, secrets.token_urlsafe(16), self.buffer_size, self.buffer_bytes)
+        session.attach(client)
+        with self.lock:
+            previous = self.by_username.get(username)
+            if previous:
+                self.by_token.pop(previous.token, None)
+                if previous.expiry_timer:
+                    previous.expiry_timer.cancel()
+            self.by_username[username] = session
+            self.by_token[session.token] = session
+        return session
+
+    def get(self, username):
+        return self.by_username.get(username)
+
+    def get_by_token(self, token):
+        return self.by_token.get(token)
+
+    def remove(self, username):
+        with self.lock:
+            session = self.by_username.pop(username, None)
+            if session:
+                self.by_token.pop(session.token, None)
+                if session.expiry_timer:
+                    session.expiry_timer.cancel()
+        return session
+
+    def detached_usernames(self):
+        return [name for name, session in list(self.by_username.items()) if session.detached]
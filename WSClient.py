@@ -1,16 +1,69 @@
 import websocket
 import threading
-import base64
+import json
+import os
+import random
+import sys
+import time
+from collections import OrderedDict, deque
 
+from Batcher import SendBatcher
+import MediaHTTP
 from Context import Context
+from MediaCache import EncodedMedia, MediaCache
+from MediaStream import MediaStream
 from Message import Message, MessageType
 
 
 class WSClient:
-    def __init__(self, ctx, username="Client"):
+    MEDIA_RECEPTION_TYPES = (MessageType.RECEPTION.IMAGE, MessageType.RECEPTION.AUDIO, MessageType.RECEPTION.VIDEO)
+    SENT_MEDIA_MAX = 256  # médias envoyés dont on garde le chemin, pour un renvoi après MEDIA_MISS
+    ENCODED_MEDIA_MAX = 4  # médias encodés gardés en attente de MEDIA_QUERY (au-delà, relus depuis le fichier)
+
+    def __init__(self, ctx, username="Client", media_cache=None):
+        self.ctx = ctx
         self.username = username
         self.connected = False
         self.connected_clients = []
+        self.reconnect_delay = None  # délai demandé par le serveur (drain / restart)
+        # Reprise de session après une coupure (voir WSServer.handle_resume)
+        self.session_token = None
+        self.last_seq = 0
+        # Accusé cumulé (plus haut seq reçu) : joint au prochain envoi ou envoyé après ack_interval_ms
+        self.acked_seq = 0
+        self.ack_timer = None
+        self.ack_lock = threading.Lock()
+        self.dropped_at = None
+        self.closing = False
+        # Reconnexion automatique avec délai exponentiel, envois gardés pendant la coupure
+        self.was_connected = False
+        self.reconnect_attempts = 0
+        self.next_delay = None
+        self.outbox = deque(maxlen=ctx.outbound_buffer)
+        self.send_lock = threading.Lock()
+        # Envois regroupés en trames BATCH si ctx.batch_window_ms est défini
+        self.batcher = None
+        if ctx.batch_window_ms:
+            self.batcher = SendBatcher(username, self.send_now, ctx.batch_window_ms,
+                                       ctx.batch_max_messages, ctx.batch_max_bytes)
+        # Médias reçus (cache par empreinte) et envoyés (requêtes MEDIA_QUERY en attente)
+        self.media_cache = media_cache or MediaCache.from_context(ctx)
+        self.sent_media = OrderedDict()  # empreinte -> (chemin, type, préfixe)
+        self.pending_media = set()       # (empreinte, destinataire)
+        self.encoded_media = OrderedDict()  # empreinte -> EncodedMedia, jusqu'à la réponse au MEDIA_QUERY
+        self.media_lock = threading.Lock()
+        self.media_port = None  # point HTTP des médias du serveur, annoncé dans SESSION (voir MediaHTTP)
+        self.metrics = {'reconnects': 0, 'downtime_s': 0.0, 'last_downtime_s': 0.0, 'dropped': 0, 'flushed': 0, 'last_flushed': 0}
+        self.input_thread = None
+        # Mode non interactif (voir pipe_loop) : source des lignes à envoyer, sortie NDJSON
+        self.pipe_source = None
+        self.pipe_receivers = []
+        self.dump = None
+        self.log = sys.stdout   # traces du client (état, erreurs) ; stderr en mode non interactif, None = silencieux
+        self.ack_timeout = 5.0  # attente des accusés après le dernier envoi (s)
+        self.linger = 0.0       # réception prolongée avant de quitter (s)
+        self.next_seq = 1
+        self.pipe_stats = {'sent': 0, 'acked': 0, 'nacked': 0, 'received': 0}
         self.ws = websocket.WebSocketApp(
             ctx.url(),
             on_open=self.on_open,
@@ -22,41 +75,285 @@ class WSClient:
     def on_message(self, ws, message):
         received_msg = Message.from_json(message)
 
+        if self.handle_session_message(ws, received_msg):
+            return
+        if self.handle_media_message(ws, received_msg):
+            return
+
         # Répondre au ping du serveur
         if received_msg.message_type == MessageType.SYS_MESSAGE and received_msg.value == "ping":
             pong_msg = Message(MessageType.SYS_MESSAGE, emitter=self.username, receiver="", value="pong")
             ws.send(pong_msg.to_json())
             return
 
+        # Le serveur redémarre ou se draine : on se reconnectera après le délai indiqué
+        if received_msg.message_type == MessageType.SYS_MESSAGE and str(received_msg.value).startswith("RECONNECT:"):
+            self.reconnect_delay = int(received_msg.value.split(":", 1)[1]) / 1000.0
+            self.info(f"\n[info] Le serveur redémarre, reconnexion dans {self.reconnect_delay:.1f}s")
+            return
+
+        # Accusés de livraison des envois numérotés (mode non interactif)
+        if received_msg.message_type == MessageType.SYS_MESSAGE and str(received_msg.value).startswith(("ACK:", "NACK:")):
+            self.pipe_stats['acked' if received_msg.value.startswith("ACK:") else 'nacked'] += 1
+            return
+
         # Gestion de la liste des clients
         if received_msg.message_type == MessageType.RECEPTION.CLIENT_LIST:
             self.connected_clients = [c for c in received_msg.value if c != self.username]
-            print(f"\n[info] Clients connectés: {self.connected_clients}")
+            self.info(f"\n[info] Clients connectés: {self.connected_clients}")
+            return
+
+        # Affichage selon le type de message (la réception est confirmée par l'accusé cumulé)
+        if self.dump:
+            self.dump.write(message + "\n")
+            self.pipe_stats['received'] += 1
+        else:
+            self.info(f"\n[{received_msg.emitter}] {received_msg.value}")
+
+    def handle_session_message(self, ws, received_msg):
+        """Suivi du jeton et des numéros de séquence ; retourne True si le message est consommé"""
+        if received_msg.seq is not None:
+            if received_msg.seq <= self.last_seq:
+                return True  # déjà reçu, rejoué après une reprise
+            self.last_seq = received_msg.seq
+            self.schedule_ack()
+
+        if received_msg.message_type == MessageType.SESSION:
+            self.session_token = received_msg.value['token']
+            self.media_port = received_msg.value.get('media_port')
+            if not received_msg.value.get('resumed'):
+                self.last_seq = self.acked_seq = received_msg.value['seq']
+            return True
+
+        # Session expirée ou serveur redémarré : on repart d'une déclaration
+        if received_msg.message_type == MessageType.WARNING and received_msg.value == "RESUME_REFUSED":
+            self.session_token = None
+            self.last_seq = self.acked_seq = 0
+            ws.send(self.declaration_message().to_json())
+            return True
+        return False
+
+    def handle_media_message(self, ws, received_msg):
+        """Cache des médias reçus et dédoublonnage des envois ; retourne True si le message est consommé"""
+        message_type = received_msg.message_type
+        value = received_msg.value
+
+        # Réponse du serveur : référence seule si le destinataire a déjà le média
+        if message_type == MessageType.MEDIA_QUERY:
+            with self.media_lock:
+                pending = (value['hash'], value['receiver']) in self.pending_media
+                self.pending_media.discard((value['hash'], value['receiver']))
+                sent = self.sent_media.get(value['hash'])
+                encoded = self.encoded_media.pop(value['hash'], None)
+            if pending and sent:
+                filepath, media_type, prefix = sent
+                if value['known']:
+                    ref = Message(media_type, emitter=self.username, receiver=value['receiver'], value=Message.media_ref(prefix, value['hash']))
+                    self.send_message(ref)
+                else:
+                    self.upload_in_background(filepath, value['receiver'], media_type, prefix, encoded)
+            return True
+
+        # Original d'un aperçu demandé par fetch_media
+        if message_type == MessageType.MEDIA_FETCH:
+            available = bool(value.get('value'))
+            if available:
+                self.media_cache.put_value(value['value'], value['hash'])
+            self.on_media_fetched(value['hash'], available)
+            return True
+
+        # Un destinataire n'avait plus le média référencé : envoi complet, à lui seul
+        if message_type == MessageType.SYS_MESSAGE and str(value).startswith("MEDIA_MISS:"):
+            with self.media_lock:
+                sent = self.sent_media.get(value.split(":", 1)[1])
+            if sent:
+                self.upload_in_background(sent[0], received_msg.emitter, sent[1], sent[2])
+            return True
+
+        if message_type in self.MEDIA_RECEPTION_TYPES and isinstance(value, str) and received_msg.emitter != self.username:
+            link = Message.parse_media_link(value)
+            if link:
+                # Média sur le point HTTP : lu ou téléchargé à la demande (media_url, download_media)
+                if link[1] in self.media_cache:
+                    received_msg.value = Message.media_ref(link[0], link[1])
+                return False
+            preview = Message.parse_media_preview(value)
+            if preview:
+                # Aperçu du serveur : l'original déjà en cache le remplace, sinon il attend fetch_media
+                if preview[1] in self.media_cache:
+                    received_msg.value = Message.media_ref(preview[0], preview[1])
+                return False
+            ref = Message.parse_media_ref(value)
+            if ref is None:
+                # Média complet : décodé une fois, la suite ne manipule que sa référence
+                prefix = value.partition(":")[0]
+                received_msg.value = Message.media_ref(prefix, self.media_cache.put_value(value))
+            elif ref[1] not in self.media_cache:
+                miss = Message(MessageType.SYS_MESSAGE, emitter=self.username, receiver=received_msg.emitter, value=f"MEDIA_MISS:{ref[1]}")
+                ws.send(miss.to_json())
+                return True
+        return False
+
+    def fetch_media(self, key):
+        """Demande au serveur l'original d'un média reçu en aperçu ; réponse dans on_media_fetched"""
+        self.send_message(Message.media_fetch(self.username, key))
+
+    def media_url(self, key):
+        """URL d'un média sur le point HTTP du serveur, None si le serveur n'en a pas"""
+        if self.media_port is None:
+            return None
+        return MediaHTTP.media_url(self.ctx.host, self.media_port, key)
+
+    def download_media(self, key, progress=None):
+        """Fichier du média `key` dans le cache, téléchargé par HTTP s'il n'y est pas encore ;
+        un téléchargement interrompu reprend où il s'était arrêté (Range). None si indisponible"""
+        path = self.media_cache.file_for(key)
+        url = self.media_url(key)
+        if path or url is None:
+            return path
+        partial = self.media_cache.path(key) + ".part"
+        try:
+            MediaHTTP.download(url, partial, progress)
+        except OSError as e:
+            self.info(f"\n[error] téléchargement du média {key[:12]} impossible: {e}")
+            return None
+        return self.media_cache.adopt_file(key, partial)
+
+    def wants_http(self, size):
+        return self.media_port is not None and self.session_token is not None and size >= self.ctx.media_http_min_bytes
+
+    def share_file(self, filepath, key, dest, message_type, prefix):
+        """Dépose le fichier sur le point HTTP du serveur puis n'envoie que son lien :
+        le flux WebSocket n'est pas bloqué par le média. Repli sur l'envoi complet en cas d'échec"""
+        try:
+            shared = MediaHTTP.upload(self.ctx.host, self.media_port, key, prefix, filepath, self.session_token)
+        except OSError as e:
+            self.info(f"\n[warning] dépôt HTTP de {filepath} impossible: {e}")
+            shared = False
+        if shared:
+            self.send_message(Message(message_type, emitter=self.username, receiver=dest, value=Message.media_link(prefix, key)))
+        else:
+            self.upload_file(filepath, dest, message_type, prefix)
+
+    def on_media_fetched(self, key, available):
+        self.info(f"\n[info] Média {key[:12]} {'reçu' if available else 'indisponible sur le serveur'}")
+
+    def schedule_ack(self):
+        with self.ack_lock:
+            if self.ack_timer is None:
+                self.ack_timer = threading.Timer(self.ctx.ack_interval_ms / 1000.0, self.send_ack)
+                self.ack_timer.daemon = True
+                self.ack_timer.start()
+
+    def pending_ack(self):
+        """Plus haut seq reçu s'il n'a pas encore été confirmé au serveur, sinon None"""
+        with self.ack_lock:
+            if self.last_seq <= self.acked_seq:
+                return None
+            return self.last_seq
+
+    def confirm_ack(self, ack):
+        """acked_seq n'avance qu'une fois la trame portant l'accusé écrite : un envoi en échec ne le perd pas"""
+        if ack is None:
             return
+        with self.ack_lock:
+            if self.acked_seq < ack <= self.last_seq:
+                self.acked_seq = ack
+
+    def send_ack(self):
+        with self.ack_lock:
+            self.ack_timer = None
+        # Rien à envoyer si l'accusé est déjà parti avec un message
+        with self.send_lock:
+            if not self.connected:
+                return
+            ack = self.pending_ack()
+            if ack is None:
+                return
+            try:
+                self.ws.send(Message.cumulative_ack(self.username, ack).to_json())
+                self.confirm_ack(ack)
+            except (websocket.WebSocketException, OSError):
+                pass
 
-        # Affichage selon le type de message
-        print(f"\n[{received_msg.emitter}] {received_msg.value}")
+    def declaration_message(self):
+        if self.session_token:
+            return Message.resume(self.username, self.session_token, self.last_seq)
+        return Message(MessageType.DECLARATION, emitter=self.username, receiver="", value="")
 
-        # Accusé de réception pour les messages RECEPTION
-        if received_msg.message_type in [MessageType.RECEPTION.TEXT, MessageType.RECEPTION.IMAGE, MessageType.RECEPTION.AUDIO, MessageType.RECEPTION.VIDEO]:
-            ack_msg = Message(MessageType.SYS_MESSAGE, emitter=self.username, receiver="", value="MESSAGE OK")
-            ws.send(ack_msg.to_json())
+    def mark_open(self, ws):
+        """Connexion (ré)ouverte : déclaration ou reprise, puis renvoi des messages en attente"""
+        with self.send_lock:
+            self.connected = True
+            if self.dropped_at is not None:
+                downtime = time.monotonic() - self.dropped_at
+                self.metrics['reconnects'] += 1
+                self.metrics['downtime_s'] += downtime
+                self.metrics['last_downtime_s'] = downtime
+            self.dropped_at = None
+            self.was_connected = True
+            self.reconnect_attempts = 0
+            # RESUME si on a une session en cours, DECLARATION sinon
+            ws.send(self.declaration_message().to_json())
+            flushed = 0
+            while self.outbox:
+                self.write(ws.sock, self.outbox[0])
+                self.outbox.popleft()
+                flushed += 1
+            self.metrics['flushed'] += flushed
+            self.metrics['last_flushed'] = flushed
+
+    def mark_closed(self):
+        """Connexion fermée : calcule le délai avant la prochaine tentative (None = on s'arrête)"""
+        with self.send_lock:
+            self.connected = False
+        if self.dropped_at is None:
+            self.dropped_at = time.monotonic()
+        if self.reconnect_delay is not None:
+            # Délai imposé par le serveur (drain / restart)
+            self.next_delay, self.reconnect_delay = self.reconnect_delay, None
+        elif self.closing or not self.was_connected:
+            self.next_delay = None
+        else:
+            # Délai exponentiel avec une part aléatoire, pour ne pas revenir tous en même temps
+            delay_ms = min(self.ctx.reconnect_max_ms, self.ctx.reconnect_base_ms * 2 ** min(self.reconnect_attempts, 16))
+            self.next_delay = random.uniform(0.5, 1.0) * delay_ms / 1000.0
+            self.reconnect_attempts += 1
+        return self.next_delay
+
+    def reconnect_stats(self):
+        stats = dict(self.metrics, attempts=self.reconnect_attempts, buffered=len(self.outbox))
+        if self.dropped_at is not None:
+            stats['current_downtime_s'] = time.monotonic() - self.dropped_at
+        return stats
+
+    def info(self, text):
+        """Trace du client sur self.log (stdout par défaut), rien si log est None"""
+        if self.log is not None:
+            print(text, file=self.log)
 
     def on_error(self, ws, error):
-        print(f"\n[error] {error}")
+        self.info(f"\n[error] {error}")
 
     def on_close(self, ws, close_status_code, close_msg):
-        print(f"\n[close] code={close_status_code} msg={close_msg}")
-        self.connected = False
+        self.info(f"\n[close] code={close_status_code} msg={close_msg}")
+        delay = self.mark_closed()
+        if delay is not None:
+            self.info(f"[info] Reconnexion dans {delay:.1f}s (tentative {self.reconnect_attempts})")
 
     def on_open(self, ws):
-        print("[open] connecté")
-        self.connected = True
-        message = Message(MessageType.DECLARATION, emitter=self.username, receiver="", value="")
-        ws.send(message.to_json())
+        self.info("[open] connecté")
+        reconnecting = self.was_connected
+        self.mark_open(ws)
+        if reconnecting:
+            stats = self.reconnect_stats()
+            self.info(f"[info] Reconnecté après {stats['last_downtime_s']:.1f}s ({stats['reconnects']} reconnexion(s), {stats['last_flushed']} message(s) renvoyé(s))")
 
-        input_thread = threading.Thread(target=self.input_loop, daemon=True)
-        input_thread.start()
+        # Une seule boucle de saisie, même après une reconnexion
+        if self.input_thread is None or not self.input_thread.is_alive():
+            target = self.input_loop if self.pipe_source is None else self.pipe_loop
+            self.input_thread = threading.Thread(target=target, daemon=True)
+            self.input_thread.start()
 
     def select_recipient(self):
         """Affiche un menu de sélection du destinataire"""
@@ -85,12 +382,15 @@ class WSClient:
         print(f"\nChat démarré en tant que '{self.username}'")
         print("Commandes spéciales: 'disconnect', 'img:dest:chemin', 'audio:dest:chemin', 'video:dest:chemin'\n")
 
-        while self.connected:
+        # Pendant une coupure, les envois sont gardés puis renvoyés à la reconnexion
+        while not self.closing:
             try:
                 dest = self.select_recipient()
 
                 if dest is None:
                     disconnect_msg = Message(MessageType.SYS_MESSAGE, emitter=self.username, receiver="", value="Disconnect")
+                    self.flush()
+                    self.closing = True
                     self.ws.send(disconnect_msg.to_json())
                     self.ws.close()
                     break
@@ -99,6 +399,8 @@ class WSClient:
 
                 if content.lower() == "disconnect":
                     disconnect_msg = Message(MessageType.SYS_MESSAGE, emitter=self.username, receiver="", value="Disconnect")
+                    self.flush()
+                    self.closing = True
                     self.ws.send(disconnect_msg.to_json())
                     self.ws.close()
                     break
@@ -121,33 +423,194 @@ class WSClient:
             except EOFError:
                 break
 
+    def parse_line(self, line):
+        """Messages à envoyer pour une ligne : texte brut, ou JSON (message complet ou {"value", "receiver", "sensor_id"})"""
+        receivers = self.pipe_receivers
+        if line.startswith("{"):
+            data = json.loads(line)
+            if 'message_type' in data:
+                message = Message.from_dict(data)
+                message.emitter = self.username
+                return [message]
+            if data.get('receiver'):
+                receivers = [data['receiver']]
+            if data.get('sensor_id') is not None:
+                return [Message.sensor(self.username, data['sensor_id'], data.get('value'), dest) for dest in receivers]
+            line = data.get('value')
+        return [Message(MessageType.ENVOI.TEXT, emitter=self.username, receiver=dest, value=line) for dest in receivers]
+
+    def pipe_loop(self):
+        """Mode non interactif : envoie chaque ligne de pipe_source sans attendre de réponse,
+        attend les accusés de livraison puis affiche le débit sur stderr"""
+        stats = self.pipe_stats
+        started = time.perf_counter()
+        for line in self.pipe_source:
+            line = line.rstrip("\r\n")
+            if not line:
+                continue
+            try:
+                messages = self.parse_line(line)
+            except (ValueError, KeyError) as e:
+                print(f"[warning] ligne ignorée ({e}): {line[:80]}", file=sys.stderr)
+                continue
+            for message in messages:
+                # Numéroté : le serveur répond ACK / NACK (voir WSServer.handle_envoi)
+                message.seq = self.next_seq
+                self.next_seq += 1
+                self.send_message(message)
+                stats['sent'] += 1
+        self.flush()
+        sent_s = time.perf_counter() - started
+
+        deadline = time.monotonic() + self.ack_timeout
+        while stats['acked'] + stats['nacked'] < stats['sent'] and time.monotonic() < deadline:
+            time.sleep(0.01)
+        delivered_s = time.perf_counter() - started
+        time.sleep(self.linger)
+
+        report = dict(stats, elapsed_s=round(delivered_s, 3),
+                      send_rate_msgs_s=round(stats['sent'] / sent_s, 1) if sent_s else None,
+                      delivered_rate_msgs_s=round(stats['acked'] / delivered_s, 1) if delivered_s else None)
+        print(json.dumps(report), file=sys.stderr)
+        if self.dump:
+            self.dump.flush()
+
+        disconnect_msg = Message(MessageType.SYS_MESSAGE, emitter=self.username, receiver="", value="Disconnect")
+        self.closing = True
+        try:
+            self.ws.send(disconnect_msg.to_json())
+            # La fermeture se termine dans le thread de réception, qui sort dès la réponse du serveur
+            self.ws.sock.send_close()
+        except (websocket.WebSocketException, OSError, AttributeError):
+            self.ws.close()
+
     def connect(self):
-        self.ws.run_forever()
+        self.ws.run_forever(sockopt=self.ctx.socket_options())
+        # Reconnexion demandée par le serveur (drain / restart) ou après une coupure :
+        # next_delay est calculé dans on_close, reprise ou déclaration dans on_open
+        while self.next_delay is not None:
+            time.sleep(self.next_delay)
+            self.ws.run_forever(sockopt=self.ctx.socket_options())
+
+    def send_message(self, message):
+        if self.batcher:
+            self.batcher.add(message)
+        else:
+            self.send_now(message)
+
+    def flush(self):
+        """Envoie immédiatement le lot en attente"""
+        if self.batcher:
+            self.batcher.flush()
+
+    @staticmethod
+    def write(sock, item):
+        """Écrit un Message ou un MediaStream sur la connexion (websocket.WebSocket)"""
+        if isinstance(item, MediaStream):
+            item.send(sock)
+        else:
+            sock.send(item.to_json())
+
+    def send_now(self, message):
+        """Envoie un message, ou le garde pour le renvoyer après la reconnexion"""
+        with self.send_lock:
+            if self.connected:
+                # L'accusé cumulé en attente part avec le message, sans trame à lui
+                ack = None
+                if not isinstance(message, MediaStream) and message.ack is None:
+                    ack = message.ack = self.pending_ack()
+                try:
+                    self.write(self.ws.sock, message)
+                    self.confirm_ack(ack)
+                    return True
+                except (websocket.WebSocketException, OSError):
+                    if ack is not None:
+                        message.ack = None  # l'accusé repartira avec un prochain envoi
+            if len(self.outbox) == self.outbox.maxlen:
+                self.metrics['dropped'] += 1
+            self.outbox.append(message)
+            return False
 
     def send(self, value, dest):
         message = Message(MessageType.ENVOI.TEXT, emitter=self.username, receiver=dest, value=value)
-        self.ws.send(message.to_json())
+        self.send_message(message)
+
+    def send_sensor(self, sensor_id, value, dest):
+        self.send_message(Message.sensor(self.username, sensor_id, value, dest))
+
+    def send_file(self, filepath, dest, message_type, prefix, progress=None):
+        """Envoie un média ; au-delà de media_dedup_min_bytes, le serveur dit d'abord si le
+        destinataire l'a déjà, auquel cas seule sa référence part (voir handle_media_message) ;
+        au-delà de media_http_min_bytes, il est déposé sur le point HTTP du serveur (share_file)"""
+        size = os.path.getsize(filepath)
+        if size < self.ctx.media_dedup_min_bytes:
+            self.upload_file(filepath, dest, message_type, prefix)
+            return
+        key = MediaCache.key_for_file(filepath, prefix, progress=progress)
+        if self.wants_http(size):
+            threading.Thread(target=self.share_file, args=(filepath, key, dest, message_type, prefix), daemon=True).start()
+            return
+        self.query_media(key, filepath, dest, message_type, prefix)
+
+    def send_encoded(self, media, filepath, dest, message_type):
+        """Envoie un média déjà lu et encodé (EncodedMedia) : ni relecture du fichier ni second
+        encodage, et le cache local le connaît pour l'aperçu (référence media_ref)"""
+        self.media_cache.put_data(media.key, media.data)
+        if self.wants_http(len(media.data)):
+            threading.Thread(target=self.share_file, args=(filepath, media.key, dest, message_type, media.prefix), daemon=True).start()
+            return
+        if len(media.data) < self.ctx.media_dedup_min_bytes:
+            self.send_message(Message(message_type, emitter=self.username, receiver=dest, value=media.value()))
+            return
+        with self.media_lock:
+            self.encoded_media[media.key] = media
+            while len(self.encoded_media) > self.ENCODED_MEDIA_MAX:
+                self.encoded_media.popitem(last=False)
+        self.query_media(media.key, filepath, dest, message_type, media.prefix)
+
+    def query_media(self, key, filepath, dest, message_type, prefix):
+        with self.media_lock:
+            self.sent_media[key] = (filepath, message_type, prefix)
+            self.sent_media.move_to_end(key)
+            if len(self.sent_media) > self.SENT_MEDIA_MAX:
+                self.sent_media.popitem(last=False)
+            self.pending_media.add((key, dest))
+        self.send_message(Message.media_query(self.username, key, dest))
+
+    def upload_in_background(self, filepath, dest, message_type, prefix, encoded=None):
+        # Hors du thread de réception : l'envoi d'un gros média prend du temps
+        threading.Thread(target=self.upload_file, args=(filepath, dest, message_type, prefix, encoded), daemon=True).start()
+
+    def upload_file(self, filepath, dest, message_type, prefix, encoded=None):
+        """Envoie un média lu et encodé par blocs : mémoire constante quelle que soit sa taille ;
+        avec `encoded` (EncodedMedia), sa valeur déjà encodée part telle quelle"""
+        message = Message(message_type, emitter=self.username, receiver=dest, value="")
+        if encoded is not None:
+            message.value = encoded.value()
+        else:
+            try:
+                message = MediaStream(filepath, message, prefix)
+            except OSError as e:
+                self.info(f"\n[error] média {filepath} illisible: {e}")
+                return
+        # Les messages regroupés en attente partent avant le média
+        self.flush()
+        self.send_now(message)
+
+    def encode_file(self, filepath, prefix, progress=None):
+        """EncodedMedia si le fichier tient dans attach_buffer_mb, sinon None (envoi par send_file)"""
+        if os.path.getsize(filepath) > self.ctx.attach_buffer_mb * 1024 * 1024:
+            return None
+        return EncodedMedia.from_file(filepath, prefix, progress)
 
     def send_image(self, filepath, dest):
-        with open(filepath, "rb") as f:
-            img_base64 = base64.b64encode(f.read()).decode("utf-8")
-        value = f"IMG:{img_base64}"
-        message = Message(MessageType.ENVOI.IMAGE, emitter=self.username, receiver=dest, value=value)
-        self.ws.send(message.to_json())
+        self.send_file(filepath, dest, MessageType.ENVOI.IMAGE, "IMG")
 
     def send_audio(self, filepath, dest):
-        with open(filepath, "rb") as f:
-            audio_base64 = base64.b64encode(f.read()).decode("utf-8")
-        value = f"AUDIO:{audio_base64}"
-        message = Message(MessageType.ENVOI.AUDIO, emitter=self.username, receiver=dest, value=value)
-        self.ws.send(message.to_json())
+        self.send_file(filepath, dest, MessageType.ENVOI.AUDIO, "AUDIO")
 
     def send_video(self, filepath, dest):
-        with open(filepath, "rb") as f:
-            video_base64 = base64.b64encode(f.read()).decode("utf-8")
-        value = f"VIDEO:{video_base64}"
-        message = Message(MessageType.ENVOI.VIDEO, emitter=self.username, receiver=dest, value=value)
-        self.ws.send(message.to_json())
+        self.send_file(filepath, dest, MessageType.ENVOI.VIDEO, "VIDEO")
 
     @staticmethod
     def dev(username="Client"):
@@ -158,7 +621,31 @@ class WSClient:
         return WSClient(Context.prod(), username)
 
 if __name__ == "__main__":
-    import sys
-    username = sys.argv[1] if len(sys.argv) > 1 else "Client"
-    client = WSClient.prod(username)
+    import argparse
+    parser = argparse.ArgumentParser(description="Client de chat ; non interactif avec --to / --input / --dump")
+    parser.add_argument("username", nargs="?", default="Client")
+    parser.add_argument("--to", action="append", default=[], help="destinataire des lignes lues (répétable, ALL pour tous)")
+    parser.add_argument("--input", help="fichier de lignes à envoyer (texte ou NDJSON, défaut: stdin)")
+    parser.add_argument("--dump", action="store_true", help="écrit les messages reçus en NDJSON sur stdout")
+    parser.add_argument("--batch-ms", type=int, help="regroupe les envois en trames BATCH (batch_window_ms)")
+    parser.add_argument("--ack-timeout", type=float, default=5.0, help="attente des accusés après le dernier envoi (s)")
+    parser.add_argument("--linger", type=float, default=0.0, help="réception prolongée avant de quitter (s)")
+    args = parser.parse_args()
+
+    # prod() par défaut, surchargé par $WS_CONFIG (JSON) et les variables WS_* (ex: WS_PROFILE=low_latency)
+    ctx = Context.load(default="prod")
+    if args.batch_ms:
+        ctx = Context(ctx.host, ctx.port, ctx.profile, **dict(ctx.tuning(), batch_window_ms=args.batch_ms))
+
+    if args.to or args.input or args.dump:
+        client = WSClient(ctx, args.username)
+        client.pipe_source = open(args.input, encoding="utf-8") if args.input else sys.stdin
+        client.pipe_receivers = args.to
+        # stdout est réservé au NDJSON, les traces du client partent sur stderr
+        client.dump = sys.stdout if args.dump else None
+        client.log = sys.stderr
+        client.ack_timeout = args.ack_timeout
+        client.linger = args.linger
+    else:
+        client = WSClient(ctx, args.username)
     client.connect()
\ No newline at end of file
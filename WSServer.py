@@ -1,17 +1,42 @@
 from websocket_server import WebsocketServer
 import threading
 import base64
+import os
+import random
+import select
+import signal
+import socket
+import subprocess
+import sys
+import time
+from collections import OrderedDict
 from datetime import datetime
 
 from Context import Context
+from MediaCache import MediaCache
+from MediaHTTP import MediaHTTPServer
 from Message import Message, MessageType
+from Overload import OverloadController
+from Preview import PreviewPool
+from Profiling import DispatchStats, StackSampler
+from Session import SessionStore
+
+# Variables d'environnement utilisées pour transmettre la socket d'écoute au nouveau processus (restart)
+LISTEN_FD_ENV = "WSSERVER_LISTEN_FD"
+READY_FD_ENV = "WSSERVER_READY_FD"
 
 
 class WSServer:
-    def __init__(self, ctx):
+    MEDIA_TYPES = (MessageType.ENVOI.IMAGE, MessageType.ENVOI.AUDIO, MessageType.ENVOI.VIDEO)
+    MEDIA_SEEN_MAX = 1024  # empreintes de médias retenues par utilisateur
+    MEDIA_STORE_DIR = os.path.join(os.path.expanduser("~"), ".cache", "WebSocketPython", "server_media")
+
+    def __init__(self, ctx, server=None):
+        self.ctx = ctx
         self.host = ctx.host
         self.port = ctx.port
-        self.server = WebsocketServer(host=self.host, port=self.port, loglevel=1)
+        # `server` permet d'injecter un faux serveur en memoire (benchmarks)
+        self.server = server if server is not None else self.create_server()
         self.server.set_fn_new_client(self.on_new_client)
         self.server.set_fn_client_left(self.on_client_left)
         self.server.set_fn_message_received(self.on_message_received)
@@ -21,14 +46,127 @@ class WSServer:
         self.admin_clients = []    # List of admin websockets
         self.running = False
 
+        # Drain : messages en cours de traitement et fin d'arrêt
+        self.draining = False
+        self.inflight = 0
+        self.inflight_lock = threading.Lock()
+        self.stopped = threading.Event()
+
+        # Délestage sous charge : niveau visible par les admins
+        self.overload = OverloadController.from_context(ctx)
+        self.presence_dirty = False
+
+        # Sessions reprenables après une coupure (jeton + rejeu des messages manqués)
+        self.sessions = SessionStore(buffer_size=ctx.session_buffer, ttl=ctx.session_ttl,
+                                     buffer_bytes=ctx.session_buffer_mb * 1024 * 1024)
+
+        # Accusés de lecture "VU" regroupés par destinataire (voir queue_receipt)
+        self.receipts = {}
+        self.receipts_lock = threading.Lock()
+
+        # Empreintes des médias déjà livrés à chaque utilisateur (voir handle_media_query)
+        self.media_seen = {}
+
+        # Images routées sous forme d'aperçu, originaux gardés pour MEDIA_FETCH (voir with_preview)
+        self.previews = None
+        if ctx.preview_workers and PreviewPool.available():
+            self.previews = PreviewPool.from_context(ctx)
+        elif ctx.preview_workers:
+            print("[info] Pillow absent : images routées sans aperçu")
+        self.media_store = None
+        if self.previews is not None or ctx.media_http:
+            self.media_store = MediaCache(ctx.media_store_mb * 1024 * 1024, ctx.media_store_disk_mb * 1024 * 1024, self.MEDIA_STORE_DIR)
+
+        # Médias déposés et lus par HTTP (Range, sendfile), hors du flux WebSocket (voir MediaHTTP)
+        self.media_http = None
+        if ctx.media_http:
+            try:
+                self.media_http = MediaHTTPServer(self.host, ctx.media_http_port, self.media_store, self.authorize_media)
+            except OSError as e:
+                print(f"[warning] point HTTP des médias indisponible: {e}")
+
+        # Connexions passerelles (BotHost) : id client -> utilisateurs virtuels portés
+        self.gateways = {}
+        # Connexions refusées (limite, surcharge) : leurs trames sont ignorées jusqu'à la fermeture
+        self.refused = set()
+
+        # Instrumentation du dispatch (temps par type) et profilage à la demande
+        self.dispatch_stats = DispatchStats()
+        self.profiler = StackSampler()
+
+        self.handlers = {
+            MessageType.DECLARATION: self.handle_declaration,
+            MessageType.RESUME: self.handle_resume,
+            MessageType.BATCH: self.handle_batch,
+            MessageType.MEDIA_QUERY: self.handle_media_query,
+            MessageType.MEDIA_FETCH: self.handle_media_fetch,
+            MessageType.ACK: self.handle_ack,
+            MessageType.ENVOI.CLIENT_LIST: self.handle_client_list_request,
+            MessageType.ENVOI.TEXT: self.handle_envoi,
+            MessageType.ENVOI.IMAGE: self.handle_envoi,
+            MessageType.ENVOI.AUDIO: self.handle_envoi,
+            MessageType.ENVOI.VIDEO: self.handle_envoi,
+            MessageType.ENVOI.SENSOR: self.handle_envoi,
+            MessageType.SYS_MESSAGE: self.handle_sys_message,
+            MessageType.ADMIN.STATS: self.handle_admin_stats,
+            MessageType.ADMIN.PROFILE_START: self.handle_admin_profile_start,
+            MessageType.ADMIN.PROFILE_STOP: self.handle_admin_profile_stop,
+        }
+
+    def create_server(self):
+        listen_fd = os.environ.pop(LISTEN_FD_ENV, None)
+        if listen_fd is None:
+            server = WebsocketServer(host=self.host, port=self.port, loglevel=1)
+        else:
+            # Reprend la socket d'écoute transmise par l'ancien processus (restart)
+            server = WebsocketServer(host=self.host, port=0, loglevel=1)
+            server.socket.close()
+            server.socket = socket.socket(fileno=int(listen_fd))
+            server.port = server.socket.getsockname()[1]
+            print(f"[info] Socket d'écoute reprise (fd={listen_fd})")
+        self.apply_tuning(server)
+        return server
+
+    def apply_tuning(self, server):
+        """Applique le profil transport du Context à la socket d'écoute"""
+        # Les sockets acceptées héritent des tampons de la socket d'écoute
+        self.ctx.apply_socket_options(server.socket)
+        server.socket.listen(self.ctx.backlog)
+        if self.ctx.read_chunk_size:
+            handler_class = server.RequestHandlerClass
+            server.RequestHandlerClass = type(handler_class.__name__, (handler_class,), {'rbufsize': self.ctx.read_chunk_size})
+
     def on_new_client(self, client, server):
         print(f"\n[+] Client connecté: id={client['id']} addr={client['address']}")
+        if self.ctx.max_connections and len(server.clients) > self.ctx.max_connections:
+            print(f"[info] Connexion refusée: limite de {self.ctx.max_connections} atteinte")
+            self.refuse(client, b"server full")
+            return
+        self.update_overload()
+        if self.overload.sheds(OverloadController.REFUSE_CONNECTIONS):
+            # Surcharge : le client réessaiera après le délai indiqué (voir WSClient)
+            retry_ms = self.overload.retry_after_ms + random.randint(0, self.overload.retry_after_ms)
+            print(f"[info] Connexion refusée (surcharge), retour dans {retry_ms} ms")
+            server.send_message(client, Message.reconnect(retry_ms).to_json())
+            self.refuse(client, b"overloaded")
+            return
+        self.ctx.apply_socket_options(client['handler'].request)
         welcome_msg = Message(MessageType.RECEPTION.TEXT, emitter="SERVER", receiver="", value="Bienvenue !")
         server.send_message(client, welcome_msg.to_json())
-        self.broadcast_clients_list()
+        # La liste ne change qu'à la DECLARATION : pas de diffusion pour une connexion anonyme
         print("[SERVER] > ", end="", flush=True)
 
+    def refuse(self, client, reason):
+        """Ferme une connexion sans la lire : ni déclaration, ni session, ni annonce de présence"""
+        self.refused.add(client['id'])
+        client['handler'].send_close(1013, reason)
+        # Le gestionnaire sort de sa boucle de lecture juste après la poignée de main
+        client['handler'].keep_alive = False
+
     def on_client_left(self, client, server):
+        if client['id'] in self.refused:
+            self.refused.discard(client['id'])
+            return
         print(f"\n[-] Client déconnecté: id={client['id']}")
         disconnected_username = None
 
@@ -36,25 +174,77 @@ class WSServer:
             if c['id'] == client['id']:
                 disconnected_username = name
                 del self.clients[name]
-                # Nettoie les métadonnées
-                if name in self.client_metadata:
-                    del self.client_metadata[name]
-                break
+                if client['id'] not in self.gateways:
+                    break
 
         # Nettoie la liste des admins si c'était un admin
         self.admin_clients = [a for a in self.admin_clients if a.get('id') != client.get('id')]
 
+        # Passerelle : tous ses utilisateurs virtuels partent, une seule diffusion de présence
+        if client['id'] in self.gateways:
+            usernames = self.gateways.pop(client['id'])
+            for name in usernames:
+                if name not in self.clients:  # pas redéclaré ailleurs entre-temps
+                    self.end_session(name, broadcast=False)
+            print(f"[info] Passerelle fermée ({len(usernames)} utilisateurs)")
+            self.broadcast_clients_list()
+            print("[SERVER] > ", end="", flush=True)
+            return
+
+        session = self.sessions.get(disconnected_username) if disconnected_username else None
+        if session and not self.draining:
+            # Coupure : la session reste réservée session_ttl secondes, sans annonce de départ
+            session.detach()
+            session.expiry_timer = threading.Timer(self.ctx.session_ttl, self.expire_session, args=(disconnected_username, session.token))
+            session.expiry_timer.daemon = True
+            session.expiry_timer.start()
+            print(f"[info] Session '{disconnected_username}' en attente de reprise ({self.ctx.session_ttl}s)")
+        elif disconnected_username:
+            self.end_session(disconnected_username)
+
+        print("[SERVER] > ", end="", flush=True)
+
+    def end_session(self, username, broadcast=True):
+        """Départ définitif d'un utilisateur"""
+        self.sessions.remove(username)
+        self.media_seen.pop(username, None)
+        # Nettoie les métadonnées
+        if username in self.client_metadata:
+            del self.client_metadata[username]
+
         # Notifie les admins de la déconnexion
-        if disconnected_username and not disconnected_username.startswith("ADMIN"):
-            self.notify_admins_client_disconnected(disconnected_username)
+        if not username.startswith("ADMIN"):
+            self.notify_admins_client_disconnected(username)
 
-        self.broadcast_clients_list()
+        if broadcast:
+            self.broadcast_clients_list()
 
-        print("[SERVER] > ", end="", flush=True)
+    def expire_session(self, username, token):
+        session = self.sessions.get(username)
+        if session and session.token == token and session.detached:
+            print(f"\n[info] Session '{username}' expirée")
+            self.end_session(username)
+
+    def present_usernames(self):
+        """Utilisateurs connectés, y compris ceux dont la session attend une reprise"""
+        return list(self.clients.keys()) + [name for name in self.sessions.detached_usernames() if name not in self.clients]
+
+    def deliver(self, username, message):
+        """Envoie un message routé : numéroté et gardé pour le rejeu si l'utilisateur a une session"""
+        session = self.sessions.get(username)
+        data = session.stamp(message) if session else message.to_json()
+        client = self.clients.get(username)
+        if client:
+            self.server.send_message(client, data)
 
     def broadcast_clients_list(self):
         """Envoie la liste des clients à tous"""
-        clients_ids = list(self.clients.keys())
+        if self.overload.sheds(OverloadController.SHED_PRESENCE):
+            # Regroupée : une seule diffusion au retour sous le seuil (voir update_overload)
+            self.presence_dirty = True
+            return
+        self.presence_dirty = False
+        clients_ids = self.present_usernames()
 
         msg = Message(
             MessageType.RECEPTION.CLIENT_LIST,
@@ -63,11 +253,17 @@ class WSServer:
             value=clients_ids
         ).to_json()
 
-        for client in self.clients.values():
-            self.server.send_message(client, msg)
+        # Une seule copie par connexion : une passerelle porte plusieurs utilisateurs
+        sent = set()
+        for client in list(self.clients.values()):
+            if client['id'] not in sent:
+                sent.add(client['id'])
+                self.server.send_message(client, msg)
 
     def notify_admins_routing(self, emitter, receiver, msg_type):
         """Envoie une notification de routage à tous les admins (sans contenu)"""
+        if self.overload.sheds(OverloadController.SHED_ROUTING_LOGS):
+            return
         log_data = {
             'emitter': emitter,
             'receiver': receiver,
@@ -108,6 +304,21 @@ class WSServer:
             except:
                 pass
 
+    def update_overload(self):
+        """Recalcule le niveau de délestage et prévient les admins s'il change"""
+        if not self.overload.update(self.inflight, len(self.clients)):
+            return
+        status = self.overload.status(self.inflight, len(self.clients))
+        print(f"\n[info] Niveau de charge: {status['name']} (pression {status['pressure']})")
+        msg = Message(MessageType.ADMIN.OVERLOAD, emitter="SERVER", receiver="ADMIN", value=status)
+        for admin in self.admin_clients:
+            try:
+                self.server.send_message(admin, msg.to_json())
+            except:
+                pass
+        if self.presence_dirty and not self.overload.sheds(OverloadController.SHED_PRESENCE):
+            self.broadcast_clients_list()
+
     def send_admin_client_list(self, admin_client):
         """Envoie la liste complète des clients avec métadonnées à un admin"""
         clients_data = []
@@ -122,63 +333,238 @@ class WSServer:
         self.server.send_message(admin_client, msg.to_json())
 
     def on_message_received(self, client, server, message):
-        print(f"\n[message reçu] {message}")
-        received_msg = Message.from_json(message)
-        if received_msg.message_type == MessageType.DECLARATION:
-            username = received_msg.emitter
-
-            # Détection des clients admin
-            if username == "ADMIN" or username.startswith("ADMIN_"):
-                self.admin_clients.append(client)
-                print(f"[info] Admin '{username}' connecté")
-                # Envoie la liste complète des clients à l'admin
-                self.send_admin_client_list(client)
-            else:
-                # Client régulier - stocke les métadonnées
-                self.client_metadata[username] = {
-                    'connected_at': datetime.now().isoformat(),
-                    'last_activity': datetime.now().isoformat()
-                }
-                # Notifie tous les admins de la nouvelle connexion
-                self.notify_admins_client_connected(username)
-
-            response = Message(MessageType.RECEPTION.TEXT, emitter="SERVER", receiver=username, value=f"Déclaration reçue de {username}")
-            server.send_message(client, response.to_json())
+        if client['id'] in self.refused:
+            return
+        started = time.perf_counter_ns()
+        with self.inflight_lock:
+            self.inflight += 1
+        try:
+            print(f"\n[message reçu] {message}")
+            received_msg = Message.from_json(message)
+            # Accusé cumulé joint à un envoi du client
+            if received_msg.ack is not None:
+                self.record_ack(client, received_msg.emitter, received_msg.ack)
+            handler = self.handlers.get(received_msg.message_type)
+            if handler:
+                handler(client, server, received_msg)
+            elapsed_ns = time.perf_counter_ns() - started
+            self.dispatch_stats.record(received_msg.message_type, elapsed_ns)
+            self.overload.observe_latency(elapsed_ns)
+        finally:
+            with self.inflight_lock:
+                self.inflight -= 1
+        self.update_overload()
+
+        print("[SERVER] > ", end="", flush=True)
+
+    def handle_declaration(self, client, server, received_msg):
+        if isinstance(received_msg.value, dict) and 'users' in received_msg.value:
+            self.handle_gateway_declaration(client, server, received_msg)
+            return
+        username = received_msg.emitter
+
+        # Détection des clients admin
+        if username == "ADMIN" or username.startswith("ADMIN_"):
+            self.admin_clients.append(client)
+            print(f"[info] Admin '{username}' connecté")
+            # Envoie la liste complète des clients à l'admin, et le niveau de charge courant
+            self.send_admin_client_list(client)
+            status = self.overload.status(self.inflight, len(self.clients))
+            server.send_message(client, Message(MessageType.ADMIN.OVERLOAD, emitter="SERVER", receiver="ADMIN", value=status).to_json())
+        else:
+            # Client régulier - stocke les métadonnées
+            self.client_metadata[username] = {
+                'connected_at': datetime.now().isoformat(),
+                'last_activity': datetime.now().isoformat()
+            }
+            # Notifie tous les admins de la nouvelle connexion
+            self.notify_admins_client_connected(username)
+
+        response = Message(MessageType.RECEPTION.TEXT, emitter="SERVER", receiver=username, value=f"Déclaration reçue de {username}")
+        server.send_message(client, response.to_json())
+        self.clients[username] = client
+        if not self.is_admin(client):
+            session = self.sessions.create(username, client)
+            server.send_message(client, Message.session(username, session.token, session.last_seq, media_port=self.media_port()).to_json())
+        print(f"[info] Client '{username}' enregistré")
+        self.broadcast_clients_list()
+
+    def handle_gateway_declaration(self, client, server, received_msg):
+        """Passerelle : une connexion déclare d'un coup les utilisateurs virtuels qu'elle porte"""
+        usernames = self.gateways.setdefault(client['id'], set())
+        added = []
+        for username in received_msg.value['users']:
+            if username in usernames or username == "ALL" or username == "SERVER" or username.startswith("ADMIN"):
+                continue
+            usernames.add(username)
+            added.append(username)
             self.clients[username] = client
-            print(f"[info] Client '{username}' enregistré")
-            self.broadcast_clients_list()
-        
-        elif received_msg.message_type == MessageType.ENVOI.CLIENT_LIST:
-            users_list = list(self.clients.keys())
-            response = Message(MessageType.RECEPTION.CLIENT_LIST, emitter="SERVER", receiver=received_msg.receiver, value=users_list)
-            server.send_message(client, response.to_json())
-            print(f"CLIENTS = {users_list}")
-
-        elif received_msg.message_type in [MessageType.ENVOI.TEXT, MessageType.ENVOI.IMAGE, MessageType.ENVOI.AUDIO, MessageType.ENVOI.VIDEO, MessageType.ENVOI.SENSOR]:
-            # Met à jour last_activity pour l'émetteur
-            if received_msg.emitter in self.client_metadata:
-                self.client_metadata[received_msg.emitter]['last_activity'] = datetime.now().isoformat()
-
-            # Détermine le type de message pour le log
-            msg_type_simple = 'TEXT'
+            self.client_metadata[username] = {
+                'connected_at': datetime.now().isoformat(),
+                'last_activity': datetime.now().isoformat()
+            }
+            self.notify_admins_client_connected(username)
+
+        # Pas de session : la passerelle se redéclare entièrement après une coupure
+        response = Message(MessageType.RECEPTION.TEXT, emitter="SERVER", receiver=received_msg.emitter, value=f"Passerelle {received_msg.emitter}: {len(added)} utilisateurs déclarés")
+        server.send_message(client, response.to_json())
+        print(f"[info] Passerelle '{received_msg.emitter}' : {len(added)} utilisateurs enregistrés")
+        self.broadcast_clients_list()
+
+    def handle_resume(self, client, server, received_msg):
+        """Reprise après coupure : rejoue les messages manqués, sans diffusion de présence"""
+        options = received_msg.value if isinstance(received_msg.value, dict) else {}
+        session = self.sessions.get_by_token(options.get('token'))
+        if session is None or session.username != received_msg.emitter:
+            # Le client se redéclare (voir WSClient.handle_session_message)
+            server.send_message(client, Message.warning("SERVER", "RESUME_REFUSED", received_msg.emitter).to_json())
+            return
+
+        username = session.username
+        session.attach(client)
+        # Ce que le client a déjà reçu n'est plus à garder
+        session.ack(int(options.get('last_seq', 0)))
+        self.clients[username] = client
+        if username in self.client_metadata:
+            self.client_metadata[username]['last_activity'] = datetime.now().isoformat()
+
+        replay, complete = session.replay_after(int(options.get('last_seq', 0)))
+        server.send_message(client, Message.session(username, session.token, session.last_seq, resumed=True,
+                                                    media_port=self.media_port()).to_json())
+        if not complete:
+            server.send_message(client, Message.warning("SERVER", "RESUME_GAP", username).to_json())
+        for data in replay:
+            server.send_message(client, data)
+
+        # Seul le client qui revient reçoit la liste à jour
+        users_list = Message(MessageType.RECEPTION.CLIENT_LIST, emitter="SERVER", receiver=username, value=self.present_usernames())
+        server.send_message(client, users_list.to_json())
+        print(f"[info] Session '{username}' reprise ({len(replay)} messages rejoués)")
+
+    def handle_client_list_request(self, client, server, received_msg):
+        users_list = self.present_usernames()
+        response = Message(MessageType.RECEPTION.CLIENT_LIST, emitter="SERVER", receiver=received_msg.receiver, value=users_list)
+        server.send_message(client, response.to_json())
+        print(f"CLIENTS = {users_list}")
+
+    def handle_envoi(self, client, server, received_msg):
+        # Met à jour last_activity pour l'émetteur
+        if received_msg.emitter in self.client_metadata:
+            self.client_metadata[received_msg.emitter]['last_activity'] = datetime.now().isoformat()
+
+        if self.previews is not None:
+            # Compté dans inflight jusqu'à son routage depuis le pool : drain() l'attend
+            with self.inflight_lock:
+                self.inflight += 1
+            try:
+                # Image complète : l'aperçu est calculé sur le pool, le message routé ensuite depuis le pool
+                # (tel quel si l'aperçu échoue, base64 invalide par exemple)
+                if self.wants_preview(received_msg):
+                    self.previews.submit(received_msg.emitter, lambda: self.with_preview(received_msg),
+                                         lambda message: self.route_preview(client, server, message),
+                                         fallback=received_msg)
+                    return
+                # Les envois suivants de l'émetteur attendent derrière ses images en cours
+                if self.previews.defer(received_msg.emitter, lambda: self.route_preview(client, server, received_msg)):
+                    return
+            except Exception:
+                with self.inflight_lock:
+                    self.inflight -= 1
+                raise
+            with self.inflight_lock:
+                self.inflight -= 1
+        self.route_envoi(client, server, received_msg)
+
+    def wants_preview(self, received_msg):
+        value = received_msg.value
+        if received_msg.message_type != MessageType.ENVOI.IMAGE or not isinstance(value, str):
+            return False
+        link = Message.parse_media_link(value)
+        if link:
+            # Déposée sur le point HTTP : l'aperçu se calcule depuis le fichier du serveur
+            return link[0] == "IMG" and link[1] in self.media_store
+        return value.startswith("IMG:") and len(value) >= self.ctx.preview_min_bytes
+
+    def with_preview(self, received_msg):
+        """Le message avec l'aperçu à la place de l'image, l'original restant au serveur ;
+        inchangé si l'aperçu ne gagne rien. Exécuté sur le pool d'aperçus"""
+        link = Message.parse_media_link(received_msg.value)
+        key = link[1] if link else MediaCache.key(received_msg.value)
+        preview = self.previews.cached(key)
+        data = None
+        if preview is None:
+            data = self.media_store.get(key) if link else base64.b64decode(received_msg.value[4:])
+            if data is None:
+                return received_msg
+            preview = self.previews.make(key, data)
+        if not preview:
+            return received_msg
+        if not link and key not in self.media_store:
+            if data is None:
+                data = base64.b64decode(received_msg.value[4:])
+            self.media_store.put_data(key, data)
+            # Copie sur disque : l'original reste disponible après éviction de la mémoire
+            self.media_store.file_for(key)
+        return Message(received_msg.message_type, Message.media_preview("IMG", key, preview), received_msg.emitter,
+                       received_msg.receiver, received_msg.sensor_id, received_msg.seq)
+
+    def route_preview(self, client, server, message):
+        """Routage depuis le pool d'aperçus (image ou envoi mis en attente derrière elle)"""
+        try:
+            self.route_envoi(client, server, message)
+        finally:
+            with self.inflight_lock:
+                self.inflight -= 1
+
+    def route_envoi(self, client, server, received_msg):
+        # Détermine le type de message pour le log
+        msg_type_simple = 'TEXT'
+        if received_msg.message_type == MessageType.ENVOI.IMAGE:
+            msg_type_simple = 'IMAGE'
+        elif received_msg.message_type == MessageType.ENVOI.AUDIO:
+            msg_type_simple = 'AUDIO'
+        elif received_msg.message_type == MessageType.ENVOI.VIDEO:
+            msg_type_simple = 'VIDEO'
+        elif received_msg.message_type == MessageType.ENVOI.SENSOR:
+            msg_type_simple = 'SENSOR'
+
+        # Notifie les admins du routage (sans contenu)
+        self.notify_admins_routing(received_msg.emitter, received_msg.receiver, msg_type_simple)
+
+        delivered = True
+        if received_msg.receiver == "SERVER":
+            print(f"[{received_msg.emitter}] {received_msg.value}")
+        if received_msg.receiver == "SERVER" and received_msg.message_type == MessageType.SYS_MESSAGE:
+            ack_msg = Message(MessageType.SYS_MESSAGE, emitter="SERVER", receiver="", value="VU")
+            server.send_message(client, ack_msg.to_json())
+        if received_msg.receiver == "ALL":
+            reception_type = MessageType.RECEPTION.TEXT
             if received_msg.message_type == MessageType.ENVOI.IMAGE:
-                msg_type_simple = 'IMAGE'
+                reception_type = MessageType.RECEPTION.IMAGE
             elif received_msg.message_type == MessageType.ENVOI.AUDIO:
-                msg_type_simple = 'AUDIO'
+                reception_type = MessageType.RECEPTION.AUDIO
             elif received_msg.message_type == MessageType.ENVOI.VIDEO:
-                msg_type_simple = 'VIDEO'
+                reception_type = MessageType.RECEPTION.VIDEO
             elif received_msg.message_type == MessageType.ENVOI.SENSOR:
-                msg_type_simple = 'SENSOR'
-
-            # Notifie les admins du routage (sans contenu)
-            self.notify_admins_routing(received_msg.emitter, received_msg.receiver, msg_type_simple)
-
-            if received_msg.receiver == "SERVER":
-                print(f"[{received_msg.emitter}] {received_msg.value}")
-            if received_msg.receiver == "SERVER" and received_msg.message_type == MessageType.SYS_MESSAGE:
-                ack_msg = Message(MessageType.SYS_MESSAGE, emitter="SERVER", receiver="", value="VU")
-                server.send_message(client, ack_msg.to_json())
-            if received_msg.receiver == "ALL":
+                reception_type = MessageType.RECEPTION.SENSOR
+
+            media_key = self.media_key(received_msg)
+            gateways_sent = set()
+            for name in self.present_usernames():
+                target = self.clients.get(name)
+                if target and target['id'] in self.gateways:
+                    # Une copie par passerelle, qui la distribue à ses utilisateurs
+                    if target['id'] not in gateways_sent:
+                        gateways_sent.add(target['id'])
+                        message = Message(reception_type, emitter=received_msg.emitter, receiver="ALL", value=received_msg.value, sensor_id=received_msg.sensor_id)
+                        server.send_message(target, message.to_json())
+                    continue
+                message = Message(reception_type, emitter=received_msg.emitter, receiver="ALL", value=received_msg.value, sensor_id=received_msg.sensor_id)
+                self.deliver(name, message)
+                self.remember_media(name, media_key)
+        else:
+            receiver_session = self.sessions.get(received_msg.receiver)
+            if received_msg.receiver in self.clients or receiver_session:
                 reception_type = MessageType.RECEPTION.TEXT
                 if received_msg.message_type == MessageType.ENVOI.IMAGE:
                     reception_type = MessageType.RECEPTION.IMAGE
@@ -188,52 +574,201 @@ class WSServer:
                     reception_type = MessageType.RECEPTION.VIDEO
                 elif received_msg.message_type == MessageType.ENVOI.SENSOR:
                     reception_type = MessageType.RECEPTION.SENSOR
-
-                for client in self.clients.values():
-                    message = Message(reception_type, emitter=received_msg.emitter, receiver="ALL", value=received_msg.value, sensor_id=received_msg.sensor_id)
-                    self.server.send_message(client, message.to_json())
+                forward_msg = Message(reception_type, emitter=received_msg.emitter, receiver=received_msg.receiver, value=received_msg.value, sensor_id=received_msg.sensor_id)
+                self.deliver(received_msg.receiver, forward_msg)
+                self.remember_media(received_msg.receiver, self.media_key(received_msg))
             else:
-                receiver_client = self.clients.get(received_msg.receiver, None)
-                if receiver_client:
-                    reception_type = MessageType.RECEPTION.TEXT
-                    if received_msg.message_type == MessageType.ENVOI.IMAGE:
-                        reception_type = MessageType.RECEPTION.IMAGE
-                    elif received_msg.message_type == MessageType.ENVOI.AUDIO:
-                        reception_type = MessageType.RECEPTION.AUDIO
-                    elif received_msg.message_type == MessageType.ENVOI.VIDEO:
-                        reception_type = MessageType.RECEPTION.VIDEO
-                    elif received_msg.message_type == MessageType.ENVOI.SENSOR:
-                        reception_type = MessageType.RECEPTION.SENSOR
-                    forward_msg = Message(reception_type, emitter=received_msg.emitter, receiver=received_msg.receiver, value=received_msg.value, sensor_id=received_msg.sensor_id)
-                    server.send_message(receiver_client, forward_msg.to_json())
-                else:
-                    error_msg = Message(MessageType.RECEPTION.TEXT, emitter="SERVER", receiver=received_msg.emitter, value=f"Erreur: destinataire {received_msg.receiver} non trouvé.")
-                    server.send_message(client, error_msg.to_json())
-        elif received_msg.message_type == MessageType.SYS_MESSAGE:
-             # Forward SYS_MESSAGE (like VU) to the target receiver
-             target = received_msg.receiver
-             if target and target != "SERVER" and target != "ALL":
-                 receiver_client = self.clients.get(target, None)
-                 if receiver_client:
-                     forward_msg = Message(MessageType.SYS_MESSAGE, emitter=received_msg.emitter, receiver=target, value=received_msg.value)
-                     server.send_message(receiver_client, forward_msg.to_json())
+                delivered = False
+                error_msg = Message(MessageType.RECEPTION.TEXT, emitter="SERVER", receiver=received_msg.emitter, value=f"Erreur: destinataire {received_msg.receiver} non trouvé.")
+                server.send_message(client, error_msg.to_json())
+
+        # Le client a numéroté son envoi : il attend un accusé (voir AsyncWSClient)
+        if received_msg.seq is not None:
+            server.send_message(client, Message.ack(received_msg.seq, delivered).to_json())
+
+    def handle_sys_message(self, client, server, received_msg):
+        # Déconnexion volontaire : pas de session à garder pour une reprise
+        if received_msg.value == "Disconnect":
+            # Un utilisateur virtuel quitte sa passerelle, qui reste connectée
+            usernames = self.gateways.get(client['id'])
+            if usernames and received_msg.emitter in usernames:
+                usernames.discard(received_msg.emitter)
+                self.clients.pop(received_msg.emitter, None)
+                self.end_session(received_msg.emitter)
+                return
+            session = self.sessions.get(received_msg.emitter)
+            if session and session.client and session.client.get('id') == client.get('id'):
+                self.sessions.remove(received_msg.emitter)
+            return
+
+        # Mesure du temps d'aller-retour par le client : réponse immédiate, hors session (ni seq ni rejeu)
+        if received_msg.receiver == "SERVER" and str(received_msg.value).startswith("PING:"):
+            pong_msg = Message(MessageType.SYS_MESSAGE, emitter="SERVER", receiver=received_msg.emitter,
+                               value="PONG:" + received_msg.value[5:])
+            server.send_message(client, pong_msg.to_json())
+            return
+
+        # Le destinataire n'a plus ce média en cache : il faudra le renvoyer en entier
+        if str(received_msg.value).startswith("MEDIA_MISS:"):
+            self.media_seen.get(received_msg.emitter, {}).pop(received_msg.value.split(":", 1)[1], None)
+
+        # Forward SYS_MESSAGE (like VU) to the target receiver
+        target = received_msg.receiver
+        if target and target != "SERVER" and target != "ALL":
+            if received_msg.value == "VU" and (target in self.clients or self.sessions.get(target)):
+                self.queue_receipt(target, received_msg.emitter)
+            elif target in self.clients or self.sessions.get(target):
+                forward_msg = Message(MessageType.SYS_MESSAGE, emitter=received_msg.emitter, receiver=target, value=received_msg.value)
+                self.deliver(target, forward_msg)
+
+    def handle_batch(self, client, server, received_msg):
+        """Lot de messages d'un client : décodé une seule fois, routé à la suite"""
+        for message in received_msg.unpack():
+            # Ni lot imbriqué, ni déclaration / reprise dans un lot
+            if message.message_type in (MessageType.BATCH, MessageType.DECLARATION, MessageType.RESUME):
+                continue
+            # Accusé cumulé porté par un message du lot (clients qui ne le mettent pas sur l'enveloppe)
+            if message.ack is not None:
+                self.record_ack(client, received_msg.emitter, message.ack)
+            handler = self.handlers.get(message.message_type)
+            if handler:
+                handler(client, server, message)
+
+    def handle_ack(self, client, server, received_msg):
+        self.record_ack(client, received_msg.emitter, received_msg.value)
+
+    def record_ack(self, client, username, seq):
+        """Accusé cumulé : les messages livrés sortent du tampon de rejeu de la session"""
+        session = self.sessions.get(username)
+        if session and session.client and session.client.get('id') == client.get('id'):
+            try:
+                session.ack(int(seq))
+            except (TypeError, ValueError):
+                pass
 
-        print("[SERVER] > ", end="", flush=True)
+    def queue_receipt(self, target, emitter):
+        """Regroupe les "VU" destinés à `target` : un seul message "VU:<émetteurs>" par intervalle"""
+        with self.receipts_lock:
+            pending = self.receipts.get(target)
+            if pending is None:
+                pending = self.receipts[target] = []
+                timer = threading.Timer(self.ctx.ack_interval_ms / 1000.0, self.flush_receipts, args=(target,))
+                timer.daemon = True
+                timer.start()
+            if emitter not in pending:
+                pending.append(emitter)
+
+    def flush_receipts(self, target):
+        with self.receipts_lock:
+            emitters = self.receipts.pop(target, [])
+        if emitters:
+            receipt = Message(MessageType.SYS_MESSAGE, emitter="SERVER", receiver=target, value="VU:" + ",".join(emitters))
+            self.deliver(target, receipt)
+
+    def media_key(self, received_msg):
+        """Empreinte d'un média envoyé en entier, None pour le reste (texte, références)"""
+        if received_msg.message_type not in self.MEDIA_TYPES or not isinstance(received_msg.value, str):
+            return None
+        value = received_msg.value
+        if Message.parse_media_ref(value) or Message.parse_media_preview(value) or Message.parse_media_link(value):
+            return None
+        return MediaCache.key(received_msg.value)
+
+    def remember_media(self, username, media_key):
+        if media_key is None:
+            return
+        seen = self.media_seen.setdefault(username, OrderedDict())
+        seen[media_key] = True
+        seen.move_to_end(media_key)
+        if len(seen) > self.MEDIA_SEEN_MAX:
+            seen.popitem(last=False)
+
+    def handle_media_query(self, client, server, received_msg):
+        """Le destinataire a-t-il déjà ce média ? Si oui l'émetteur n'envoie qu'une référence"""
+        key = received_msg.value
+        if received_msg.receiver == "ALL":
+            receivers = [name for name in self.present_usernames() if name != received_msg.emitter]
+        else:
+            receivers = [received_msg.receiver]
+        known = bool(receivers) and all(key in self.media_seen.get(name, ()) for name in receivers)
+        reply = Message(MessageType.MEDIA_QUERY, {'hash': key, 'receiver': received_msg.receiver, 'known': known}, "SERVER", received_msg.emitter)
+        server.send_message(client, reply.to_json())
+
+    def handle_media_fetch(self, client, server, received_msg):
+        """Original d'une image reçue en aperçu (voir with_preview), envoyé au seul demandeur"""
+        key = received_msg.value
+        data = self.media_store.get(key) if self.media_store is not None and isinstance(key, str) else None
+        value = None
+        if data is not None:
+            value = "IMG:" + base64.b64encode(data).decode("ascii")
+            # Le demandeur l'a maintenant en cache : les prochains envois peuvent n'être qu'une référence
+            self.remember_media(received_msg.emitter, key)
+        reply = Message(MessageType.MEDIA_FETCH, {'hash': key, 'value': value}, "SERVER", received_msg.emitter)
+        server.send_message(client, reply.to_json())
+
+    def media_port(self):
+        return self.media_http.port if self.media_http is not None else None
+
+    def authorize_media(self, token):
+        """Dépôt HTTP d'un média : réservé aux clients qui ont une session"""
+        return self.sessions.get_by_token(token) is not None
+
+    def is_admin(self, client):
+        return any(a.get('id') == client.get('id') for a in self.admin_clients)
+
+    def handle_admin_stats(self, client, server, received_msg):
+        """Renvoie les compteurs de traitement par type de message à l'admin"""
+        if not self.is_admin(client):
+            return
+        if isinstance(received_msg.value, dict) and received_msg.value.get('reset'):
+            self.dispatch_stats.reset()
+        msg = Message(MessageType.ADMIN.STATS, emitter="SERVER", receiver="ADMIN", value=self.dispatch_stats.snapshot())
+        server.send_message(client, msg.to_json())
+
+    def handle_admin_profile_start(self, client, server, received_msg):
+        """Démarre une session d'échantillonnage des piles, résultat envoyé à l'admin demandeur"""
+        if not self.is_admin(client):
+            return
+        options = received_msg.value if isinstance(received_msg.value, dict) else {}
+        duration = min(max(float(options.get('duration', 10)), 1), 60)
+        interval = min(max(float(options.get('interval_ms', 5)), 1), 100) / 1000.0
+
+        def send_result(result):
+            msg = Message(MessageType.ADMIN.PROFILE_RESULT, emitter="SERVER", receiver="ADMIN", value=result)
+            try:
+                self.server.send_message(client, msg.to_json())
+            except:
+                pass
+
+        if self.profiler.start(duration, on_finished=send_result, interval=interval):
+            print(f"[info] Profilage démarré pour {duration}s")
+        else:
+            warning = Message.warning("SERVER", "Profilage déjà en cours", "ADMIN")
+            server.send_message(client, warning.to_json())
+
+    def handle_admin_profile_stop(self, client, server, received_msg):
+        if not self.is_admin(client):
+            return
+        self.profiler.stop()
 
     def input_loop(self):
         print("\nChat serveur démarré. Tapez 'dest:message' pour envoyer (ex: Client:bonjour)")
         print("Tapez 'img:dest:chemin' pour envoyer une image (ex: img:Client:/path/image.png)")
         print("Tapez 'audio:dest:chemin' pour envoyer un audio (ex: audio:Client:/path/audio.mp3)")
         print("Tapez 'video:dest:chemin' pour envoyer une video (ex: video:Client:/path/video.mp4)")
-        print("Tapez 'list' pour voir les clients connectés, 'disconnect' pour quitter.\n")
+        print("Tapez 'list' pour voir les clients connectés, 'disconnect' pour quitter (drain).")
+        print("Tapez 'restart' pour redémarrer sans coupure (Linux : la socket d'écoute est transmise).")
+        print(f"Sans console : kill -HUP {os.getpid()} pour restart, kill -TERM {os.getpid()} pour drain.\n")
         while self.running:
             try:
                 print("[SERVER] > ", end="", flush=True)
                 user_input = input()
                 if user_input.lower() == "disconnect":
-                    self.running = False
-                    self.server.shutdown_gracefully()
+                    self.drain()
                     break
+                elif user_input.lower() == "restart":
+                    if self.restart():
+                        break
                 elif user_input.lower() == "list":
                     print(f"Clients connectés: {list(self.clients.keys())}")
                 elif user_input.lower().startswith("img:"):
@@ -265,7 +800,7 @@ class WSServer:
                     dest = dest.strip()
                     value = value.strip()
                     if dest.lower() == "ALL":
-                        for name, client in self.clients.items():
+                        for name, client in list(self.clients.items()):
                             msg = Message(MessageType.RECEPTION.TEXT, emitter="SERVER", receiver=name, value=value)
                             self.server.send_message(client, msg.to_json())
                         print(f"[envoyé à tous] {value}")
@@ -280,23 +815,129 @@ class WSServer:
                 else:
                     print("Format: 'dest:message' ou 'ALL:message' pour broadcast")
             except EOFError:
+                # Pas de console (processus relancé par restart, service...) : les signaux prennent le relais
+                print(f"\n[info] Console fermée : kill -HUP {os.getpid()} pour restart, kill -TERM {os.getpid()} pour drain")
                 break
 
+    def install_signal_handlers(self):
+        """SIGTERM : drain, SIGHUP : restart. Seul moyen de piloter un processus relancé
+        par restart, dont l'entrée standard n'est plus la console."""
+        if threading.current_thread() is not threading.main_thread():
+            return
+        signal.signal(signal.SIGTERM, lambda signum, frame: self.on_signal(self.drain))
+        if hasattr(signal, "SIGHUP"):
+            signal.signal(signal.SIGHUP, lambda signum, frame: self.on_signal(self.restart))
+
+    def on_signal(self, action):
+        # Le gestionnaire tourne dans le thread principal, celui de run_forever : drain et restart
+        # attendent la fin de cette boucle (shutdown), ils partent donc sur un autre thread
+        if self.draining or not self.running:
+            return
+        threading.Thread(target=action).start()
+
     def start(self):
         print(f"Serveur WS sur ws://{self.host}:{self.port}")
         self.running = True
+        if self.media_http is not None:
+            self.media_http.start()
+            print(f"Médias HTTP sur http://{self.host}:{self.media_http.port}/media/")
 
+        self.install_signal_handlers()
         input_thread = threading.Thread(target=self.input_loop, daemon=True)
         input_thread.start()
 
+        self.notify_ready()
         self.server.run_forever()
+        # La boucle d'acceptation s'arrête avant la fin du drain : on attend les clients restants
+        if self.draining:
+            self.stopped.wait()
+
+    def drain(self, timeout=10.0, jitter=5.0, restart=False):
+        """Arrêt progressif : n'accepte plus, termine les messages en cours, puis
+        demande aux clients de se reconnecter avec un délai aléatoire (0..jitter s)
+        pour éviter qu'ils reviennent tous en même temps."""
+        print(f"[info] Drain en cours ({len(self.clients)} clients)")
+        self.draining = True
+        self.running = False
+        if restart:
+            # Le nouveau processus accepte déjà sur la même socket : on arrête d'accepter ici
+            self.server.shutdown()
+        else:
+            self.server.deny_new_connections(status=1013, reason=b"draining")
+
+        # Attend que les routages en cours (médias compris) soient terminés
+        deadline = time.monotonic() + timeout
+        while self.inflight > 0 and time.monotonic() < deadline:
+            time.sleep(0.05)
+
+        for name, client in list(self.clients.items()):
+            delay_ms = random.randint(0, int(jitter * 1000))
+            try:
+                self.server.send_message(client, Message.reconnect(delay_ms).to_json())
+            except:
+                pass
+
+        self.server.disconnect_clients_gracefully()
+        self.server.server_close()
+        if self.media_http is not None:
+            self.media_http.stop()
+        if not restart:
+            self.server.shutdown()
+        print("[info] Drain terminé")
+        self.stopped.set()
+
+    def restart(self, timeout=10.0):
+        """Redémarrage sans coupure (Linux) : un nouveau processus hérite de la
+        socket d'écoute, puis celui-ci draine ses clients vers le nouveau."""
+        if not sys.platform.startswith("linux"):
+            print("[erreur] restart n'est supporté que sous Linux, utilisez 'disconnect'")
+            return False
+
+        listen_fd = self.server.socket.fileno()
+        ready_r, ready_w = os.pipe()
+        env = dict(os.environ)
+        env[LISTEN_FD_ENV] = str(listen_fd)
+        env[READY_FD_ENV] = str(ready_w)
+        # Le nouveau processus survit à la fermeture du terminal et ne lit pas la console
+        # (le shell la reprend à la sortie de celui-ci) : il se pilote par signaux (SIGHUP / SIGTERM)
+        proc = subprocess.Popen(
+            [sys.executable] + sys.argv,
+            pass_fds=(listen_fd, ready_w),
+            env=env,
+            stdin=subprocess.DEVNULL,
+            start_new_session=True,
+        )
+        os.close(ready_w)
+
+        readable, _, _ = select.select([ready_r], [], [], timeout)
+        ready = bool(readable) and os.read(ready_r, 16) == b"ready"
+        os.close(ready_r)
+        if not ready:
+            print("[erreur] Le nouveau processus n'a pas démarré, restart annulé")
+            proc.kill()
+            return False
+
+        print(f"[info] Nouveau processus prêt (pid={proc.pid}) : kill -HUP {proc.pid} pour restart, kill -TERM {proc.pid} pour drain")
+        self.drain(timeout=timeout, restart=True)
+        return True
+
+    def notify_ready(self):
+        """Prévient l'ancien processus (restart) que la boucle d'acceptation démarre"""
+        ready_fd = os.environ.pop(READY_FD_ENV, None)
+        if ready_fd is None:
+            return
+        try:
+            os.write(int(ready_fd), b"ready")
+            os.close(int(ready_fd))
+        except OSError:
+            pass
 
     def send_image(self, filepath, dest):
         with open(filepath, "rb") as f:
             img_base64 = base64.b64encode(f.read()).decode("utf-8")
         value = f"IMG:{img_base64}"
         if dest.lower() == "ALL":
-            for name, client in self.clients.items():
+            for name, client in list(self.clients.items()):
                 msg = Message(MessageType.RECEPTION.IMAGE, emitter="SERVER", receiver=name, value=value)
                 self.server.send_message(client, msg.to_json())
             print(f"[image envoyée à tous]")
@@ -314,7 +955,7 @@ class WSServer:
             audio_base64 = base64.b64encode(f.read()).decode("utf-8")
         value = f"AUDIO:{audio_base64}"
         if dest.lower() == "ALL":
-            for name, client in self.clients.items():
+            for name, client in list(self.clients.items()):
                 msg = Message(MessageType.RECEPTION.AUDIO, emitter="SERVER", receiver=name, value=value)
                 self.server.send_message(client, msg.to_json())
             print(f"[audio envoyé à tous]")
@@ -332,7 +973,7 @@ class WSServer:
             video_base64 = base64.b64encode(f.read()).decode("utf-8")
         value = f"VIDEO:{video_base64}"
         if dest.lower() == "ALL":
-            for name, client in self.clients.items():
+            for name, client in list(self.clients.items()):
                 msg = Message(MessageType.RECEPTION.VIDEO, emitter="SERVER", receiver=name, value=value)
                 self.server.send_message(client, msg.to_json())
             print(f"[video envoyée à tous]")
@@ -354,5 +995,6 @@ class WSServer:
         return WSServer(Context.prod())
 
 if __name__ == "__main__":
-    ws_server = WSServer.dev()
+    # dev() par défaut, surchargé par $WS_CONFIG (JSON) et les variables WS_* (ex: WS_PROFILE=low_latency)
+    ws_server = WSServer(Context.load())
     ws_server.start()
\ No newline at end of file
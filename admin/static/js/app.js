@@ -21,7 +21,12 @@ const MessageType = {
         ROUTING_LOG: 'ADMIN_ROUTING_LOG',
         CLIENT_CONNECTED: 'ADMIN_CLIENT_CONNECTED',
         CLIENT_DISCONNECTED: 'ADMIN_CLIENT_DISCONNECTED',
-        CLIENT_LIST_FULL: 'ADMIN_CLIENT_LIST_FULL'
+        CLIENT_LIST_FULL: 'ADMIN_CLIENT_LIST_FULL',
+        STATS: 'ADMIN_STATS',
+        PROFILE_START: 'ADMIN_PROFILE_START',
+        PROFILE_STOP: 'ADMIN_PROFILE_STOP',
+        PROFILE_RESULT: 'ADMIN_PROFILE_RESULT',
+        OVERLOAD: 'ADMIN_OVERLOAD'
     }
 };
 
@@ -295,6 +300,7 @@ class AdminClient {
         // Status elements
         this.statusDot = document.getElementById('statusDot');
         this.statusText = document.getElementById('statusText');
+        this.loadBadge = document.getElementById('loadBadge');
 
         // Client cards
         this.clientCards = document.getElementById('clientCards');
@@ -313,6 +319,13 @@ class AdminClient {
 
         // Environment selector
         this.envSelect = document.getElementById('envSelect');
+
+        // Performance panel
+        this.statsBtn = document.getElementById('statsBtn');
+        this.profileBtn = document.getElementById('profileBtn');
+        this.profileStopBtn = document.getElementById('profileStopBtn');
+        this.perfOutput = document.getElementById('perfOutput');
+        this.profileDownload = document.getElementById('profileDownload');
     }
 
     initEventListeners() {
@@ -322,6 +335,9 @@ class AdminClient {
         this.envSelect.addEventListener('change', (e) => {
             this.currentEnv = e.target.value;
         });
+        this.statsBtn.addEventListener('click', () => this.requestStats());
+        this.profileBtn.addEventListener('click', () => this.startProfiling(10));
+        this.profileStopBtn.addEventListener('click', () => this.stopProfiling());
     }
 
     initNetworkGraph() {
@@ -425,6 +441,18 @@ class AdminClient {
                 this.handleFullClientList(data);
                 break;
 
+            case MessageType.ADMIN.STATS:
+                this.handleStats(data);
+                break;
+
+            case MessageType.ADMIN.PROFILE_RESULT:
+                this.handleProfileResult(data);
+                break;
+
+            case MessageType.ADMIN.OVERLOAD:
+                this.handleOverload(data);
+                break;
+
             // Standard messages (fallback)
             case MessageType.RECEPTION.CLIENT_LIST:
                 this.handleClientList(data);
@@ -528,6 +556,92 @@ class AdminClient {
         }
     }
 
+    requestStats() {
+        this.sendAdmin(MessageType.ADMIN.STATS, '');
+    }
+
+    startProfiling(duration) {
+        this.sendAdmin(MessageType.ADMIN.PROFILE_START, { duration: duration, interval_ms: 5 });
+        this.profileBtn.disabled = true;
+        this.profileStopBtn.disabled = false;
+        this.perfOutput.innerHTML = `<div class="empty-state"><span>Profilage en cours (${duration}s)...</span></div>`;
+    }
+
+    stopProfiling() {
+        this.sendAdmin(MessageType.ADMIN.PROFILE_STOP, '');
+    }
+
+    sendAdmin(type, value) {
+        this.send({
+            message_type: type,
+            data: {
+                emitter: this.username,
+                receiver: 'SERVER',
+                value: value
+            }
+        });
+    }
+
+    handleStats(data) {
+        const stats = data.value || {};
+        const types = Object.keys(stats).sort((a, b) => stats[b].total_ms - stats[a].total_ms);
+        if (types.length === 0) {
+            this.perfOutput.innerHTML = `<div class="empty-state"><span>Aucune mesure</span></div>`;
+            return;
+        }
+        this.perfOutput.innerHTML = types.map(type => {
+            const s = stats[type];
+            return `
+                <div class="perf-row">
+                    <span class="perf-type">${this.escapeHtml(type)}</span>
+                    <span class="perf-values">${s.count} × ${s.avg_ms} ms (max ${s.max_ms})</span>
+                </div>
+            `;
+        }).join('');
+    }
+
+    handleOverload(data) {
+        const status = data.value || {};
+        this.loadBadge.hidden = false;
+        this.loadBadge.textContent = status.name;
+        this.loadBadge.className = `load-badge level-${status.level}`;
+        this.loadBadge.title = `Pression ${status.pressure} · latence ${status.latency_ms} ms · ${status.inflight} en cours · ${status.connections} connexions`;
+    }
+
+    handleProfileResult(data) {
+        const result = data.value || {};
+        this.profileBtn.disabled = !this.isConnected;
+        this.profileStopBtn.disabled = true;
+
+        // Top 10 des piles les plus fréquentes (feuille seulement pour la lisibilité)
+        const lines = (result.collapsed || '').split('\n').filter(l => l);
+        const top = lines.slice(0, 10).map(line => {
+            const idx = line.lastIndexOf(' ');
+            const frames = line.substring(0, idx).split(';');
+            return `
+                <div class="perf-row">
+                    <span class="perf-type" title="${this.escapeHtml(line.substring(0, idx))}">${this.escapeHtml(frames[frames.length - 1])}</span>
+                    <span class="perf-values">${line.substring(idx + 1)}</span>
+                </div>
+            `;
+        });
+        this.perfOutput.innerHTML = `
+            <div class="perf-row">
+                <span class="perf-type">${result.samples} échantillons</span>
+                <span class="perf-values">${result.duration}s @ ${result.interval_ms} ms</span>
+            </div>
+        ` + top.join('');
+
+        // Fichier compatible flamegraph.pl / speedscope
+        const blob = new Blob([result.collapsed || ''], { type: 'text/plain' });
+        if (this.profileDownload.href) {
+            URL.revokeObjectURL(this.profileDownload.href);
+        }
+        this.profileDownload.href = URL.createObjectURL(blob);
+        this.profileDownload.download = `profile-${Date.now()}.collapsed`;
+        this.profileDownload.hidden = false;
+    }
+
     renderCommunicationLog(entry) {
         // Remove empty state if present
         const emptyState = this.communicationLog.querySelector('.empty-state');
@@ -620,12 +734,18 @@ class AdminClient {
             this.connectBtn.disabled = true;
             this.disconnectBtn.disabled = false;
             this.envSelect.disabled = true;
+            this.statsBtn.disabled = false;
+            this.profileBtn.disabled = false;
         } else {
             this.statusDot.classList.remove('connected');
             this.statusText.textContent = 'Hors ligne';
             this.connectBtn.disabled = false;
             this.disconnectBtn.disabled = true;
             this.envSelect.disabled = false;
+            this.statsBtn.disabled = true;
+            this.profileBtn.disabled = true;
+            this.profileStopBtn.disabled = true;
+            this.loadBadge.hidden = true;
         }
     }
 
@@ -0,0 +1,119 @@
+"""
+Fluidite de la liste des messages (ChatWidget) avec un gros historique.
+
+Remplit la liste avec `--messages` messages, puis fait defiler la vue pixel par
+pixel (pas de `--step`) en repeignant a chaque pas, vers le haut jusqu'a charger
+`--pages` pages d'anciens messages. Chaque repeinte est une image : le rapport donne
+le temps par image (p50 / p99 / max) et la part d'images au-dela de 16.7 ms (60 fps).
+Necessite PyQt5 ; sans ecran, lancer avec QT_QPA_PLATFORM=offscreen.
+
+    QT_QPA_PLATFORM=offscreen python -m bench.chat_scroll --messages 100000
+        -> code de sortie 1 si le p99 depasse --budget-ms
+"""
+import argparse
+import json
+import random
+import sys
+import time
+import tracemalloc
+
+from PyQt5.QtWidgets import QApplication
+
+from gui.widgets import ChatWidget
+from gui.widgets.message_list import make_row
+
+
+WORDS = "lorem ipsum dolor sit amet consectetur adipiscing elit sed do eiusmod tempor incididunt ut labore".split()
+
+
+def random_text(rng):
+    return " ".join(rng.choice(WORDS) for _ in range(rng.randint(2, 60)))
+
+
+def percentile(sorted_values, p):
+    if not sorted_values:
+        return None
+    index = min(len(sorted_values) - 1, int(round(p / 100.0 * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+def fill(widget, app, count, rng):
+    """Texte par ChatWidget.add_message ; medias (references) directement dans le modele, sans MediaPanel"""
+    started = time.perf_counter()
+    for i in range(count):
+        if i % 50:
+            widget.add_message(f"user{i % 20}", "Everyone", random_text(rng), "text")
+        else:
+            msg_type = rng.choice(("image", "audio", "video"))
+            row = make_row(f"user{i % 20}", "Everyone", "IMG#" + "0" * 64, "12:00", msg_type)
+            widget.messages_model.append_rows([row], trim=widget.messages_view.follow)
+        if i % 1000 == 0:
+            app.processEvents()
+    app.processEvents()
+    return time.perf_counter() - started
+
+
+def scroll(widget, app, step, pages):
+    view = widget.messages_view
+    scroll_bar = view.verticalScrollBar()
+    model = widget.messages_model
+    frames = []
+    loaded = 0
+    start_first = model.first
+    while True:
+        value = scroll_bar.value() - step
+        started = time.perf_counter()
+        scroll_bar.setValue(max(scroll_bar.minimum(), value))
+        view.viewport().repaint()
+        app.processEvents()
+        frames.append((time.perf_counter() - started) * 1000)
+        loaded = (start_first - model.first) // model.page
+        if loaded >= pages or (scroll_bar.value() == scroll_bar.minimum() and not model.can_load_older()):
+            break
+    return frames, loaded
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Temps par image de la liste des messages")
+    parser.add_argument("--messages", type=int, default=100000)
+    parser.add_argument("--step", type=int, default=40, help="pixels par image")
+    parser.add_argument("--pages", type=int, default=5, help="pages d'anciens messages a charger")
+    parser.add_argument("--budget-ms", type=float, default=16.7)
+    parser.add_argument("--seed", type=int, default=1)
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    app = QApplication.instance() or QApplication(sys.argv)
+    widget = ChatWidget()
+    widget.resize(1100, 750)
+    widget.show()
+    app.processEvents()
+
+    rng = random.Random(args.seed)
+    tracemalloc.start()
+    fill_s = fill(widget, app, args.messages, rng)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    frames, loaded = scroll(widget, app, args.step, args.pages)
+    frames.sort()
+    report = {
+        'messages': args.messages,
+        'loaded_rows': widget.messages_model.rowCount(),
+        'fill_s': round(fill_s, 3),
+        'fill_peak_mb': round(peak / 1e6, 1),
+        'frames': len(frames),
+        'pages_loaded': loaded,
+        'frame_ms_p50': round(percentile(frames, 50), 2),
+        'frame_ms_p99': round(percentile(frames, 99), 2),
+        'frame_ms_max': round(frames[-1], 2),
+        'frames_over_budget': sum(1 for f in frames if f > args.budget_ms),
+    }
+    print(json.dumps(report, indent=2))
+    return 1 if report['frame_ms_p99'] > args.budget_ms else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,96 @@
+"""
+Temps de demarrage de l'interface (ChatGUI.py) jusqu'au premier affichage de l'ecran de connexion.
+
+Chaque essai est un nouveau processus : imports de PyQt5 et du paquet `gui`, construction
+de ChatApp, puis attente du premier evenement Paint de la fenetre. Le rapport donne la
+mediane de chaque etape et le temps total vu du processus parent (demarrage de Python compris),
+ainsi que les modules charges : QtMultimedia ne doit l'etre qu'au premier media.
+Sans ecran, lancer avec QT_QPA_PLATFORM=offscreen.
+
+    QT_QPA_PLATFORM=offscreen python -m bench.gui_startup --runs 10
+        -> code de sortie 1 si la mediane du total depasse --budget-ms
+"""
+import argparse
+import json
+import statistics
+import subprocess
+import sys
+import time
+
+
+def child():
+    started = time.perf_counter()
+    from PyQt5.QtCore import QEvent, QEventLoop, QObject, QTimer
+    from PyQt5.QtWidgets import QApplication
+    app = QApplication(sys.argv)
+    qt_ready = time.perf_counter()
+
+    from gui import ChatApp
+    imported = time.perf_counter()
+    window = ChatApp()
+    built = time.perf_counter()
+
+    loop = QEventLoop()
+
+    class FirstPaint(QObject):
+        def eventFilter(self, obj, event):
+            if event.type() == QEvent.Paint:
+                loop.quit()
+            return False
+
+    watcher = FirstPaint()
+    window.installEventFilter(watcher)
+    window.show()
+    QTimer.singleShot(5000, loop.quit)
+    loop.exec_()
+    painted = time.perf_counter()
+
+    print(json.dumps({
+        'qt_ms': (qt_ready - started) * 1000,
+        'import_ms': (imported - qt_ready) * 1000,
+        'construct_ms': (built - imported) * 1000,
+        'paint_ms': (painted - built) * 1000,
+        'in_process_ms': (painted - started) * 1000,
+        'modules': len(sys.modules),
+        'multimedia_loaded': 'PyQt5.QtMultimedia' in sys.modules,
+        'chat_loaded': 'gui.widgets.chat_widget' in sys.modules,
+    }))
+    app.quit()
+
+
+def run_once():
+    started = time.perf_counter()
+    out = subprocess.run([sys.executable, "-m", "bench.gui_startup", "--child"],
+                         capture_output=True, text=True, check=True).stdout
+    total_ms = (time.perf_counter() - started) * 1000
+    result = json.loads(out.strip().splitlines()[-1])
+    result['total_ms'] = total_ms
+    return result
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Temps de demarrage de l'interface de chat")
+    parser.add_argument("--runs", type=int, default=10)
+    parser.add_argument("--budget-ms", type=float, default=1000.0)
+    parser.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    if args.child:
+        child()
+        return 0
+    results = [run_once() for _ in range(args.runs)]
+    report = {'runs': args.runs}
+    for key in ('qt_ms', 'import_ms', 'construct_ms', 'paint_ms', 'in_process_ms', 'total_ms'):
+        report[key] = round(statistics.median(r[key] for r in results), 1)
+    report['modules'] = results[-1]['modules']
+    report['multimedia_loaded'] = any(r['multimedia_loaded'] for r in results)
+    report['chat_loaded'] = any(r['chat_loaded'] for r in results)
+    print(json.dumps(report, indent=2))
+    return 1 if report['total_ms'] > args.budget_ms else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,565 @@
+"""
+Generateur de charge : des milliers de clients virtuels contre un WSServer local.
+
+Chaque client virtuel est une simple connexion websocket (pas de thread par
+client) : les receptions sont multiplexees par quelques threads `selectors`,
+les envois sont cadences par un thread d'emission par worker.
+
+Exemples :
+    python -m bench.load --scenario text --clients 1000 --duration 10
+    python -m bench.load --scenario broadcast --clients 200 --senders 5
+    python -m bench.load --scenario media --clients 20 --media-size 1048576
+    python -m bench.load --scenario sensor --clients 500 --burst 20
+    python -m bench.load --scenario sensor --clients 500 --burst 20 --batch 20
+    python -m bench.load --scenario churn --clients 500 --cycles 5
+    python -m bench.load --scenario media --profile high_throughput
+
+Le rapport JSON (stdout ou --out) est stable pour etre compare entre commits.
+"""
+import argparse
+import base64
+import json
+import math
+import os
+import random
+import selectors
+import socket
+import string
+import subprocess
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import websocket
+
+from Context import Context
+from Message import Message, MessageType, SensorId
+
+SCENARIOS = ["text", "broadcast", "media", "sensor", "churn"]
+
+# Types de reception qui portent un horodatage de benchmark
+MEASURED_TYPES = [
+    MessageType.RECEPTION.TEXT,
+    MessageType.RECEPTION.IMAGE,
+    MessageType.RECEPTION.SENSOR,
+]
+
+
+def percentile(sorted_values, p):
+    """Percentile au rang le plus proche sur une liste deja triee."""
+    if not sorted_values:
+        return None
+    k = max(0, min(len(sorted_values) - 1, math.ceil(p / 100.0 * len(sorted_values)) - 1))
+    return sorted_values[k]
+
+
+def random_text(size):
+    return "".join(random.choice(string.ascii_letters) for _ in range(size))
+
+
+def stamp(payload):
+    """Prefixe la valeur avec l'instant d'emission (ns, horloge monotone locale)."""
+    return f"{time.perf_counter_ns()}|{payload}"
+
+
+def raise_fd_limit():
+    """Les milliers de sockets depassent souvent la limite par defaut (1024)."""
+    try:
+        import resource
+        soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+        if soft < hard:
+            resource.setrlimit(resource.RLIMIT_NOFILE, (hard, hard))
+    except (ImportError, ValueError, OSError):
+        pass
+
+
+class ProcessSampler:
+    """Lit CPU et RSS d'un processus via /proc (Linux uniquement)."""
+
+    def __init__(self, pid):
+        self.pid = pid
+        self.clock_ticks = os.sysconf("SC_CLK_TCK") if hasattr(os, "sysconf") else 100
+        self.start_cpu = None
+        self.start_time = None
+
+    def _cpu_seconds(self):
+        try:
+            with open(f"/proc/{self.pid}/stat") as f:
+                fields = f.read().rsplit(")", 1)[1].split()
+            # utime et stime sont les champs 14 et 15 (indices 11 et 12 apres le nom)
+            return (int(fields[11]) + int(fields[12])) / self.clock_ticks
+        except (OSError, IndexError, ValueError):
+            return None
+
+    def _status_kb(self, key):
+        try:
+            with open(f"/proc/{self.pid}/status") as f:
+                for line in f:
+                    if line.startswith(key + ":"):
+                        return int(line.split()[1])
+        except (OSError, ValueError):
+            pass
+        return None
+
+    def start(self):
+        self.start_cpu = self._cpu_seconds()
+        self.start_time = time.perf_counter()
+
+    def stop(self):
+        cpu = self._cpu_seconds()
+        elapsed = time.perf_counter() - self.start_time
+        rss = self._status_kb("VmRSS")
+        peak = self._status_kb("VmHWM")
+        cpu_percent = None
+        if cpu is not None and self.start_cpu is not None and elapsed > 0:
+            cpu_percent = round(100.0 * (cpu - self.start_cpu) / elapsed, 1)
+        return {
+            "cpu_percent": cpu_percent,
+            "rss_mb": round(rss / 1024.0, 1) if rss is not None else None,
+            "peak_rss_mb": round(peak / 1024.0, 1) if peak is not None else None,
+        }
+
+
+class VirtualClient:
+    """Un utilisateur simule : une socket websocket, aucune boucle ni thread propre."""
+
+    def __init__(self, url, username, ctx):
+        self.url = url
+        self.username = username
+        self.ctx = ctx
+        self.ws = None
+        self.declared = threading.Event()
+        self.connect_ns = None
+        self.declared_ns = None
+        self.send_lock = threading.Lock()
+
+    def connect(self):
+        self.connect_ns = time.perf_counter_ns()
+        self.ws = websocket.WebSocket(sockopt=self.ctx.socket_options())
+        self.ws.connect(self.url)
+        self.send(Message(MessageType.DECLARATION, emitter=self.username, receiver="", value=""))
+
+    def send(self, message):
+        with self.send_lock:
+            self.ws.send(message.to_json())
+
+    def send_raw(self, data):
+        with self.send_lock:
+            self.ws.send(data)
+
+    def fileno(self):
+        return self.ws.sock.fileno()
+
+    def close(self):
+        if self.ws:
+            try:
+                self.ws.close(timeout=0.5)
+            except Exception:
+                pass
+
+
+class Worker:
+    """Recoit pour un groupe de clients via un selecteur unique."""
+
+    def __init__(self, index):
+        self.index = index
+        self.clients = []
+        self.selector = selectors.DefaultSelector()
+        self.latencies_ns = []
+        self.received = 0
+        self.received_bytes = 0
+        self.errors = 0
+        self.measuring = False
+        self.running = True
+        self.thread = threading.Thread(target=self.run, name=f"bench-recv-{index}", daemon=True)
+
+    def add(self, client):
+        self.clients.append(client)
+        self.selector.register(client.ws.sock, selectors.EVENT_READ, client)
+
+    def remove_all(self):
+        for client in self.clients:
+            try:
+                self.selector.unregister(client.ws.sock)
+            except (KeyError, ValueError):
+                pass
+        self.clients = []
+
+    def run(self):
+        while self.running:
+            try:
+                events = self.selector.select(timeout=0.2)
+            except (OSError, ValueError):
+                # Une socket a ete fermee pendant la selection (churn)
+                time.sleep(0.01)
+                continue
+            for key, _ in events:
+                self.on_readable(key.data)
+
+    def on_readable(self, client):
+        try:
+            raw = client.ws.recv()
+        except Exception:
+            self.errors += 1
+            try:
+                self.selector.unregister(client.ws.sock)
+            except (KeyError, ValueError):
+                pass
+            return
+        if not raw:
+            return
+        now = time.perf_counter_ns()
+        msg = Message.from_json(raw)
+
+        if msg.message_type == MessageType.SYS_MESSAGE and msg.value == "ping":
+            client.send(Message(MessageType.SYS_MESSAGE, emitter=client.username, receiver="", value="pong"))
+            return
+        if msg.emitter == "SERVER":
+            if msg.receiver == client.username and msg.message_type == MessageType.RECEPTION.TEXT:
+                client.declared_ns = now
+                client.declared.set()
+            return
+        if not self.measuring or msg.message_type not in MEASURED_TYPES:
+            return
+        value = msg.value if isinstance(msg.value, str) else ""
+        sent_ns, sep, _ = value.partition("|")
+        if not sep or not sent_ns.isdigit():
+            return
+        self.received += 1
+        self.received_bytes += len(raw)
+        self.latencies_ns.append(now - int(sent_ns))
+
+
+class LoadRun:
+    """Prepare les clients, joue un scenario et produit le rapport."""
+
+    def __init__(self, args, url):
+        self.args = args
+        self.url = url
+        self.ctx = Context("127.0.0.1", 0, args.profile)
+        self.workers = [Worker(i) for i in range(max(1, args.workers))]
+        self.clients = []
+        self.sent = 0
+        self.sent_frames = 0
+        self.sent_bytes = 0
+        self.send_lag_s = 0.0
+        self.connect_errors = 0
+
+    # -- mise en place -------------------------------------------------
+
+    def _connect_one(self, client):
+        try:
+            client.connect()
+            return True
+        except Exception:
+            self.connect_errors += 1
+            return False
+
+    def connect_all(self, prefix="vu"):
+        self.clients = [VirtualClient(self.url, f"{prefix}{i:05d}", self.ctx) for i in range(self.args.clients)]
+        with ThreadPoolExecutor(max_workers=self.args.connect_concurrency) as pool:
+            ok = list(pool.map(self._connect_one, self.clients))
+        self.clients = [c for c, good in zip(self.clients, ok) if good]
+        for i, client in enumerate(self.clients):
+            self.workers[i % len(self.workers)].add(client)
+
+    def wait_declared(self, timeout):
+        deadline = time.perf_counter() + timeout
+        for client in self.clients:
+            remaining = deadline - time.perf_counter()
+            if remaining <= 0 or not client.declared.wait(remaining):
+                break
+        return sum(1 for c in self.clients if c.declared.is_set())
+
+    def close_all(self):
+        for worker in self.workers:
+            worker.remove_all()
+        for client in self.clients:
+            client.close()
+
+    # -- scenarios -----------------------------------------------------
+
+    def plan(self):
+        """Retourne [(client, fabrique_de_message)] pour le scenario courant."""
+        args = self.args
+        clients = self.clients
+        n = len(clients)
+        plan = []
+        if args.scenario == "text":
+            payload = random_text(args.size)
+            for i, client in enumerate(clients):
+                peer = clients[i ^ 1] if (i ^ 1) < n else clients[0]
+                plan.append((client, self._factory(client, peer.username, MessageType.ENVOI.TEXT, payload)))
+        elif args.scenario == "broadcast":
+            payload = random_text(args.size)
+            for client in clients[:max(1, args.senders)]:
+                plan.append((client, self._factory(client, "ALL", MessageType.ENVOI.TEXT, payload)))
+        elif args.scenario == "media":
+            raw = os.urandom(args.media_size)
+            payload = "IMG:" + base64.b64encode(raw).decode("utf-8")
+            for i, client in enumerate(clients):
+                peer = clients[i ^ 1] if (i ^ 1) < n else clients[0]
+                plan.append((client, self._factory(client, peer.username, MessageType.ENVOI.IMAGE, payload)))
+        elif args.scenario == "sensor":
+            # Les capteurs publient vers un puits (le premier client)
+            sink = clients[0].username
+            for client in clients[1:] or clients:
+                plan.append((client, self._sensor_factory(client, sink)))
+        return plan
+
+    @staticmethod
+    def _factory(client, receiver, message_type, payload):
+        def build():
+            return Message(message_type, emitter=client.username, receiver=receiver, value=stamp(payload)).to_json()
+        return build
+
+    def _sensor_factory(self, client, sink):
+        burst = max(1, self.args.burst)
+
+        batch = self.args.batch
+
+        def build():
+            readings = [
+                Message.sensor(client.username, SensorId.TEMPERATURE, stamp(f"{random.uniform(18, 25):.2f}"), sink)
+                for _ in range(burst)
+            ]
+            if batch <= 1:
+                return [(m.to_json(), 1) for m in readings]
+            # Une trame BATCH pour `batch` lectures
+            chunks = [readings[i:i + batch] for i in range(0, len(readings), batch)]
+            return [(Message.batch(client.username, chunk).to_json(), len(chunk)) for chunk in chunks]
+        return build
+
+    def _sender(self, entries, stop_at):
+        """Emission en boucle ouverte : une ronde toutes les 1/rate secondes."""
+        interval = 1.0 / self.args.rate if self.args.rate > 0 else 0.0
+        next_round = time.perf_counter()
+        sent = 0
+        sent_frames = 0
+        sent_bytes = 0
+        lag = 0.0
+        while time.perf_counter() < stop_at:
+            for client, build in entries:
+                frames = build()
+                if isinstance(frames, str):
+                    frames = [(frames, 1)]
+                try:
+                    for frame, count in frames:
+                        client.send_raw(frame)
+                        sent += count
+                        sent_frames += 1
+                        sent_bytes += len(frame)
+                except Exception:
+                    pass
+            if interval:
+                next_round += interval
+                delay = next_round - time.perf_counter()
+                if delay > 0:
+                    time.sleep(delay)
+                else:
+                    lag -= delay
+                    next_round = time.perf_counter()
+        return sent, sent_frames, sent_bytes, lag
+
+    def run_traffic(self):
+        plan = self.plan()
+        groups = [plan[i::len(self.workers)] for i in range(len(self.workers))]
+        groups = [g for g in groups if g]
+
+        for worker in self.workers:
+            worker.measuring = True
+        started = time.perf_counter()
+        stop_at = started + self.args.duration
+        with ThreadPoolExecutor(max_workers=len(groups)) as pool:
+            results = list(pool.map(lambda g: self._sender(g, stop_at), groups))
+        send_elapsed = time.perf_counter() - started
+        time.sleep(self.args.drain)
+        for worker in self.workers:
+            worker.measuring = False
+
+        for sent, sent_frames, sent_bytes, lag in results:
+            self.sent += sent
+            self.sent_frames += sent_frames
+            self.sent_bytes += sent_bytes
+            self.send_lag_s += lag
+        return send_elapsed
+
+    def run_churn(self):
+        """Tempetes de connexions / deconnexions : latence connexion -> accuse de declaration."""
+        latencies_ns = []
+        joins = 0
+        started = time.perf_counter()
+        for cycle in range(max(1, self.args.cycles)):
+            self.connect_all(prefix=f"churn{cycle}_")
+            self.wait_declared(self.args.timeout)
+            for client in self.clients:
+                if client.declared.is_set():
+                    joins += 1
+                    latencies_ns.append(client.declared_ns - client.connect_ns)
+            self.close_all()
+            time.sleep(self.args.drain)
+        elapsed = time.perf_counter() - started
+        self.sent = joins
+        self.workers[0].latencies_ns = latencies_ns
+        self.workers[0].received = joins
+        return elapsed
+
+    # -- rapport -------------------------------------------------------
+
+    def report(self, elapsed, server_stats):
+        latencies = sorted(ns for w in self.workers for ns in w.latencies_ns)
+        received = sum(w.received for w in self.workers)
+        received_bytes = sum(w.received_bytes for w in self.workers)
+        to_ms = lambda ns: round(ns / 1e6, 3) if ns is not None else None
+        args = self.args
+        return {
+            "scenario": args.scenario,
+            "commit": git_commit(),
+            "params": {
+                "profile": args.profile,
+                "clients": args.clients,
+                "connected": len(self.clients),
+                "workers": len(self.workers),
+                "duration_s": args.duration,
+                "rate_per_client": args.rate,
+                "size": args.size,
+                "media_size": args.media_size,
+                "senders": args.senders,
+                "burst": args.burst,
+                "batch": args.batch,
+                "cycles": args.cycles,
+            },
+            "elapsed_s": round(elapsed, 3),
+            "sent": self.sent,
+            "received": received,
+            "throughput_msgs_s": round(received / elapsed, 1) if elapsed else None,
+            "send_rate_msgs_s": round(self.sent / elapsed, 1) if elapsed else None,
+            "sent_frames": self.sent_frames,
+            "send_rate_frames_s": round(self.sent_frames / elapsed, 1) if elapsed else None,
+            "throughput_mb_s": round(received_bytes / elapsed / 1e6, 3) if elapsed else None,
+            "send_lag_s": round(self.send_lag_s, 3),
+            "latency_ms": {
+                "p50": to_ms(percentile(latencies, 50)),
+                "p95": to_ms(percentile(latencies, 95)),
+                "p99": to_ms(percentile(latencies, 99)),
+                "max": to_ms(latencies[-1] if latencies else None),
+            },
+            "server": server_stats,
+            "errors": {
+                "connect": self.connect_errors,
+                "receive": sum(w.errors for w in self.workers),
+            },
+        }
+
+
+def git_commit():
+    try:
+        out = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, timeout=5)
+        return out.stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def start_local_server(port, profile):
+    """Demarre `bench.serve` dans un processus separe et attend qu'il ecoute."""
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    proc = subprocess.Popen(
+        [sys.executable, "-m", "bench.serve", "--port", str(port), "--profile", profile],
+        cwd=root,
+        stdin=subprocess.DEVNULL,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+    deadline = time.time() + 10
+    while time.time() < deadline:
+        try:
+            with socket.create_connection(("127.0.0.1", port), timeout=0.2):
+                return proc
+        except OSError:
+            if proc.poll() is not None:
+                break
+            time.sleep(0.05)
+    proc.kill()
+    raise RuntimeError("Le serveur de benchmark n'a pas demarre")
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Generateur de charge pour WSServer")
+    parser.add_argument("--scenario", choices=SCENARIOS, default="text")
+    parser.add_argument("--clients", type=int, default=100)
+    parser.add_argument("--workers", type=int, default=4, help="threads de reception/emission")
+    parser.add_argument("--duration", type=float, default=10.0)
+    parser.add_argument("--rate", type=float, default=1.0, help="messages/s par emetteur (0 = au plus vite)")
+    parser.add_argument("--size", type=int, default=64, help="taille du texte (octets)")
+    parser.add_argument("--media-size", type=int, default=256 * 1024, help="taille brute des medias (octets)")
+    parser.add_argument("--senders", type=int, default=1, help="emetteurs pour le scenario broadcast")
+    parser.add_argument("--burst", type=int, default=10, help="lectures par rafale (scenario sensor)")
+    parser.add_argument("--batch", type=int, default=1, help="lectures par trame BATCH (scenario sensor, 1 = sans lot)")
+    parser.add_argument("--cycles", type=int, default=3, help="tempetes de connexion (scenario churn)")
+    parser.add_argument("--connect-concurrency", type=int, default=32)
+    parser.add_argument("--timeout", type=float, default=30.0, help="attente max des declarations")
+    parser.add_argument("--drain", type=float, default=2.0, help="attente des messages en vol")
+    parser.add_argument("--profile", choices=sorted(Context.PROFILES), default="default",
+                        help="profil transport (Context) du serveur local et des clients")
+    parser.add_argument("--url", default=None, help="serveur existant (sinon un serveur local est lance)")
+    parser.add_argument("--out", default=None, help="fichier JSON de sortie")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    raise_fd_limit()
+
+    proc = None
+    url = args.url
+    if url is None:
+        port = free_port()
+        proc = start_local_server(port, args.profile)
+        url = f"ws://127.0.0.1:{port}"
+
+    run = LoadRun(args, url)
+    for worker in run.workers:
+        worker.thread.start()
+
+    sampler = ProcessSampler(proc.pid) if proc else None
+    try:
+        if args.scenario == "churn":
+            if sampler:
+                sampler.start()
+            elapsed = run.run_churn()
+        else:
+            run.connect_all()
+            run.wait_declared(args.timeout)
+            time.sleep(0.5)  # laisse passer les diffusions de liste de clients
+            if sampler:
+                sampler.start()
+            elapsed = run.run_traffic()
+        server_stats = sampler.stop() if sampler else None
+    finally:
+        run.close_all()
+        for worker in run.workers:
+            worker.running = False
+        if proc:
+            proc.terminate()
+            try:
+                proc.wait(timeout=5)
+            except subprocess.TimeoutExpired:
+                proc.kill()
+
+    report = run.report(elapsed, server_stats)
+    output = json.dumps(report, indent=2, sort_keys=True)
+    if args.out:
+        with open(args.out, "w") as f:
+            f.write(output + "\n")
+    print(output)
+
+
+if __name__ == "__main__":
+    main()
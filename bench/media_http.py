@@ -0,0 +1,160 @@
+"""
+Medias par le point HTTP du serveur (MediaHTTP) contre medias dans le flux WebSocket.
+
+Un emetteur envoie un media de `--size` octets a un destinataire, puis un message texte
+toutes les `--text-interval-ms` ms pendant le transfert. Pour chaque mode, le rapport donne :
+- la latence des messages texte pendant le transfert (p50 / max) : le blocage du chat ;
+- le temps jusqu'a ce que le destinataire puisse lire le debut du media (premiers
+  `--first-bytes` octets : requete Range en mode http, message entier en mode ws) ;
+- le temps jusqu'au media complet chez le destinataire ;
+- les octets du media passes dans le flux WebSocket de l'emetteur.
+
+    python -m bench.media_http --size 50000000
+"""
+import argparse
+import contextlib
+import http.client
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from urllib.parse import urlsplit
+
+from Context import Context
+from MediaCache import MediaCache
+from Message import Message, MessageType
+from WSClient import WSClient
+
+
+class BenchClient(WSClient):
+    """WSClient sans boucle de saisie, qui note l'heure d'arrivee des messages"""
+
+    def __init__(self, ctx, username, cache_dir):
+        super().__init__(ctx, username, media_cache=MediaCache(directory=cache_dir))
+        self.text_latencies = []
+        self.media_value = None
+        self.media_at = None
+        self.sent_bytes = 0
+
+    def on_open(self, ws):
+        self.mark_open(ws)
+
+    def write(self, sock, item):
+        # MediaStream : taille de la valeur base64, sans construire le message
+        self.sent_bytes += item.encoded_size(item.size) if hasattr(item, "encoded_size") else len(item.to_json())
+        super().write(sock, item)
+
+    def on_message(self, ws, message):
+        received = time.perf_counter()
+        received_msg = Message.from_json(message)
+        if self.handle_session_message(ws, received_msg) or self.handle_media_message(ws, received_msg):
+            return
+        if received_msg.message_type == MessageType.RECEPTION.TEXT and received_msg.value.startswith("t="):
+            self.text_latencies.append((received - float(received_msg.value[2:])) * 1000)
+        elif received_msg.message_type == MessageType.RECEPTION.VIDEO:
+            self.media_value = received_msg.value
+            self.media_at = received
+
+
+def start_client(port, username, cache_dir):
+    client = BenchClient(Context("127.0.0.1", port), username, cache_dir)
+    threading.Thread(target=client.connect, daemon=True).start()
+    deadline = time.monotonic() + 10
+    while client.session_token is None and time.monotonic() < deadline:
+        time.sleep(0.01)
+    return client
+
+
+def first_bytes_ms(url, count):
+    """Temps de reponse a une requete Range sur les `count` premiers octets"""
+    parts = urlsplit(url)
+    started = time.perf_counter()
+    conn = http.client.HTTPConnection(parts.hostname, parts.port)
+    conn.request("GET", parts.path, headers={"Range": f"bytes=0-{count - 1}"})
+    conn.getresponse().read()
+    conn.close()
+    return (time.perf_counter() - started) * 1000
+
+
+def run_mode(mode, port, media_path, args, workdir):
+    sender = start_client(port, f"sender_{mode}", os.path.join(workdir, f"{mode}_sender"))
+    receiver = start_client(port, f"receiver_{mode}", os.path.join(workdir, f"{mode}_receiver"))
+    if mode == "ws":
+        sender.media_port = None  # repli sur l'envoi par le WebSocket
+    sent_before = sender.sent_bytes
+
+    started = time.perf_counter()
+    sender.send_file(media_path, receiver.username, MessageType.ENVOI.VIDEO, "VIDEO")
+    while receiver.media_value is None and time.perf_counter() - started < args.timeout:
+        sender.send(f"t={time.perf_counter()}", receiver.username)
+        time.sleep(args.text_interval_ms / 1000.0)
+    if receiver.media_value is None:
+        raise RuntimeError(f"media non recu en mode {mode}")
+    announced = (receiver.media_at - started) * 1000
+
+    link = Message.parse_media_link(receiver.media_value)
+    if link:
+        url = receiver.media_url(link[1])
+        playable = announced + first_bytes_ms(url, args.first_bytes)
+        download_started = time.perf_counter()
+        receiver.download_media(link[1])
+        complete = announced + (time.perf_counter() - download_started) * 1000
+    else:
+        # Le media n'est utilisable qu'une fois le message entier recu et decode
+        playable = complete = announced
+    # Derniers messages texte encore en vol
+    time.sleep(0.2)
+    latencies = sorted(receiver.text_latencies)
+    result = {
+        'mode': mode,
+        'texts': len(latencies),
+        'text_p50_ms': round(statistics.median(latencies), 1) if latencies else None,
+        'text_max_ms': round(latencies[-1], 1) if latencies else None,
+        'playable_ms': round(playable, 1),
+        'complete_ms': round(complete, 1),
+        'sender_ws_bytes': sender.sent_bytes - sent_before,
+    }
+    for client in (sender, receiver):
+        client.closing = True
+        client.ws.close()
+    return result
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Medias par HTTP contre medias dans le flux WebSocket")
+    parser.add_argument("--size", type=int, default=20 * 1000 * 1000)
+    parser.add_argument("--port", type=int, default=8791)
+    parser.add_argument("--first-bytes", type=int, default=256 * 1024)
+    parser.add_argument("--text-interval-ms", type=float, default=10.0)
+    parser.add_argument("--timeout", type=float, default=120.0)
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    with tempfile.TemporaryDirectory() as workdir:
+        media_path = os.path.join(workdir, "media.bin")
+        with open(media_path, "wb") as f:
+            f.write(os.urandom(args.size))
+        # HOME temporaire : le cache disque du serveur n'est pas celui de l'utilisateur
+        env = dict(os.environ, HOME=workdir)
+        server = subprocess.Popen([sys.executable, "-m", "bench.serve", "--port", str(args.port), "--media-http"],
+                                  env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        try:
+            time.sleep(1.0)
+            # Les clients affichent leur etat (clients connectes, etc.)
+            with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+                results = [run_mode(mode, args.port, media_path, args, workdir) for mode in ("ws", "http")]
+        finally:
+            server.terminate()
+            server.wait()
+    print(json.dumps({'size': args.size, 'results': results}, indent=2))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
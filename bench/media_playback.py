@@ -0,0 +1,120 @@
+"""
+Lecture des sons et videos dans MediaPanel : du message recu au media pret a lire.
+
+Compare, pour chaque taille de media et `--views` ouvertures du meme message :
+- `tempfile` : l'ancien chemin (avant le cache des medias) : decodage base64 et nouveau
+  fichier temporaire a chaque ouverture, puis un nouveau QMediaPlayer ;
+- `cache` : MediaJob actuel : le media entre une fois dans MediaCache, les ouvertures
+  suivantes ne font que retrouver son fichier ; un seul QMediaPlayer, reutilise.
+Le temps mesure va de la reception de la valeur au fichier pret (file_ready), puis,
+si QtMultimedia est disponible, jusqu'a l'etat LoadedMedia du lecteur (`player_ms`).
+Les valeurs sont completes (VIDEO:<base64>) : une reference VIDEO#<empreinte> deja
+mise en cache par WSClient prenait le fichier du cache dans les deux cas.
+Sans ecran, lancer avec QT_QPA_PLATFORM=offscreen.
+
+    QT_QPA_PLATFORM=offscreen python -m bench.media_playback --views 5
+"""
+import argparse
+import base64
+import json
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+from PyQt5.QtCore import QEventLoop, QTimer, QUrl
+from PyQt5.QtWidgets import QApplication
+
+from MediaCache import MediaCache
+from gui.widgets.media_loader import MediaJob
+
+
+class TempFileJob(MediaJob):
+    """MediaJob d'avant le cache : chaque ouverture decode et ecrit un fichier temporaire"""
+
+    def load_file(self):
+        data = self.media_bytes()
+        fd, path = tempfile.mkstemp(suffix=".mp4")
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+        self.signals.file_ready.emit(self.job_id, self.kind, path)
+
+
+def multimedia():
+    try:
+        from PyQt5.QtMultimedia import QMediaContent, QMediaPlayer
+    except ImportError:
+        return None
+    return QMediaContent, QMediaPlayer
+
+
+def wait_loaded(player, timeout_ms=5000):
+    loop = QEventLoop()
+    done = lambda status: loop.quit() if status in (player.LoadedMedia, player.BufferedMedia, player.InvalidMedia) else None
+    player.mediaStatusChanged.connect(done)
+    QTimer.singleShot(timeout_ms, loop.quit)
+    if player.mediaStatus() not in (player.LoadedMedia, player.BufferedMedia):
+        loop.exec_()
+    player.mediaStatusChanged.disconnect(done)
+
+
+def open_once(job_class, value, cache, player, qt_media):
+    """(ms jusqu'au fichier pret, ms jusqu'au lecteur pret ou None, chemin)"""
+    paths = []
+    job = job_class(1, "video", value, cache, None)
+    job.signals.file_ready.connect(lambda job_id, kind, path: paths.append(path))
+    started = time.perf_counter()
+    job.run()
+    file_ms = (time.perf_counter() - started) * 1000
+    player_ms = None
+    if qt_media is not None and paths:
+        QMediaContent, QMediaPlayer = qt_media
+        if player is None:
+            player = QMediaPlayer()  # ancien MediaPanel : un lecteur par media
+        player.setMedia(QMediaContent(QUrl.fromLocalFile(paths[0])))
+        wait_loaded(player)
+        player_ms = (time.perf_counter() - started) * 1000
+        player.setMedia(QMediaContent())
+    return file_ms, player_ms, paths[0] if paths else None
+
+
+def bench_size(size, args, workdir):
+    value = "VIDEO:" + base64.b64encode(os.urandom(size)).decode("ascii")
+    qt_media = multimedia()
+    result = {'size': size}
+    for mode, job_class in (('tempfile', TempFileJob), ('cache', MediaJob)):
+        cache = MediaCache(directory=os.path.join(workdir, f"{mode}_{size}")) if mode == 'cache' else None
+        player = qt_media[1]() if qt_media is not None and mode == 'cache' else None
+        files, players = [], []
+        for _ in range(args.views):
+            file_ms, player_ms, path = open_once(job_class, value, cache, player, qt_media)
+            files.append(file_ms)
+            if player_ms is not None:
+                players.append(player_ms)
+            if mode == 'tempfile' and path:
+                os.remove(path)
+        result[f'{mode}_first_ms'] = round(files[0], 2)
+        result[f'{mode}_again_ms'] = round(statistics.median(files[1:]), 2) if len(files) > 1 else None
+        result[f'{mode}_player_ms'] = round(statistics.median(players), 2) if players else None
+    return result
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Lecture des medias dans MediaPanel")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000 * 1000, 8 * 1000 * 1000, 32 * 1000 * 1000])
+    parser.add_argument("--views", type=int, default=5, help="ouvertures du meme message")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    app = QApplication.instance() or QApplication(sys.argv)
+    with tempfile.TemporaryDirectory() as workdir:
+        results = [bench_size(size, args, workdir) for size in args.sizes]
+    print(json.dumps({'views': args.views, 'multimedia': multimedia() is not None, 'results': results}, indent=2))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,188 @@
+"""
+Micro-benchmarks du chemin chaud : Message.to_json / from_json et routage
+WSServer.on_message_received, mesures isolement avec un faux serveur en memoire.
+
+    python -m bench.micro                          # resultats JSON sur stdout
+    python -m bench.micro --save baseline.json     # enregistre une reference
+    python -m bench.micro --baseline baseline.json --threshold 0.25
+        -> code de sortie 1 si un benchmark est plus de 25% plus lent
+"""
+import argparse
+import base64
+import contextlib
+import gc
+import json
+import os
+import random
+import statistics
+import sys
+import time
+
+from Context import Context
+from Message import Message, MessageType, SensorId
+from WSServer import WSServer
+
+
+class FakeServer:
+    """Remplace WebsocketServer : memorise seulement le volume envoye."""
+
+    def __init__(self):
+        self.sent = 0
+        self.sent_bytes = 0
+
+    def set_fn_new_client(self, fn):
+        pass
+
+    def set_fn_client_left(self, fn):
+        pass
+
+    def set_fn_message_received(self, fn):
+        pass
+
+    def send_message(self, client, msg):
+        self.sent += 1
+        self.sent_bytes += len(msg)
+
+
+def fake_client(client_id):
+    return {'id': client_id, 'handler': None, 'address': ("127.0.0.1", 40000 + client_id)}
+
+
+def build_server(n_clients):
+    """WSServer branche sur un FakeServer avec `n_clients` utilisateurs declares."""
+    # Sans apercus : le routage est mesure sur le thread appelant (apercus : bench.previews)
+    ws_server = WSServer(Context("127.0.0.1", 0), server=FakeServer())
+    for i in range(n_clients):
+        ws_server.clients[f"user{i:04d}"] = fake_client(i)
+    return ws_server
+
+
+# Charges realistes ---------------------------------------------------------
+
+rng = random.Random(1234)
+SHORT_TEXT = "Salut, tu es dispo pour la reunion de 14h ?"
+IMAGE_1MB = "IMG:" + base64.b64encode(bytes(rng.getrandbits(8) for _ in range(1024 * 1024))).decode("utf-8")
+SENSOR_VALUE = "21.37"
+CLIENT_LIST_1000 = [f"user{i:04d}" for i in range(1000)]
+
+MSG_TEXT = Message(MessageType.ENVOI.TEXT, emitter="user0000", receiver="user0001", value=SHORT_TEXT)
+MSG_TEXT_ALL = Message(MessageType.ENVOI.TEXT, emitter="user0000", receiver="ALL", value=SHORT_TEXT)
+MSG_IMAGE = Message(MessageType.ENVOI.IMAGE, emitter="user0000", receiver="user0001", value=IMAGE_1MB)
+MSG_SENSOR = Message.sensor("user0000", SensorId.TEMPERATURE, SENSOR_VALUE, "user0001")
+MSG_CLIENT_LIST = Message(MessageType.RECEPTION.CLIENT_LIST, emitter="SERVER", receiver="ALL", value=CLIENT_LIST_1000)
+
+JSON_TEXT = MSG_TEXT.to_json()
+JSON_TEXT_ALL = MSG_TEXT_ALL.to_json()
+JSON_IMAGE = MSG_IMAGE.to_json()
+JSON_SENSOR = MSG_SENSOR.to_json()
+JSON_CLIENT_LIST = MSG_CLIENT_LIST.to_json()
+# 50 lectures capteur dans une trame BATCH, a comparer a 50 x route.sensor_1to1
+JSON_SENSOR_BATCH_50 = Message.batch("user0000", [MSG_SENSOR] * 50).to_json()
+
+
+def routing(n_clients, raw):
+    ws_server = build_server(n_clients)
+    client = ws_server.clients["user0000"]
+    return lambda: ws_server.on_message_received(client, ws_server.server, raw)
+
+
+# name -> (fabrique de la fonction a mesurer, iterations par repetition)
+BENCHMARKS = {
+    "encode.text": (lambda: MSG_TEXT.to_json, 20000),
+    "decode.text": (lambda: lambda: Message.from_json(JSON_TEXT), 20000),
+    "encode.image_1mb": (lambda: MSG_IMAGE.to_json, 50),
+    "decode.image_1mb": (lambda: lambda: Message.from_json(JSON_IMAGE), 50),
+    "encode.sensor": (lambda: MSG_SENSOR.to_json, 20000),
+    "decode.sensor": (lambda: lambda: Message.from_json(JSON_SENSOR), 20000),
+    "encode.client_list_1000": (lambda: MSG_CLIENT_LIST.to_json, 500),
+    "decode.client_list_1000": (lambda: lambda: Message.from_json(JSON_CLIENT_LIST), 500),
+    "route.text_1to1": (lambda: routing(2, JSON_TEXT), 5000),
+    "route.text_all_1000": (lambda: routing(1000, JSON_TEXT_ALL), 20),
+    "route.image_1mb_1to1": (lambda: routing(2, JSON_IMAGE), 20),
+    "route.sensor_1to1": (lambda: routing(2, JSON_SENSOR), 5000),
+    "route.sensor_batch_50": (lambda: routing(2, JSON_SENSOR_BATCH_50), 200),
+}
+
+
+def measure(fn, iterations, repeats):
+    """Temps par operation (ns) pour chaque repetition, GC desactive comme timeit."""
+    fn()  # echauffement
+    samples = []
+    gc_was_enabled = gc.isenabled()
+    gc.disable()
+    try:
+        for _ in range(repeats):
+            start = time.perf_counter_ns()
+            for _ in range(iterations):
+                fn()
+            samples.append((time.perf_counter_ns() - start) / iterations)
+    finally:
+        if gc_was_enabled:
+            gc.enable()
+    return samples
+
+
+def run(selected, repeats, scale):
+    results = {}
+    # on_message_received affiche chaque message : on mesure le routage, pas le terminal
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        for name in selected:
+            factory, iterations = BENCHMARKS[name]
+            samples = measure(factory(), max(1, int(iterations * scale)), repeats)
+            results[name] = {
+                "median_ns": round(statistics.median(samples)),
+                "min_ns": round(min(samples)),
+                "stdev_pct": round(100.0 * statistics.pstdev(samples) / statistics.mean(samples), 1),
+            }
+    return results
+
+
+def compare(results, baseline, threshold):
+    """Retourne la liste des benchmarks plus lents que la reference au-dela du seuil."""
+    regressions = []
+    for name, result in results.items():
+        reference = baseline.get("results", {}).get(name)
+        if not reference:
+            continue
+        ratio = result["median_ns"] / reference["median_ns"]
+        result["baseline_median_ns"] = reference["median_ns"]
+        result["ratio"] = round(ratio, 3)
+        if ratio > 1.0 + threshold:
+            regressions.append(name)
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Micro-benchmarks Message / WSServer")
+    parser.add_argument("--filter", default="", help="ne lance que les benchmarks contenant ce texte")
+    parser.add_argument("--repeats", type=int, default=5)
+    parser.add_argument("--scale", type=float, default=1.0, help="multiplie le nombre d'iterations")
+    parser.add_argument("--save", default=None, help="enregistre les resultats comme reference")
+    parser.add_argument("--baseline", default=None, help="fichier de reference a comparer")
+    parser.add_argument("--threshold", type=float, default=0.25, help="tolerance relative (0.25 = +25%%)")
+    args = parser.parse_args(argv)
+
+    selected = sorted(name for name in BENCHMARKS if args.filter in name)
+    report = {"python": sys.version.split()[0], "repeats": args.repeats, "results": run(selected, args.repeats, args.scale)}
+
+    regressions = []
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        regressions = compare(report["results"], baseline, args.threshold)
+        report["threshold"] = args.threshold
+        report["regressions"] = regressions
+
+    output = json.dumps(report, indent=2, sort_keys=True)
+    if args.save:
+        with open(args.save, "w") as f:
+            f.write(output + "\n")
+    print(output)
+
+    if regressions:
+        print(f"[regression] {', '.join(regressions)}", file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
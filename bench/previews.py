@@ -0,0 +1,151 @@
+"""
+Apercus des images cote serveur (Preview.py) : octets envoyes et temps de decodage
+gagnes par les destinataires, et cout pour le serveur.
+
+Pour chaque image (photos synthetiques de plusieurs tailles, ou `--image`), mesure :
+- la taille du message recu par chaque destinataire, original ou apercu, et le total
+  pour `--receivers` destinataires (envoi a ALL) ;
+- le temps de generation de l'apercu sur le pool (Pillow) ;
+- le temps pendant lequel le thread de l'emetteur est occupe par le routage, avec et
+  sans apercus, et le temps jusqu'a la derniere livraison (faux serveur en memoire) ;
+- le decodage cote destinataire en vignette de 250 px (QImage, si PyQt5 est present),
+  original contre apercu.
+Necessite Pillow.
+
+    python -m bench.previews --receivers 20
+"""
+import argparse
+import base64
+import contextlib
+import io
+import json
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+from PIL import Image
+
+from Context import Context
+from Message import Message, MessageType
+from WSServer import WSServer
+from bench.micro import FakeServer, fake_client
+
+
+def synthetic_photo(width, height, quality=90):
+    """JPEG proche d'une photo : degrades et bruit, qui se compriment mal"""
+    noise = Image.effect_noise((width, height), 48).convert("RGB")
+    gradient = Image.linear_gradient("L").resize((width, height)).convert("RGB")
+    image = Image.blend(noise, gradient, 0.6)
+    out = io.BytesIO()
+    image.save(out, "JPEG", quality=quality)
+    return out.getvalue()
+
+
+def median_ms(fn, runs):
+    times = []
+    for _ in range(runs):
+        started = time.perf_counter()
+        fn()
+        times.append((time.perf_counter() - started) * 1000)
+    return round(statistics.median(times), 2)
+
+
+def build_server(receivers, preview_workers):
+    ctx = Context("127.0.0.1", 0, preview_workers=preview_workers)
+    ws_server = WSServer(ctx, server=FakeServer())
+    for i in range(receivers + 1):
+        ws_server.clients[f"user{i:04d}"] = fake_client(i)
+    return ws_server
+
+
+def route_once(ws_server, data, receivers):
+    """(ms thread emetteur, ms jusqu'a la derniere livraison, octets par destinataire)"""
+    # Une image differente a chaque essai : ni apercu ni original deja connus du serveur
+    value = "IMG:" + base64.b64encode(data + bytes(8) + time.perf_counter_ns().to_bytes(8, "big")).decode("ascii")
+    message = Message(MessageType.ENVOI.IMAGE, emitter="user0000", receiver="ALL", value=value).to_json()
+    fake = ws_server.server
+    fake.sent = fake.sent_bytes = 0
+    started = time.perf_counter()
+    ws_server.on_message_received(fake_client(0), fake, message)
+    returned = time.perf_counter()
+    # L'emetteur recoit aussi sa copie (diffusion a ALL)
+    while fake.sent < receivers + 1:
+        time.sleep(0.0002)
+    delivered = time.perf_counter()
+    return (returned - started) * 1000, (delivered - started) * 1000, fake.sent_bytes // fake.sent
+
+
+def decode_thumbnail_ms(data, runs):
+    try:
+        from PyQt5.QtCore import Qt
+        from PyQt5.QtGui import QImage
+    except ImportError:
+        return None
+
+    def decode():
+        image = QImage()
+        image.loadFromData(data)
+        image.scaledToWidth(250, Qt.SmoothTransformation)
+    return median_ms(decode, runs)
+
+
+def bench_image(name, data, args):
+    pool_server = build_server(args.receivers, 2)
+    plain_server = build_server(args.receivers, None)
+    key = "0" * 64
+    preview_b64 = pool_server.previews.make(key, data)
+    preview = base64.b64decode(preview_b64)
+
+    routed = {'plain': [], 'preview': []}
+    for _ in range(args.runs):
+        routed['plain'].append(route_once(plain_server, data, args.receivers))
+        routed['preview'].append(route_once(pool_server, data, args.receivers))
+    pool_server.previews.shutdown()
+
+    result = {
+        'image': name,
+        'original_bytes': len(data),
+        'preview_bytes': len(preview),
+        'preview_ms': median_ms(lambda: pool_server.previews.make(key, data), args.runs),
+    }
+    for mode, runs in routed.items():
+        result[f'{mode}_sender_ms'] = round(statistics.median(r[0] for r in runs), 2)
+        result[f'{mode}_delivered_ms'] = round(statistics.median(r[1] for r in runs), 2)
+        result[f'{mode}_message_bytes'] = runs[-1][2]
+        result[f'{mode}_total_mb'] = round(runs[-1][2] * args.receivers / 1e6, 2)
+    result['bandwidth_saved'] = round(1 - result['preview_message_bytes'] / result['plain_message_bytes'], 3)
+    original_ms = decode_thumbnail_ms(data, args.runs)
+    if original_ms is not None:
+        result['receiver_decode_original_ms'] = original_ms
+        result['receiver_decode_preview_ms'] = decode_thumbnail_ms(preview, args.runs)
+    return result
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Apercus des images cote serveur")
+    parser.add_argument("--receivers", type=int, default=20)
+    parser.add_argument("--runs", type=int, default=10)
+    parser.add_argument("--image", action="append", help="image a mesurer (par defaut : photos synthetiques)")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    if args.image:
+        images = [(path, open(path, "rb").read()) for path in args.image]
+    else:
+        images = [(f"{w}x{h}", synthetic_photo(w, h)) for w, h in ((1024, 768), (2048, 1536), (4032, 3024))]
+    with tempfile.TemporaryDirectory() as store_dir:
+        # Originaux gardes dans un repertoire temporaire, pas dans celui du serveur
+        WSServer.MEDIA_STORE_DIR = store_dir
+        # Le serveur affiche chaque message recu
+        with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+            results = [bench_image(name, data, args) for name, data in images]
+    print(json.dumps({'receivers': args.receivers, 'runs': args.runs, 'results': results}, indent=2))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,30 @@
+"""
+Lance un WSServer sans boucle interactive, pour les benchmarks.
+
+    python -m bench.serve --port 8765 --profile low_latency
+    python -m bench.serve --port 8765 --media-http
+"""
+import argparse
+
+from Context import Context
+from WSServer import WSServer
+
+
+def main():
+    parser = argparse.ArgumentParser(description="WSServer non interactif pour les benchmarks")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--profile", choices=sorted(Context.PROFILES), default="default")
+    parser.add_argument("--media-http", action="store_true", help="active le point HTTP des medias")
+    args = parser.parse_args()
+
+    ws_server = WSServer(Context(args.host, args.port, args.profile, media_http=args.media_http))
+    ws_server.running = True
+    if ws_server.media_http is not None:
+        ws_server.media_http.start()
+    print(f"Serveur WS sur ws://{args.host}:{args.port}", flush=True)
+    ws_server.server.run_forever()
+
+
+if __name__ == "__main__":
+    main()
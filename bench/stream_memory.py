@@ -0,0 +1,168 @@
+"""
+Verifie que l'envoi d'un media en flux (MediaStream) garde une memoire bornee.
+
+Un fichier de `--size` octets est envoye par WSClient.upload_file vers une fausse
+connexion qui ne fait que compter les octets ; le pic d'allocation Python
+(tracemalloc) est compare a `--limit`, independamment de la taille du fichier.
+La trame produite est aussi comparee a Message.to_json() sur un petit fichier.
+
+upload_file plutot que send_file : au-dela de media_dedup_min_bytes, send_file ne
+part que sur une requete MEDIA_QUERY et le fichier ne serait jamais envoye ici.
+
+    python -m bench.stream_memory --size 268435456
+        -> code de sortie 1 si le pic depasse la limite ou grandit avec la taille du
+           fichier, si la trame differe ou si les octets envoyes ne correspondent pas
+           au media encode
+
+Le depot n'a pas de suite de tests : ce code de sortie tient lieu de test de MediaStream.
+"""
+import argparse
+import base64
+import json
+import os
+import sys
+import tempfile
+import threading
+import tracemalloc
+
+from websocket import ABNF
+
+from Context import Context
+from MediaStream import MediaStream
+from Message import Message, MessageType
+from WSClient import WSClient
+
+
+class CountingSocket:
+    """Socket factice : compte les octets, garde eventuellement la trame."""
+
+    def __init__(self, keep=False):
+        self.sent_bytes = 0
+        self.keep = keep
+        self.data = bytearray()
+
+    def sendall(self, data):
+        self.sent_bytes += len(data)
+        if self.keep:
+            self.data += data
+
+
+class FakeWebSocket:
+    """Ce que MediaStream utilise de websocket.WebSocket : `lock` et `sock`."""
+
+    def __init__(self, keep=False):
+        self.lock = threading.Lock()
+        self.sock = CountingSocket(keep)
+
+    def send(self, data):
+        self.sock.sendall(data.encode("utf-8"))
+
+
+def make_file(size):
+    fd, path = tempfile.mkstemp(suffix=".bin")
+    block = os.urandom(1024 * 1024)
+    with os.fdopen(fd, "wb") as f:
+        remaining = size
+        while remaining > 0:
+            f.write(block[:min(remaining, len(block))])
+            remaining -= len(block)
+    return path
+
+
+def decode_frame(frame):
+    """Retourne la charge utile (demasquee) d'une trame texte masquee."""
+    length = frame[1] & 0x7F
+    offset = 2
+    if length == 126:
+        length = int.from_bytes(frame[2:4], "big")
+        offset = 4
+    elif length == 127:
+        length = int.from_bytes(frame[2:10], "big")
+        offset = 10
+    mask_key = bytes(frame[offset:offset + 4])
+    payload = bytes(frame[offset + 4:])
+    assert len(payload) == length, (len(payload), length)
+    return ABNF.mask(mask_key, payload)
+
+
+def check_frame():
+    """La trame en flux doit etre identique au JSON de Message.to_json()."""
+    path = make_file(100 * 1000 + 1)
+    try:
+        ws = FakeWebSocket(keep=True)
+        message = Message(MessageType.ENVOI.VIDEO, emitter="é-client", receiver="ALL", value="")
+        MediaStream(path, message, "VIDEO", chunk_size=3 * 1000).send(ws)
+        with open(path, "rb") as f:
+            expected = Message(MessageType.ENVOI.VIDEO, emitter="é-client", receiver="ALL",
+                               value="VIDEO:" + base64.b64encode(f.read()).decode("utf-8"))
+        return decode_frame(ws.sock.data).decode("utf-8") == expected.to_json()
+    finally:
+        os.remove(path)
+
+
+def measure_stream(size):
+    """Pic d'allocation de MediaStream.send seul, sans WSClient"""
+    path = make_file(size)
+    try:
+        ws = FakeWebSocket()
+        message = Message(MessageType.ENVOI.VIDEO, emitter="bench", receiver="ALL", value="")
+        tracemalloc.start()
+        MediaStream(path, message, "VIDEO").send(ws)
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        return peak
+    finally:
+        os.remove(path)
+
+
+def measure(size):
+    client = WSClient(Context("127.0.0.1", 0), "bench")
+    client.connected = True
+    client.ws.sock = FakeWebSocket()
+    path = make_file(size)
+    try:
+        message = Message(MessageType.ENVOI.VIDEO, emitter="bench", receiver="ALL", value="")
+        expected = MediaStream(path, message, "VIDEO").payload_length()
+        tracemalloc.start()
+        client.upload_file(path, "ALL", MessageType.ENVOI.VIDEO, "VIDEO")
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        return peak, client.ws.sock.sock.sent_bytes, expected
+    finally:
+        os.remove(path)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Memoire de l'envoi de media en flux")
+    parser.add_argument("--size", type=int, default=256 * 1024 * 1024, help="taille du fichier (octets)")
+    parser.add_argument("--limit", type=int, default=8 * 1024 * 1024, help="pic d'allocation accepte (octets)")
+    args = parser.parse_args(argv)
+
+    frame_ok = check_frame()
+    peak, sent, expected = measure(args.size)
+    # Charge utile + en-tete de trame (au plus 14 octets)
+    sent_ok = expected <= sent <= expected + 14
+    # Memoire bornee : le pic ne grandit pas avec le fichier (8 fois plus petit, a 1 Mo pres)
+    stream_peak = measure_stream(args.size)
+    small_peak = measure_stream(max(1, args.size // 8))
+    flat_ok = stream_peak <= small_peak + 1024 * 1024
+    report = {
+        "file_size": args.size,
+        "sent_bytes": sent,
+        "expected_payload_bytes": expected,
+        "sent_matches_payload": sent_ok,
+        "peak_alloc_bytes": peak,
+        "peak_ratio": round(peak / args.size, 4),
+        "limit_bytes": args.limit,
+        "frame_matches_to_json": frame_ok,
+        "stream_peak_alloc_bytes": stream_peak,
+        "stream_peak_alloc_bytes_size_div_8": small_peak,
+        "peak_independent_of_size": flat_ok,
+    }
+    print(json.dumps(report, indent=2, sort_keys=True))
+    ok = frame_ok and sent_ok and flat_ok and peak <= args.limit and stream_peak <= args.limit
+    return 0 if ok else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,8 +1,19 @@
 """
 Module GUI pour l'application de chat.
 """
+import importlib
+
 from .chat_app import ChatApp
 from .styles import COLORS, FONT_FAMILY, GLOBAL_STYLE
-from .qt_ws_client import QtWSClient
+
+# Imported on first use: QtWSClient pulls in websocket-client and WSClient
+_LAZY = {'QtWSClient': '.qt_ws_client'}
+
+
+def __getattr__(name):
+    if name in _LAZY:
+        return getattr(importlib.import_module(_LAZY[name], __name__), name)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
 
 __all__ = ['ChatApp', 'COLORS', 'FONT_FAMILY', 'GLOBAL_STYLE', 'QtWSClient']
@@ -5,8 +5,7 @@ from PyQt5.QtWidgets import QMainWindow, QStackedWidget
 
 from Message import MessageType
 from .styles import COLORS, GLOBAL_STYLE
-from .qt_ws_client import QtWSClient
-from .widgets import LoginWidget, ChatWidget
+from .widgets import LoginWidget
 
 
 class ChatApp(QMainWindow):
@@ -15,6 +14,8 @@ class ChatApp(QMainWindow):
     def __init__(self):
         super().__init__()
         self.ws_thread = None
+        self.chat_widget = None  # built on the first connect (see ensure_chat_widget)
+        self.store = None  # local history (MessageStore), opened on the first login
         self.init_ui()
 
     def init_ui(self):
@@ -32,19 +33,37 @@ class ChatApp(QMainWindow):
         self.login_widget.connect_requested.connect(self.on_connect)
         self.stack.addWidget(self.login_widget)
 
-        self.chat_widget = ChatWidget()
-        self.chat_widget.disconnect_requested.connect(self.on_disconnect)
-        self.stack.addWidget(self.chat_widget)
-
         self.stack.setCurrentIndex(0)
 
+    def ensure_chat_widget(self):
+        """Builds the chat screen on first use: the login screen shows without it"""
+        if self.chat_widget is None:
+            from .widgets.chat_widget import ChatWidget
+            self.chat_widget = ChatWidget()
+            self.chat_widget.disconnect_requested.connect(self.on_disconnect)
+            self.stack.addWidget(self.chat_widget)
+        return self.chat_widget
+
     def on_connect(self, name, ip, port):
+        # Network client and chat screen are only imported once the user connects
+        from .qt_ws_client import QtWSClient
+        self.ensure_chat_widget()
         self.ws_thread = QtWSClient(ip, port, name)
         self.ws_thread.connected.connect(lambda: self.on_connected(name, ip, port))
         self.ws_thread.disconnected.connect(self.on_disconnected)
-        self.ws_thread.message_received.connect(self.on_message)
+        self.ws_thread.messages_received.connect(self.on_messages)
         self.ws_thread.error.connect(self.on_error)
         self.ws_thread.clients_updated.connect(self.chat_widget.update_clients_list)
+        self.ws_thread.reconnecting.connect(self.on_reconnecting)
+        self.ws_thread.reconnected.connect(self.on_reconnected)
+        self.ws_thread.attachment_progress.connect(self.chat_widget.on_attachment_progress)
+        self.ws_thread.attachment_sent.connect(self.chat_widget.on_attachment_sent)
+        self.ws_thread.attachment_failed.connect(self.chat_widget.on_attachment_failed)
+        self.chat_widget.media_panel.media_cache = self.ws_thread.media_cache
+        self.chat_widget.media_panel.fetch_callback = self.ws_thread.fetch_media
+        self.chat_widget.media_panel.media_links = self.ws_thread
+        self.ws_thread.media_fetched.connect(self.chat_widget.media_panel.on_media_fetched)
+        self.chat_widget.set_perf_source(self.ws_thread)
 
         self.chat_widget.send_callback = self.send_text
         self.chat_widget.send_image_callback = self.send_image
@@ -55,7 +74,12 @@ class ChatApp(QMainWindow):
 
     def on_connected(self, name, ip, port):
         self.chat_widget.set_connection_info(name, ip, port)
-        self.chat_widget.clear_messages()
+        # History of this user on this server, from the local store: only the latest page is read
+        from MessageStore import MessageStore
+        from .widgets.message_list import StoredHistory
+        if self.store is None:
+            self.store = MessageStore()
+        self.chat_widget.set_history(StoredHistory(self.store, f"{name}@{ip}:{port}", name))
         self.stack.setCurrentIndex(1)
 
     def on_disconnected(self):
@@ -65,27 +89,47 @@ class ChatApp(QMainWindow):
             self.ws_thread.wait()
             self.ws_thread = None
 
+    def on_reconnecting(self, delay_ms):
+        self.chat_widget.add_message("SYSTEM", "", f"Connection lost, reconnecting in {delay_ms / 1000:.1f}s...", "text")
+
+    def on_reconnected(self, stats):
+        self.chat_widget.add_message("SYSTEM", "", f"Reconnected after {stats['last_downtime_s']:.1f}s ({stats['last_flushed']} queued messages sent)", "text")
+
+    def closeEvent(self, event):
+        if self.store is not None:
+            # Messages not written yet go to disk before exit
+            self.store.close()
+            self.store = None
+        super().closeEvent(event)
+
     def on_disconnect(self):
         if self.ws_thread:
             self.ws_thread.disconnect()
 
-    def on_message(self, msg):
-        # Ignorer les messages qu'on a envoyés soi-même (évite les doublons)
-        if msg.emitter == self.ws_thread.username:
+    def on_messages(self, messages):
+        """Lot de messages reçus pendant une image : ajoutés à la liste en une seule fois"""
+        if not self.ws_thread:
             return
-
-        if msg.message_type in [MessageType.RECEPTION.TEXT]:
-            self.chat_widget.add_message(msg.emitter, msg.receiver, msg.value, "text")
-        elif msg.message_type in [MessageType.RECEPTION.IMAGE]:
-            self.chat_widget.add_message(msg.emitter, msg.receiver, msg.value, "image")
-        elif msg.message_type in [MessageType.RECEPTION.AUDIO]:
-            self.chat_widget.add_message(msg.emitter, msg.receiver, msg.value, "audio")
-        elif msg.message_type in [MessageType.RECEPTION.VIDEO]:
-            self.chat_widget.add_message(msg.emitter, msg.receiver, msg.value, "video")
-        elif msg.message_type == MessageType.SYS_MESSAGE:
-            pass
-        elif msg.message_type == MessageType.WARNING:
-            self.chat_widget.add_message("SYSTEM", self.ws_thread.username, msg.value, "text")
+        username = self.ws_thread.username
+        entries = []
+        for msg in messages:
+            # Ignorer les messages qu'on a envoyés soi-même (évite les doublons)
+            if msg.emitter == username:
+                continue
+
+            if msg.message_type in [MessageType.RECEPTION.TEXT]:
+                entries.append((msg.emitter, msg.receiver, msg.value, "text"))
+            elif msg.message_type in [MessageType.RECEPTION.IMAGE]:
+                entries.append((msg.emitter, msg.receiver, msg.value, "image"))
+            elif msg.message_type in [MessageType.RECEPTION.AUDIO]:
+                entries.append((msg.emitter, msg.receiver, msg.value, "audio"))
+            elif msg.message_type in [MessageType.RECEPTION.VIDEO]:
+                entries.append((msg.emitter, msg.receiver, msg.value, "video"))
+            elif msg.message_type == MessageType.SYS_MESSAGE:
+                pass
+            elif msg.message_type == MessageType.WARNING:
+                entries.append(("SYSTEM", username, msg.value, "text"))
+        self.chat_widget.add_messages(entries)
 
     def on_error(self, error_msg):
         self.chat_widget.add_message("SYSTEM", "", f"Error: {error_msg}", "text")
@@ -96,16 +140,16 @@ class ChatApp(QMainWindow):
             self.ws_thread.send_text(content, receiver)
 
     def send_image(self, filepath, receiver):
-        """Reuse WSClient.send_image() via QtWSClient"""
+        """Encoded off the UI thread by QtWSClient, echoed by ChatWidget.on_attachment_sent"""
         if self.ws_thread:
             self.ws_thread.send_image(filepath, receiver)
 
     def send_audio(self, filepath, receiver):
-        """Reuse WSClient.send_audio() via QtWSClient"""
+        """Encoded off the UI thread by QtWSClient, echoed by ChatWidget.on_attachment_sent"""
         if self.ws_thread:
             self.ws_thread.send_audio(filepath, receiver)
 
     def send_video(self, filepath, receiver):
-        """Reuse WSClient.send_video() via QtWSClient"""
+        """Encoded off the UI thread by QtWSClient, echoed by ChatWidget.on_attachment_sent"""
         if self.ws_thread:
             self.ws_thread.send_video(filepath, receiver)
@@ -1,21 +1,88 @@
 """
 Client WebSocket Qt - Wrapper autour de WSClient avec signaux Qt.
 """
+import threading
+import time
+
 import websocket
-from PyQt5.QtCore import QThread, pyqtSignal
+from PyQt5.QtCore import QRunnable, QThread, QThreadPool, pyqtSignal
 
 from Context import Context
+from MediaCache import MediaCache
 from Message import Message, MessageType
 from WSClient import WSClient
 
 
+class AttachmentJob(QRunnable):
+    """Reads and base64-encodes an attachment once on a pool thread, then hands it to WSClient.
+
+    The same EncodedMedia feeds the network send and the local media cache, so the
+    echo of an image is an IMG#<hash> reference resolved from memory.
+    """
+
+    def __init__(self, owner, kind, filepath, dest):
+        super().__init__()
+        self.owner = owner
+        self.kind = kind
+        self.filepath = filepath
+        self.dest = dest
+        self.percent = -1
+
+    def progress(self, done, size):
+        percent = 100 * done // size if size else 100
+        if percent != self.percent:
+            self.percent = percent
+            self.owner.attachment_progress.emit(self.filepath, percent)
+
+    def run(self):
+        client = self.owner.client
+        if client is None:
+            self.owner.attachment_failed.emit(self.filepath, "not connected")
+            return
+        message_type, prefix = QtWSClient.MEDIA_TYPES[self.kind]
+        local_value = "FILE:" + self.filepath
+        try:
+            media = client.encode_file(self.filepath, prefix, self.progress)
+            if media is None:
+                # Too large to hold in memory: hashed, then streamed from the file by WSClient
+                client.send_file(self.filepath, self.dest, message_type, prefix, self.progress)
+            else:
+                client.send_encoded(media, self.filepath, self.dest, message_type)
+                # Audio / video keep playing the file in place (a cache reference would copy it to disk)
+                if self.kind == "image" and media.key in client.media_cache:
+                    local_value = Message.media_ref(prefix, media.key)
+        except OSError as e:
+            self.owner.attachment_failed.emit(self.filepath, str(e))
+            return
+        self.owner.attachment_sent.emit(self.filepath, self.kind, self.dest, local_value)
+
+
 class QtWSClient(QThread):
-    """Qt wrapper around WSClient - runs the client in a separate thread with Qt signals."""
-    message_received = pyqtSignal(object)
+    """Qt wrapper around WSClient - runs the client in a separate thread with Qt signals.
+
+    Incoming chat messages are coalesced in the network thread and reach the UI as one
+    `messages_received` list at most once per DELIVERY_INTERVAL_MS (a frame at 60 Hz), and
+    only once the previous list has been picked up: a slow UI gets bigger lists, not more.
+    """
+    messages_received = pyqtSignal(list)
     connected = pyqtSignal()
     disconnected = pyqtSignal()
     error = pyqtSignal(str)
     clients_updated = pyqtSignal(list)
+    reconnecting = pyqtSignal(int)
+    reconnected = pyqtSignal(dict)
+    attachment_progress = pyqtSignal(str, int)            # file path, percent read
+    attachment_sent = pyqtSignal(str, str, str, str)      # file path, kind, dest, local value
+    attachment_failed = pyqtSignal(str, str)              # file path, error
+    media_fetched = pyqtSignal(str, bool)                 # media hash, original now in media_cache
+
+    MEDIA_TYPES = {
+        'image': (MessageType.ENVOI.IMAGE, "IMG"),
+        'audio': (MessageType.ENVOI.AUDIO, "AUDIO"),
+        'video': (MessageType.ENVOI.VIDEO, "VIDEO"),
+    }
+
+    DELIVERY_INTERVAL_MS = 16
 
     def __init__(self, host, port, username):
         super().__init__()
@@ -23,17 +90,36 @@ class QtWSClient(QThread):
         self.port = port
         self.username = username
         self.client = None
+        # Host/port come from the login form, transport tuning from $WS_CONFIG / WS_* variables
+        ctx = Context.load()
+        self.ctx = Context(self.host, self.port, ctx.profile, **ctx.tuning())
+        # Shared with the UI (MediaPanel resolves IMG#<hash> references from it)
+        self.media_cache = MediaCache.from_context(self.ctx)
+        # Attachments are read and encoded one at a time, off the UI thread, in the order chosen
+        self.attachment_pool = QThreadPool(self)
+        self.attachment_pool.setMaxThreadCount(1)
+        # Messages waiting for the next delivery to the UI (see deliver)
+        self.inbox = []
+        self.inbox_lock = threading.Lock()
+        self.delivery_timer = None
+        self.delivery_in_flight = 0  # messages of the batch not yet picked up by the UI
+        self.last_delivery = 0.0
+        self.delivery_stats = {'messages': 0, 'batches': 0}
+        self.rtt_ms = None  # last server round trip (see send_ping)
+        # Runs in the UI thread (this object's thread), queued like the UI's own slot
+        self.messages_received.connect(self._on_batch_delivered)
 
     def run(self):
         """Create and run WSClient with overridden callbacks."""
-        ctx = Context(self.host, self.port)
-        self.client = WSClient(ctx, self.username)
+        ctx = self.ctx
+        self.client = WSClient(ctx, self.username, media_cache=self.media_cache)
 
         # Override WSClient callbacks to emit Qt signals
         self.client.on_open = self._on_open
         self.client.on_message = self._on_message
         self.client.on_error = self._on_error
         self.client.on_close = self._on_close
+        self.client.on_media_fetched = self.media_fetched.emit
 
         # Rebuild WebSocketApp with new callbacks
         self.client.ws = websocket.WebSocketApp(
@@ -43,70 +129,165 @@ class QtWSClient(QThread):
             on_error=self._on_error,
             on_close=self._on_close
         )
-        self.client.ws.run_forever()
+        self.client.ws.run_forever(sockopt=ctx.socket_options())
+
+        # Server-requested reconnect (drain/restart) or network drop with backoff, without
+        # going back to the login screen; next_delay is computed by WSClient.mark_closed
+        while self.client.next_delay is not None:
+            time.sleep(self.client.next_delay)
+            self.client.ws.run_forever(sockopt=ctx.socket_options())
 
     def _on_open(self, ws):
         """Called when connection opens - reuses WSClient's declaration logic."""
-        self.client.connected = True
-        self.connected.emit()
-        # Send declaration (same as WSClient.on_open)
-        message = Message(MessageType.DECLARATION, emitter=self.username, receiver="", value="")
-        ws.send(message.to_json())
+        reconnecting = self.client.was_connected
+        # Send RESUME or DECLARATION, then the messages queued while offline (same as WSClient.on_open)
+        self.client.mark_open(ws)
+        if reconnecting:
+            self.reconnected.emit(self.client.reconnect_stats())
+        else:
+            self.connected.emit()
 
     def _on_message(self, ws, message):
         """Called on message - reuses WSClient's ping/pong and ack logic."""
         received_msg = Message.from_json(message)
 
+        # Session token, seq tracking and replay de-duplication (same as WSClient)
+        if self.client.handle_session_message(ws, received_msg):
+            return
+        # Media cache and upload de-duplication; media reach the UI as IMG#<hash> references
+        if self.client.handle_media_message(ws, received_msg):
+            return
+
+        # Reply to send_ping
+        if received_msg.message_type == MessageType.SYS_MESSAGE and str(received_msg.value).startswith("PONG:"):
+            self.rtt_ms = (time.monotonic() - float(received_msg.value[5:])) * 1000
+            return
+
         # Handle ping (same as WSClient)
         if received_msg.message_type == MessageType.SYS_MESSAGE and received_msg.value == "ping":
             pong_msg = Message(MessageType.SYS_MESSAGE, emitter=self.username, receiver="", value="pong")
             ws.send(pong_msg.to_json())
             return
 
+        # Server drain/restart: reconnect after the requested delay (see run)
+        if received_msg.message_type == MessageType.SYS_MESSAGE and str(received_msg.value).startswith("RECONNECT:"):
+            delay_ms = int(received_msg.value.split(":", 1)[1])
+            self.client.reconnect_delay = delay_ms / 1000.0
+            self.reconnecting.emit(delay_ms)
+            return
+
         # Handle client list update
         if received_msg.message_type == MessageType.RECEPTION.CLIENT_LIST:
             clients = [c for c in received_msg.value if c != self.username]
             self.clients_updated.emit(clients)
             return
 
-        # Emit signal for UI
-        self.message_received.emit(received_msg)
+        # Delivered to the UI with the other messages of this frame (receipt is confirmed by WSClient's cumulative ack)
+        self.deliver(received_msg)
+
+    def deliver(self, message):
+        """Queues a message for the UI, delivered with the others of the same frame"""
+        with self.inbox_lock:
+            self.inbox.append(message)
+            self._schedule_delivery()
+
+    def _schedule_delivery(self):
+        # Called under inbox_lock
+        if self.delivery_timer is not None or self.delivery_in_flight or not self.inbox:
+            return
+        wait = max(0.0, self.last_delivery + self.DELIVERY_INTERVAL_MS / 1000.0 - time.monotonic())
+        self.delivery_timer = threading.Timer(wait, self.flush_inbox)
+        self.delivery_timer.daemon = True
+        self.delivery_timer.start()
+
+    def flush_inbox(self):
+        with self.inbox_lock:
+            if self.delivery_timer is not None:
+                self.delivery_timer.cancel()
+                self.delivery_timer = None
+            batch, self.inbox = self.inbox, []
+            if not batch:
+                return
+            self.delivery_in_flight = len(batch)
+            self.last_delivery = time.monotonic()
+            self.delivery_stats['messages'] += len(batch)
+            self.delivery_stats['batches'] += 1
+            # Emitted under the lock: batches reach the UI in order
+            self.messages_received.emit(batch)
+
+    def _on_batch_delivered(self, batch):
+        # The UI event loop got to the batch: messages received since then go out as the next one
+        with self.inbox_lock:
+            self.delivery_in_flight = 0
+            self._schedule_delivery()
+
+    def queue_depth(self):
+        """Messages received but not yet handled by the UI"""
+        with self.inbox_lock:
+            return len(self.inbox) + self.delivery_in_flight
 
-        # Send ack for RECEPTION messages (same as WSClient)
-        if received_msg.message_type in [MessageType.RECEPTION.TEXT, MessageType.RECEPTION.IMAGE, MessageType.RECEPTION.AUDIO, MessageType.RECEPTION.VIDEO]:
-            ack_msg = Message(MessageType.SYS_MESSAGE, emitter=self.username, receiver="", value="MESSAGE OK")
-            ws.send(ack_msg.to_json())
+    def send_ping(self):
+        """Measures the server round trip: the PONG reply sets rtt_ms"""
+        if self.client and self.client.connected:
+            ping_msg = Message(MessageType.SYS_MESSAGE, emitter=self.username, receiver="SERVER", value=f"PING:{time.monotonic()}")
+            # Straight to the socket: a batching window would be counted in the round trip
+            self.client.send_now(ping_msg)
 
     def _on_error(self, ws, error):
         self.error.emit(str(error))
 
     def _on_close(self, ws, close_status_code, close_msg):
-        self.client.connected = False
-        self.disconnected.emit()
+        self.flush_inbox()
+        server_hint = self.client.reconnect_delay is not None
+        delay = self.client.mark_closed()
+        # A reconnect is pending: stay on the chat screen
+        if delay is None:
+            self.disconnected.emit()
+        elif not server_hint:
+            # Network drop (server hints already emitted reconnecting from _on_message)
+            self.reconnecting.emit(int(delay * 1000))
 
     def send_text(self, value, dest):
         """Reuse WSClient.send()"""
         if self.client and self.client.ws:
             self.client.send(value, dest)
 
-    def send_image(self, filepath, dest):
-        """Reuse WSClient.send_image()"""
+    def send_media(self, kind, filepath, dest):
+        """Sends an attachment from the pool (see AttachmentJob); progress and result come as signals"""
         if self.client and self.client.ws:
-            self.client.send_image(filepath, dest)
+            self.attachment_pool.start(AttachmentJob(self, kind, filepath, dest))
+        else:
+            self.attachment_failed.emit(filepath, "not connected")
 
-    def send_audio(self, filepath, dest):
-        """Reuse WSClient.send_audio()"""
+    def fetch_media(self, key):
+        """Asks the server for the original of a previewed image; answered by media_fetched"""
         if self.client and self.client.ws:
-            self.client.send_audio(filepath, dest)
+            self.client.fetch_media(key)
+        else:
+            self.media_fetched.emit(key, False)
+
+    def media_url(self, key):
+        """URL of a linked media (VIDEO@<hash>) on the server's HTTP endpoint, or None"""
+        return self.client.media_url(key) if self.client else None
+
+    def download_media(self, key):
+        """Cache file of a linked media, downloaded over HTTP if needed (called from the media loader's pool)"""
+        return self.client.download_media(key) if self.client else None
+
+    def send_image(self, filepath, dest):
+        self.send_media("image", filepath, dest)
+
+    def send_audio(self, filepath, dest):
+        self.send_media("audio", filepath, dest)
 
     def send_video(self, filepath, dest):
-        """Reuse WSClient.send_video()"""
-        if self.client and self.client.ws:
-            self.client.send_video(filepath, dest)
+        self.send_media("video", filepath, dest)
 
     def disconnect(self):
         """Disconnect - same logic as WSClient input_loop disconnect."""
         if self.client and self.client.ws:
+            self.client.flush()
+            self.client.closing = True
             disconnect_msg = Message(MessageType.SYS_MESSAGE, emitter=self.username, receiver="", value="Disconnect")
             self.client.ws.send(disconnect_msg.to_json())
             self.client.ws.close()
@@ -1,9 +1,27 @@
 """
 Widgets pour l'interface de chat.
 """
+import importlib
+
 from .login_widget import LoginWidget
-from .message_bubble import MessageBubble
-from .media_panel import MediaPanel
-from .chat_widget import ChatWidget
 
-__all__ = ['LoginWidget', 'MessageBubble', 'MediaPanel', 'ChatWidget']
+# Imported on first use: only the login screen is needed at startup
+_LAZY = {
+    'MessageBubble': '.message_bubble',
+    'MessageListModel': '.message_list',
+    'MessageListView': '.message_list',
+    'MediaLoader': '.media_loader',
+    'MediaPanel': '.media_panel',
+    'ChatWidget': '.chat_widget',
+    'PerfOverlay': '.perf_overlay',
+}
+
+
+def __getattr__(name):
+    if name in _LAZY:
+        return getattr(importlib.import_module(_LAZY[name], __name__), name)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+__all__ = ['LoginWidget', 'MessageBubble', 'MessageListModel', 'MessageListView', 'MediaLoader', 'MediaPanel', 'ChatWidget',
+           'PerfOverlay']
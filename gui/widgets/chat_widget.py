@@ -1,19 +1,18 @@
 """
 Interface principale du chat.
 """
-import base64
+import os
 from datetime import datetime
 
 from PyQt5.QtWidgets import (
     QWidget, QVBoxLayout, QHBoxLayout, QLabel, QLineEdit,
-    QPushButton, QScrollArea, QFrame, QFileDialog, QApplication,
-    QComboBox
+    QPushButton, QFrame, QFileDialog, QComboBox, QShortcut
 )
-from PyQt5.QtCore import Qt, pyqtSignal
-from PyQt5.QtGui import QFont
+from PyQt5.QtCore import pyqtSignal
+from PyQt5.QtGui import QFont, QKeySequence
 
 from ..styles import COLORS, FONT_FAMILY
-from .message_bubble import MessageBubble
+from .message_list import MessageListModel, MessageListView, make_row
 from .media_panel import MediaPanel
 
 
@@ -29,6 +28,9 @@ class ChatWidget(QWidget):
         self.send_image_callback = None
         self.send_audio_callback = None
         self.send_video_callback = None
+        self.attachments = {}  # file path -> percent read, while being prepared for sending
+        self.perf_overlay = None  # built on first toggle (F12 / PERF button)
+        self.perf_source = None
         self.init_ui()
 
     def init_ui(self):
@@ -68,6 +70,8 @@ class ChatWidget(QWidget):
         # Input Bar
         main_layout.addWidget(self._create_input_bar())
 
+        QShortcut(QKeySequence("F12"), self, activated=self.toggle_perf_overlay)
+
     def _create_header(self):
         header = QFrame()
         header.setStyleSheet(f"""
@@ -105,6 +109,30 @@ class ChatWidget(QWidget):
         status_label.setStyleSheet(f"color: {COLORS['primary']}; font-size: 11px; margin-right: 20px; background: transparent;")
         header_layout.addWidget(status_label)
 
+        # Performance overlay toggle
+        self.perf_btn = QPushButton("PERF")
+        self.perf_btn.setToolTip("Performance overlay (F12)")
+        self.perf_btn.setCheckable(True)
+        self.perf_btn.setFont(QFont(FONT_FAMILY, 10, QFont.Bold))
+        self.perf_btn.setStyleSheet(f"""
+            QPushButton {{
+                background-color: transparent;
+                color: {COLORS['text_muted']};
+                border: 1px solid {COLORS['border_subtle']};
+                border-radius: 8px;
+                padding: 10px 14px;
+                margin-right: 10px;
+                font-size: 11px;
+                font-weight: bold;
+            }}
+            QPushButton:checked {{
+                color: {COLORS['primary']};
+                border-color: {COLORS['primary']};
+            }}
+        """)
+        self.perf_btn.clicked.connect(self.toggle_perf_overlay)
+        header_layout.addWidget(self.perf_btn)
+
         # Disconnect button
         self.disconnect_btn = QPushButton("DISCONNECT")
         self.disconnect_btn.setFont(QFont(FONT_FAMILY, 10, QFont.Bold))
@@ -134,25 +162,19 @@ class ChatWidget(QWidget):
         chat_area.setStyleSheet(f"background-color: {COLORS['bg_dark']};")
         chat_layout = QVBoxLayout(chat_area)
         chat_layout.setContentsMargins(0, 0, 0, 0)
+        self.chat_layout = chat_layout
 
-        self.scroll_area = QScrollArea()
-        self.scroll_area.setWidgetResizable(True)
-        self.scroll_area.setStyleSheet(f"""
-            QScrollArea {{
+        # Only visible rows are painted; older messages are reloaded when scrolling up
+        self.messages_model = MessageListModel()
+        self.messages_view = MessageListView(self.messages_model)
+        self.messages_view.setStyleSheet(f"""
+            QListView {{
                 border: none;
+                padding: 3px;
                 background-color: {COLORS['bg_dark']};
             }}
         """)
-
-        self.messages_widget = QWidget()
-        self.messages_widget.setStyleSheet(f"background-color: {COLORS['bg_dark']};")
-        self.messages_layout = QVBoxLayout(self.messages_widget)
-        self.messages_layout.setAlignment(Qt.AlignTop)
-        self.messages_layout.setContentsMargins(15, 15, 15, 15)
-        self.messages_layout.setSpacing(8)
-
-        self.scroll_area.setWidget(self.messages_widget)
-        chat_layout.addWidget(self.scroll_area)
+        chat_layout.addWidget(self.messages_view)
 
         return chat_area
 
@@ -236,9 +258,9 @@ class ChatWidget(QWidget):
         # Message input
         message_container = QVBoxLayout()
         message_container.setSpacing(4)
-        message_label = QLabel("MESSAGE")
-        message_label.setStyleSheet(label_style)
-        message_container.addWidget(message_label)
+        self.message_label = QLabel("MESSAGE")
+        self.message_label.setStyleSheet(label_style)
+        message_container.addWidget(self.message_label)
 
         self.message_input = QLineEdit()
         self.message_input.setPlaceholderText("Type your message...")
@@ -315,21 +337,31 @@ class ChatWidget(QWidget):
         self.connection_label.setStyleSheet(f"color: {COLORS['text_secondary']}; font-size: 11px; background: transparent;")
 
     def add_message(self, sender, receiver, content, msg_type="text"):
-        timestamp = datetime.now().strftime("%H:%M")
-        bubble = MessageBubble(sender, receiver, content, timestamp, msg_type)
-        self.messages_layout.addWidget(bubble)
+        self.add_messages([(sender, receiver, content, msg_type)])
 
-        QApplication.processEvents()
-        self.scroll_area.verticalScrollBar().setValue(
-            self.scroll_area.verticalScrollBar().maximum()
-        )
-
-        if msg_type == "image":
-            self.media_panel.show_image(content)
-        elif msg_type == "audio":
-            self.media_panel.show_audio(content)
-        elif msg_type == "video":
-            self.media_panel.show_video(content)
+    def add_messages(self, entries):
+        """Adds (sender, receiver, content, msg_type) entries with a single insertion and layout pass"""
+        if not entries:
+            return
+        timestamp = datetime.now().strftime("%H:%M")
+        # Own messages always bring the list back to the latest messages
+        if any(sender == self.username for sender, _, _, _ in entries):
+            self.messages_view.scroll_to_latest()
+        self.messages_model.append_rows([make_row(sender, receiver, content, timestamp, msg_type)
+                                         for sender, receiver, content, msg_type in entries],
+                                        trim=self.messages_view.follow)
+
+        # Only the batch's last media is shown: the panel would replace the earlier ones anyway
+        for _, _, content, msg_type in reversed(entries):
+            if msg_type == "image":
+                self.media_panel.show_image(content)
+            elif msg_type == "audio":
+                self.media_panel.show_audio(content)
+            elif msg_type == "video":
+                self.media_panel.show_video(content)
+            else:
+                continue
+            break
 
     def on_send(self):
         if not self.send_callback:
@@ -359,28 +391,46 @@ class ChatWidget(QWidget):
         if not receiver:
             return
 
-        display_receiver = "Everyone" if receiver == "ALL" else receiver
-
         ext = file_path.lower().split('.')[-1]
 
+        # Read and encoded once off the UI thread; the local echo comes with on_attachment_sent
+        callback = None
         if ext in ['png', 'jpg', 'jpeg', 'gif', 'bmp']:
-            if self.send_image_callback:
-                self.send_image_callback(file_path, receiver)
-                with open(file_path, 'rb') as f:
-                    img_data = "IMG:" + base64.b64encode(f.read()).decode('utf-8')
-                self.add_message(self.username, display_receiver, img_data, "image")
+            callback = self.send_image_callback
         elif ext in ['mp3', 'wav', 'ogg', 'm4a']:
-            if self.send_audio_callback:
-                self.send_audio_callback(file_path, receiver)
-                with open(file_path, 'rb') as f:
-                    audio_data = "AUDIO:" + base64.b64encode(f.read()).decode('utf-8')
-                self.add_message(self.username, display_receiver, audio_data, "audio")
+            callback = self.send_audio_callback
         elif ext in ['mp4', 'avi', 'mov', 'mkv', 'webm']:
-            if self.send_video_callback:
-                self.send_video_callback(file_path, receiver)
-                with open(file_path, 'rb') as f:
-                    video_data = "VIDEO:" + base64.b64encode(f.read()).decode('utf-8')
-                self.add_message(self.username, display_receiver, video_data, "video")
+            callback = self.send_video_callback
+        if callback:
+            self.attachments[file_path] = 0
+            self.show_attachments()
+            callback(file_path, receiver)
+
+    def on_attachment_progress(self, file_path, percent):
+        if file_path in self.attachments:
+            self.attachments[file_path] = percent
+            self.show_attachments()
+
+    def on_attachment_sent(self, file_path, kind, receiver, local_value):
+        """Local echo, from the attachment's cache reference (or the file itself)"""
+        self.attachments.pop(file_path, None)
+        self.show_attachments()
+        display_receiver = "Everyone" if receiver == "ALL" else receiver
+        self.add_message(self.username, display_receiver, local_value, kind)
+
+    def on_attachment_failed(self, file_path, error):
+        self.attachments.pop(file_path, None)
+        self.show_attachments()
+        self.add_message("SYSTEM", "", f"Attachment {os.path.basename(file_path)} failed: {error}", "text")
+
+    def show_attachments(self):
+        if not self.attachments:
+            self.message_label.setText("MESSAGE")
+            return
+        name = os.path.basename(next(iter(self.attachments)))
+        percent = min(self.attachments.values())
+        more = f" (+{len(self.attachments) - 1})" if len(self.attachments) > 1 else ""
+        self.message_label.setText(f"MESSAGE  ·  ATTACHING {name}{more} {percent}%")
 
     def update_clients_list(self, clients):
         """Met à jour le sélecteur de destinataires avec la liste des clients."""
@@ -396,7 +446,32 @@ class ChatWidget(QWidget):
             self.recipient_combo.setCurrentIndex(index)
 
     def clear_messages(self):
-        while self.messages_layout.count():
-            item = self.messages_layout.takeAt(0)
-            if item.widget():
-                item.widget().deleteLater()
+        self.attachments = {}
+        self.show_attachments()
+        self.messages_model.clear()
+        self.messages_view.itemDelegate().heights = {}
+        self.messages_view.follow = True
+
+    def set_perf_source(self, source):
+        """QtWSClient whose delivery queue and server round trip the overlay shows"""
+        self.perf_source = source
+        if self.perf_overlay is not None:
+            self.perf_overlay.source = source
+
+    def toggle_perf_overlay(self):
+        if self.perf_overlay is None:
+            from .perf_overlay import PerfOverlay
+            self.perf_overlay = PerfOverlay(self.media_panel)
+            self.perf_overlay.source = self.perf_source
+            self.chat_layout.insertWidget(0, self.perf_overlay)
+        self.perf_overlay.toggle()
+        self.perf_btn.setChecked(self.perf_overlay.isVisible())
+
+    def set_history(self, history):
+        """Shows another history (e.g. a StoredHistory on login), from its latest page"""
+        self.attachments = {}
+        self.show_attachments()
+        self.messages_view.itemDelegate().heights = {}
+        self.messages_view.follow = True
+        self.messages_model.set_history(history)
+        self.messages_view.scroll_to_latest()
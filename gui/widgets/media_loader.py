@@ -0,0 +1,193 @@
+"""
+Décodage des médias hors du thread de l'interface.
+"""
+import base64
+import threading
+
+from PyQt5.QtCore import QObject, QRunnable, QThreadPool, Qt, pyqtSignal
+from PyQt5.QtGui import QImage
+
+from Message import Message
+
+
+class MediaJobSignals(QObject):
+    """Results of a MediaJob, delivered to the UI thread (queued connections)."""
+    image_ready = pyqtSignal(int, QImage)
+    file_ready = pyqtSignal(int, str, str)     # job id, kind, path
+    data_ready = pyqtSignal(int, str, bytes)   # job id, kind, decoded media
+    url_ready = pyqtSignal(int, str, str)      # job id, kind, URL on the server's media endpoint
+    failed = pyqtSignal(int, str)
+
+
+class MediaJob(QRunnable):
+    """Resolves one media value (FILE:, IMG#<hash> or inline base64) on a pool thread.
+
+    Images become a QImage thumbnail (QPixmap is only usable on the UI thread), or stay
+    full size without a thumbnail width; a server preview (IMG#<hash>:<base64>) is decoded as is;
+    audio and video become a file of the media cache, or bytes played from memory.
+    Media on the server's HTTP endpoint (VIDEO@<hash>) are streamed from their URL by
+    the player, or downloaded into the media cache for images.
+    """
+
+    PREFIXES = {'image': "IMG", 'audio': "AUDIO", 'video': "VIDEO"}
+
+    def __init__(self, job_id, kind, value, media_cache, thumbnail_width, links=None):
+        super().__init__()
+        self.job_id = job_id
+        self.kind = kind
+        self.value = value
+        self.media_cache = media_cache
+        self.links = links
+        self.thumbnail_width = thumbnail_width
+        self.cancelled = threading.Event()
+        self.signals = MediaJobSignals()
+
+    def run(self):
+        try:
+            if self.kind == 'image':
+                self.load_image()
+            else:
+                self.load_file()
+        except Exception as e:
+            if not self.cancelled.is_set():
+                self.signals.failed.emit(self.job_id, str(e))
+
+    def media_bytes(self):
+        preview = Message.parse_media_preview(self.value)
+        if preview:
+            return base64.b64decode(preview[2])
+        ref = Message.parse_media_ref(self.value)
+        if ref:
+            return self.media_cache.get(ref[1]) if self.media_cache else None
+        # "IMG:<base64>", or bare base64 from older clients
+        return base64.b64decode(self.value.partition(":")[2] or self.value)
+
+    def load_image(self):
+        image = QImage()
+        link = Message.parse_media_link(self.value)
+        if self.value.startswith("FILE:"):
+            image.load(self.value[5:])
+        elif link:
+            path = self.links.download_media(link[1]) if self.links else None
+            if self.cancelled.is_set() or not path:
+                return
+            image.load(path)
+        else:
+            data = self.media_bytes()
+            if self.cancelled.is_set() or not data:
+                return
+            image.loadFromData(data)
+        if self.cancelled.is_set() or image.isNull():
+            return
+        if self.thumbnail_width:
+            image = image.scaledToWidth(self.thumbnail_width, Qt.SmoothTransformation)
+        if not self.cancelled.is_set():
+            self.signals.image_ready.emit(self.job_id, image)
+
+    def load_file(self):
+        if self.value.startswith("FILE:"):
+            # Local file (our own attachment): played in place
+            self.signals.file_ready.emit(self.job_id, self.kind, self.value[5:])
+            return
+
+        link = Message.parse_media_link(self.value)
+        if link:
+            path = self.media_cache.file_for(link[1]) if self.media_cache else None
+            url = None if path or not self.links else self.links.media_url(link[1])
+            if path:
+                self.signals.file_ready.emit(self.job_id, self.kind, path)
+            elif url:
+                # Played while it downloads: the player asks for byte ranges as it goes
+                self.signals.url_ready.emit(self.job_id, self.kind, url)
+            else:
+                self.signals.failed.emit(self.job_id, f"{self.kind} not available from the server")
+            return
+
+        # Inline media goes into the bounded cache once, and is played from there like a reference
+        ref = Message.parse_media_ref(self.value)
+        key = ref[1] if ref else None
+        if key is None and self.media_cache is not None:
+            value = self.value if ":" in self.value[:8] else f"{self.PREFIXES[self.kind]}:{self.value}"
+            key = self.media_cache.put_value(value)
+        path = self.media_cache.file_for(key) if key else None
+        if self.cancelled.is_set():
+            return
+        if path:
+            self.signals.file_ready.emit(self.job_id, self.kind, path)
+            return
+
+        # No disk cache (budget, no cache at all): the player reads the bytes from memory
+        data = self.media_cache.get(key) if key else self.media_bytes()
+        if data and not self.cancelled.is_set():
+            self.signals.data_ready.emit(self.job_id, self.kind, data)
+
+
+class MediaLoader(QObject):
+    """Runs MediaJobs on a small thread pool; a new request cancels the previous one.
+
+    Only the latest request's result is emitted: a superseded job is taken off the
+    queue if it has not started, told to stop otherwise, and its late result dropped.
+    """
+    image_ready = pyqtSignal(QImage)
+    file_ready = pyqtSignal(str, str)     # kind, path
+    data_ready = pyqtSignal(str, bytes)   # kind, decoded media
+    url_ready = pyqtSignal(str, str)      # kind, URL to stream
+    failed = pyqtSignal(str)
+
+    def __init__(self, parent=None, thumbnail_width=250, max_threads=2):
+        super().__init__(parent)
+        self.pool = QThreadPool(self)
+        self.pool.setMaxThreadCount(max_threads)
+        self.thumbnail_width = thumbnail_width
+        self.media_cache = None
+        self.links = None  # QtWSClient: media_url / download_media for VIDEO@<hash> links
+        self.current = None
+        self.next_id = 1
+
+    def load(self, kind, value):
+        self.cancel()
+        job = MediaJob(self.next_id, kind, value, self.media_cache, self.thumbnail_width, self.links)
+        self.next_id += 1
+        job.signals.image_ready.connect(self.on_image_ready)
+        job.signals.file_ready.connect(self.on_file_ready)
+        job.signals.data_ready.connect(self.on_data_ready)
+        job.signals.url_ready.connect(self.on_url_ready)
+        job.signals.failed.connect(self.on_failed)
+        self.current = job
+        self.pool.start(job)
+
+    def cancel(self):
+        job, self.current = self.current, None
+        if job is not None:
+            job.cancelled.set()
+            try:
+                self.pool.tryTake(job)
+            except RuntimeError:
+                pass  # already run, and deleted by the pool
+
+    def is_current(self, job_id):
+        return self.current is not None and self.current.job_id == job_id
+
+    def on_image_ready(self, job_id, image):
+        if self.is_current(job_id):
+            self.image_ready.emit(image)
+
+    def on_file_ready(self, job_id, kind, path):
+        if self.is_current(job_id):
+            self.file_ready.emit(kind, path)
+
+    def on_data_ready(self, job_id, kind, data):
+        if self.is_current(job_id):
+            self.data_ready.emit(kind, data)
+
+    def on_url_ready(self, job_id, kind, url):
+        if self.is_current(job_id):
+            self.url_ready.emit(kind, url)
+
+    def on_failed(self, job_id, error):
+        if self.is_current(job_id):
+            self.failed.emit(error)
+
+    def shutdown(self):
+        self.cancel()
+        self.pool.waitForDone()
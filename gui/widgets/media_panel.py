@@ -1,17 +1,26 @@
 """
 Panneau pour afficher le dernier media partage.
 """
-import base64
-import tempfile
-import os
+import time
+from collections import deque
 
-from PyQt5.QtWidgets import QWidget, QVBoxLayout, QLabel, QPushButton, QFrame
-from PyQt5.QtCore import Qt, QUrl
+from PyQt5.QtWidgets import QWidget, QVBoxLayout, QLabel, QPushButton, QFrame, QScrollArea
+from PyQt5.QtCore import Qt, QUrl, QBuffer, QIODevice, pyqtSignal
 from PyQt5.QtGui import QPixmap, QFont
-from PyQt5.QtMultimedia import QMediaPlayer, QMediaContent
-from PyQt5.QtMultimediaWidgets import QVideoWidget
 
+from Message import Message
 from ..styles import COLORS, FONT_FAMILY
+from .media_loader import MediaLoader
+
+
+class ImageLabel(QLabel):
+    """Thumbnail label that reports clicks (opens the full-size image)."""
+    clicked = pyqtSignal()
+
+    def mousePressEvent(self, event):
+        if event.button() == Qt.LeftButton:
+            self.clicked.emit()
+        super().mousePressEvent(event)
 
 
 class MediaPanel(QWidget):
@@ -19,13 +28,52 @@ class MediaPanel(QWidget):
 
     def __init__(self):
         super().__init__()
-        self.media_player = None
-        self.temp_audio_file = None
-        self.temp_video_file = None
+        self.media_player = None  # single player, reused for every audio / video item (see init_player)
+        self.media_buffer = None  # QBuffer when playing from memory
         self.is_playing = False
-        self.current_media_type = None  # "audio" or "video"
+        self.current_media_type = None  # "image", "audio" or "video"
+        # Receipt -> displayed (image) / loaded in the player (audio, video), in ms;
+        # "full": click -> full-size image shown, including the fetch from the server
+        self.requested_at = None
+        self.latencies = {kind: deque(maxlen=100) for kind in ("image", "audio", "video", "full")}
+        # Server previews (IMG#<hash>:<base64>): the original is only fetched when the image is opened
+        self.current_image = None
+        self.fetch_callback = None  # set by ChatApp: asks the server for an original (see on_media_fetched)
+        self.pending_full = None
+        self.full_requested_at = None
+        self.viewer = None
+        self.full_loader = MediaLoader(self, thumbnail_width=None, max_threads=1)
+        self.full_loader.image_ready.connect(self.show_full)
+        self.full_loader.failed.connect(self.on_load_failed)
+        # Decoding, thumbnails and cache writes happen off the UI thread; newer media cancels older
+        self.loader = MediaLoader(self)
+        self.loader.image_ready.connect(self.on_image_ready)
+        self.loader.file_ready.connect(self.on_file_ready)
+        self.loader.data_ready.connect(self.on_data_ready)
+        self.loader.url_ready.connect(self.on_url_ready)
+        self.loader.failed.connect(self.on_load_failed)
         self.init_ui()
 
+    @property
+    def media_cache(self):
+        """MediaCache, set by ChatApp: resolves IMG#<hash> references"""
+        return self.loader.media_cache
+
+    @media_cache.setter
+    def media_cache(self, cache):
+        self.loader.media_cache = cache
+        self.full_loader.media_cache = cache
+
+    @property
+    def media_links(self):
+        """QtWSClient, set by ChatApp: resolves VIDEO@<hash> links to the server's media endpoint"""
+        return self.loader.links
+
+    @media_links.setter
+    def media_links(self, links):
+        self.loader.links = links
+        self.full_loader.links = links
+
     def init_ui(self):
         self.setFixedWidth(300)
         self.setStyleSheet(f"""
@@ -99,7 +147,10 @@ class MediaPanel(QWidget):
         self.content_layout.addWidget(self.placeholder)
 
         # Image display
-        self.image_label = QLabel()
+        self.image_label = ImageLabel()
+        self.image_label.setCursor(Qt.PointingHandCursor)
+        self.image_label.setToolTip("Click to open full size")
+        self.image_label.clicked.connect(self.open_image)
         self.image_label.setAlignment(Qt.AlignCenter)
         self.image_label.setStyleSheet(f"""
             QLabel {{
@@ -112,6 +163,17 @@ class MediaPanel(QWidget):
         self.image_label.hide()
         self.content_layout.addWidget(self.image_label)
 
+        layout.addWidget(self.content_area)
+        layout.addStretch()
+
+    def init_player(self):
+        """Audio / video widgets and the player, built with the first audio or video item:
+        QtMultimedia is slow to load and not needed for text and images"""
+        if self.media_player is not None:
+            return
+        from PyQt5.QtMultimedia import QMediaPlayer
+        from PyQt5.QtMultimediaWidgets import QVideoWidget
+
         # Audio player widget
         self.audio_widget = QWidget()
         self.audio_widget.setStyleSheet("background: transparent;")
@@ -192,54 +254,150 @@ class MediaPanel(QWidget):
         self.video_widget.hide()
         self.content_layout.addWidget(self.video_widget)
 
-        layout.addWidget(self.content_area)
-        layout.addStretch()
+        self.media_player = QMediaPlayer(self)
+        self.media_player.setVideoOutput(self.video_display)
+        self.media_player.mediaStatusChanged.connect(self.on_media_status)
 
     def show_image(self, base64_data):
         self.placeholder.hide()
-        self.audio_widget.hide()
-        self.video_widget.hide()
+        if self.media_player is not None:
+            self.audio_widget.hide()
+            self.video_widget.hide()
         self.image_label.show()
-
-        if base64_data.startswith("IMG:"):
-            base64_data = base64_data[4:]
-
-        image_data = base64.b64decode(base64_data)
-        pixmap = QPixmap()
-        pixmap.loadFromData(image_data)
-        scaled = pixmap.scaledToWidth(250, Qt.SmoothTransformation)
-        self.image_label.setPixmap(scaled)
+        self.current_media_type = "image"
+        self.current_image = base64_data
+        self.pending_full = None
+
+        # Decoded and scaled on the loader's pool; the UI only receives the thumbnail
+        self.requested_at = time.perf_counter()
+        self.image_label.setText("Loading...")
+        self.loader.load("image", base64_data)
+
+    def on_image_ready(self, image):
+        self.image_label.setPixmap(QPixmap.fromImage(image))
+        self.record_latency("image")
+
+    def open_image(self):
+        """Full-size view of the current image; a preview's original is fetched first if not cached"""
+        if self.current_media_type != "image" or not self.current_image:
+            return
+        self.full_requested_at = time.perf_counter()
+        preview = Message.parse_media_preview(self.current_image)
+        if preview is None:
+            self.full_loader.load("image", self.current_image)
+            return
+        prefix, key, _ = preview
+        cache = self.media_cache
+        links = self.media_links
+        if cache is not None and key in cache:
+            self.full_loader.load("image", Message.media_ref(prefix, key))
+        elif links is not None and links.media_url(key):
+            # Downloaded from the server's HTTP endpoint, off the WebSocket stream
+            self.full_loader.load("image", Message.media_link(prefix, key))
+        elif self.fetch_callback is not None and self.pending_full != key:
+            self.pending_full = key
+            self.image_label.setToolTip("Loading full size...")
+            self.fetch_callback(key)
+
+    def on_media_fetched(self, key, available):
+        if key != self.pending_full:
+            return
+        self.pending_full = None
+        self.image_label.setToolTip("Click to open full size")
+        if available:
+            self.full_loader.load("image", Message.media_ref("IMG", key))
+        else:
+            print(f"[media] original {key[:12]} no longer on the server")
+
+    def show_full(self, image):
+        if self.viewer is None:
+            self.viewer = QScrollArea()
+            self.viewer.setWindowTitle("Image")
+            self.viewer.setAlignment(Qt.AlignCenter)
+            self.viewer.setStyleSheet(f"background-color: {COLORS['bg_dark']};")
+            self.viewer.setWidget(QLabel())
+        label = self.viewer.widget()
+        label.setPixmap(QPixmap.fromImage(image))
+        label.adjustSize()
+        self.viewer.resize(min(image.width() + 4, 1200), min(image.height() + 4, 900))
+        self.viewer.show()
+        self.viewer.raise_()
+        if self.full_requested_at is not None:
+            self.latencies["full"].append((time.perf_counter() - self.full_requested_at) * 1000)
+            self.full_requested_at = None
+
+    def record_latency(self, kind):
+        if self.requested_at is not None:
+            self.latencies[kind].append((time.perf_counter() - self.requested_at) * 1000)
+            self.requested_at = None
+
+    def latency_stats(self):
+        """Median and worst receipt-to-ready latency (ms) per media kind"""
+        stats = {}
+        for kind, values in self.latencies.items():
+            if values:
+                ordered = sorted(values)
+                stats[kind] = {'count': len(ordered), 'p50_ms': round(ordered[len(ordered) // 2], 1), 'max_ms': round(ordered[-1], 1)}
+        return stats
 
     def show_audio(self, base64_data):
+        self.init_player()
         self.placeholder.hide()
         self.image_label.hide()
         self.video_widget.hide()
         self.audio_widget.show()
         self.current_media_type = "audio"
-
-        if base64_data.startswith("AUDIO:"):
-            base64_data = base64_data[6:]
-
-        audio_bytes = base64.b64decode(base64_data)
-
-        if self.temp_audio_file:
-            try:
-                os.remove(self.temp_audio_file)
-            except:
-                pass
-
-        fd, self.temp_audio_file = tempfile.mkstemp(suffix=".mp3")
-        with os.fdopen(fd, 'wb') as f:
-            f.write(audio_bytes)
-
-        self.media_player = QMediaPlayer()
-        self.media_player.setMedia(QMediaContent(QUrl.fromLocalFile(self.temp_audio_file)))
-
+        self.reset_player()
+        self.loader.load("audio", base64_data)
+
+    def reset_player(self):
+        """Stops the current media until the loader hands over the new one"""
+        from PyQt5.QtMultimedia import QMediaContent
+        self.requested_at = time.perf_counter()
+        self.media_player.stop()
+        self.media_player.setMedia(QMediaContent())
+        if self.media_buffer is not None:
+            self.media_buffer.close()
+            self.media_buffer.deleteLater()
+            self.media_buffer = None
         self.is_playing = False
         self.play_pause_btn.setText("PLAY")
+        self.video_play_btn.setText("PLAY")
+
+    def on_file_ready(self, kind, path):
+        from PyQt5.QtMultimedia import QMediaContent
+        # Media cache file (or our own attachment): nothing is copied
+        self.media_player.setMedia(QMediaContent(QUrl.fromLocalFile(path)))
+
+    def on_url_ready(self, kind, url):
+        from PyQt5.QtMultimedia import QMediaContent
+        # Streamed over HTTP (range requests): playback starts before the download ends
+        self.media_player.setMedia(QMediaContent(QUrl(url)))
+
+    def on_data_ready(self, kind, data):
+        from PyQt5.QtMultimedia import QMediaContent
+        # No file to point at: the player reads the decoded bytes from memory
+        self.media_buffer = QBuffer(self)
+        self.media_buffer.setData(data)
+        self.media_buffer.open(QIODevice.ReadOnly)
+        self.media_player.setMedia(QMediaContent(), self.media_buffer)
+
+    def on_media_status(self, status):
+        player = self.media_player
+        if status in (player.LoadedMedia, player.BufferedMedia) and self.current_media_type in ("audio", "video"):
+            self.record_latency(self.current_media_type)
+        elif status == player.EndOfMedia:
+            self.is_playing = False
+            self.play_pause_btn.setText("PLAY")
+            self.video_play_btn.setText("PLAY")
+
+    def on_load_failed(self, error):
+        if self.current_media_type == "image":
+            self.image_label.setText("Image unavailable")
+        print(f"[media] {error}")
 
     def toggle_audio(self):
-        if not self.media_player:
+        if self.media_player.mediaStatus() == self.media_player.NoMedia:
             return
 
         if self.is_playing:
@@ -252,36 +410,17 @@ class MediaPanel(QWidget):
         self.is_playing = not self.is_playing
 
     def show_video(self, base64_data):
+        self.init_player()
         self.placeholder.hide()
         self.image_label.hide()
         self.audio_widget.hide()
         self.video_widget.show()
         self.current_media_type = "video"
-
-        if base64_data.startswith("VIDEO:"):
-            base64_data = base64_data[6:]
-
-        video_bytes = base64.b64decode(base64_data)
-
-        if self.temp_video_file:
-            try:
-                os.remove(self.temp_video_file)
-            except:
-                pass
-
-        fd, self.temp_video_file = tempfile.mkstemp(suffix=".mp4")
-        with os.fdopen(fd, 'wb') as f:
-            f.write(video_bytes)
-
-        self.media_player = QMediaPlayer()
-        self.media_player.setVideoOutput(self.video_display)
-        self.media_player.setMedia(QMediaContent(QUrl.fromLocalFile(self.temp_video_file)))
-
-        self.is_playing = False
-        self.video_play_btn.setText("PLAY")
+        self.reset_player()
+        self.loader.load("video", base64_data)
 
     def toggle_video(self):
-        if not self.media_player:
+        if self.media_player.mediaStatus() == self.media_player.NoMedia:
             return
 
         if self.is_playing:
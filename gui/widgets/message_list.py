@@ -0,0 +1,359 @@
+"""
+Liste des messages virtualisée (modèle / délégué Qt).
+"""
+from collections import namedtuple
+
+from PyQt5.QtWidgets import QListView, QStyledItemDelegate, QAbstractItemView
+from PyQt5.QtCore import Qt, QAbstractListModel, QModelIndex, QPoint, QRect, QSize
+from PyQt5.QtGui import QColor, QFont, QFontMetrics, QPainter, QPen
+
+from Message import Message
+from ..styles import COLORS, FONT_FAMILY
+
+
+ChatRow = namedtuple("ChatRow", "sender receiver content timestamp msg_type")
+
+ROW_ROLE = Qt.UserRole + 1
+KEY_ROLE = Qt.UserRole + 2
+
+MEDIA_LABELS = {
+    "image": ("Image attached", "primary"),
+    "audio": ("Audio message", "secondary"),
+    "video": ("Video attached", "accent_purple"),
+}
+
+
+def make_row(sender, receiver, content, timestamp, msg_type="text"):
+    """Compact row: inline media payloads are not kept, only short references (FILE:, IMG#...)"""
+    preview = Message.parse_media_preview(content) if msg_type != "text" else None
+    if preview:
+        content = Message.media_ref(preview[0], preview[1])
+    if msg_type != "text" and not (content.startswith("FILE:") or Message.parse_media_ref(content) or Message.parse_media_link(content)):
+        content = ""
+    return ChatRow(sender, receiver, content, timestamp, msg_type)
+
+
+def qcolor(value):
+    """QColor from a COLORS entry, including the "rgba(r, g, b, a)" form"""
+    if value.startswith("rgba("):
+        r, g, b, a = [part.strip() for part in value[5:-1].split(",")]
+        return QColor(int(r), int(g), int(b), int(float(a) * 255))
+    return QColor(value)
+
+
+class MessageHistory:
+    """Historique complet en mémoire, source du chargement à la demande du modèle."""
+
+    def __init__(self):
+        self.rows = []
+
+    def __len__(self):
+        return len(self.rows)
+
+    def append(self, row):
+        self.rows.append(row)
+
+    def fetch(self, start, end):
+        return self.rows[start:end]
+
+    def clear(self):
+        self.rows = []
+
+
+class StoredHistory:
+    """Historique persistant d'un utilisateur (MessageStore) : seules les pages affichées sont lues."""
+
+    def __init__(self, store, owner, username):
+        self.store = store
+        self.owner = owner  # history key, e.g. "<username>@<host>:<port>"
+        self.username = username
+        self.length = store.count(owner)
+
+    def __len__(self):
+        return self.length
+
+    def append(self, row):
+        # Conversation : le salon, ou l'autre participant d'un message privé
+        if row.receiver in ("ALL", "Everyone"):
+            peer = "ALL"
+        else:
+            peer = row.receiver if row.sender == self.username else row.sender
+        self.store.append(self.owner, self.length, peer, row)
+        self.length += 1
+
+    def fetch(self, start, end):
+        return [ChatRow(*values) for values in self.store.fetch(self.owner, start, end)]
+
+    def clear(self):
+        self.store.delete(self.owner)
+        self.length = 0
+
+
+class MessageListModel(QAbstractListModel):
+    """Fenêtre bornée sur l'historique : au plus `window` lignes chargées, par pages de `page`.
+
+    En suivant les derniers messages, seules `live_window` lignes restent chargées : la vue
+    recalcule la disposition de toutes les lignes chargées à chaque insertion.
+    """
+
+    def __init__(self, history=None, window=2000, page=200, live_window=200, parent=None):
+        super().__init__(parent)
+        self.history = history if history is not None else MessageHistory()
+        self.window = window
+        self.page = page
+        self.live_window = min(live_window, window)
+        self.first = 0  # history index of the first loaded row
+        self.rows = []
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.rows)
+
+    def data(self, index, role=Qt.DisplayRole):
+        if not index.isValid():
+            return None
+        row = self.rows[index.row()]
+        if role == ROW_ROLE:
+            return row
+        if role == KEY_ROLE:
+            return self.first + index.row()
+        if role == Qt.DisplayRole:
+            return row.content
+        return None
+
+    def append_rows(self, rows, trim=True):
+        """Adds new messages to the history, and to the loaded rows if the window reaches the end;
+        with `trim` (following the latest messages), drops the oldest loaded rows beyond live_window"""
+        if not rows:
+            return
+        at_end = not self.can_load_newer()
+        for row in rows:
+            self.history.append(row)
+        if not at_end:
+            return  # reading older messages: loaded by load_newer when scrolling down
+        start = len(self.rows)
+        self.beginInsertRows(QModelIndex(), start, start + len(rows) - 1)
+        self.rows.extend(rows)
+        self.endInsertRows()
+        if trim:
+            self.trim(limit=self.live_window)
+
+    def trim(self, keep_end=True, limit=None):
+        """Drops the rows beyond the window (or `limit`), at the top (`keep_end`) or at the bottom"""
+        excess = len(self.rows) - (limit or self.window)
+        if excess <= 0:
+            return
+        if keep_end:
+            self.beginRemoveRows(QModelIndex(), 0, excess - 1)
+            del self.rows[:excess]
+            self.first += excess
+        else:
+            self.beginRemoveRows(QModelIndex(), len(self.rows) - excess, len(self.rows) - 1)
+            del self.rows[-excess:]
+        self.endRemoveRows()
+
+    def can_load_older(self):
+        return self.first > 0
+
+    def can_load_newer(self):
+        return self.first + len(self.rows) < len(self.history)
+
+    def load_older(self):
+        """Loads one page of older messages above the loaded rows"""
+        count = min(self.page, self.first)
+        if count <= 0:
+            return 0
+        rows = self.history.fetch(self.first - count, self.first)
+        self.beginInsertRows(QModelIndex(), 0, len(rows) - 1)
+        self.rows[0:0] = rows
+        self.first -= len(rows)
+        self.endInsertRows()
+        self.trim(keep_end=False)
+        return len(rows)
+
+    def load_newer(self):
+        """Loads one page of newer messages below the loaded rows"""
+        last = self.first + len(self.rows)
+        rows = self.history.fetch(last, last + self.page)
+        if not rows:
+            return 0
+        start = len(self.rows)
+        self.beginInsertRows(QModelIndex(), start, start + len(rows) - 1)
+        self.rows.extend(rows)
+        self.endInsertRows()
+        self.trim()
+        return len(rows)
+
+    def set_history(self, history):
+        """Switches to another history, showing its most recent page"""
+        self.history = history
+        self.load_latest()
+
+    def load_latest(self):
+        """Moves the window back to the most recent messages"""
+        self.beginResetModel()
+        total = len(self.history)
+        self.first = max(0, total - self.live_window)
+        self.rows = self.history.fetch(self.first, total)
+        self.endResetModel()
+
+    def clear(self):
+        self.beginResetModel()
+        self.history.clear()
+        self.rows = []
+        self.first = 0
+        self.endResetModel()
+
+
+class MessageDelegate(QStyledItemDelegate):
+    """Paints a message like MessageBubble did, without any widget per row."""
+
+    MARGIN = 12       # around the bubble
+    PADDING = 14      # inside the content frame
+    HEADER_GAP = 6
+    SPACING = 8       # between two messages
+    HEIGHTS_MAX = 20000
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.header_font = QFont(FONT_FAMILY, 9)
+        self.header_bold = QFont(FONT_FAMILY, 9, QFont.Bold)
+        self.content_font = QFont(FONT_FAMILY, 10)
+        self.header_metrics = QFontMetrics(self.header_font)
+        self.header_bold_metrics = QFontMetrics(self.header_bold)
+        self.content_metrics = QFontMetrics(self.content_font)
+        self.colors = {name: qcolor(value) for name, value in COLORS.items()}
+        # Text heights by (history index, width): wrapping is only measured once per row
+        self.heights = {}
+        self.heights_width = None
+
+    def content_text(self, row):
+        if row.msg_type == "text":
+            return row.content
+        return MEDIA_LABELS.get(row.msg_type, ("", "primary"))[0]
+
+    def text_width(self, width):
+        return max(10, width - 2 * self.MARGIN - 2 * self.PADDING - 3)
+
+    def text_height(self, key, row, width):
+        if width != self.heights_width:
+            self.heights = {}
+            self.heights_width = width
+        height = self.heights.get(key)
+        if height is None:
+            if len(self.heights) > self.HEIGHTS_MAX:
+                self.heights = {}
+            rect = self.content_metrics.boundingRect(QRect(0, 0, self.text_width(width), 100000),
+                                                     Qt.TextWordWrap, self.content_text(row))
+            height = self.heights[key] = rect.height()
+        return height
+
+    def sizeHint(self, option, index):
+        # The list only ever shows one column: rows are as wide as the viewport
+        width = self.parent().viewport().width() if self.parent() is not None else option.rect.width()
+        # Straight to the model (MessageListModel), not through data(): called for every row on each layout
+        model = index.model()
+        position = index.row()
+        key = model.first + position
+        height = self.heights.get(key) if width == self.heights_width else None
+        if height is None:
+            height = self.text_height(key, model.rows[position], width)
+        return QSize(width, self.MARGIN + self.header_metrics.height() + self.HEADER_GAP
+                     + height + 2 * self.PADDING + self.SPACING)
+
+    def paint(self, painter, option, index):
+        row = index.data(ROW_ROLE)
+        rect = option.rect.adjusted(self.MARGIN, self.MARGIN // 2, -self.MARGIN, -self.SPACING // 2)
+        painter.save()
+        painter.setRenderHint(QPainter.Antialiasing, True)
+
+        # Header: sender -> receiver  time
+        x = rect.left()
+        y = rect.top()
+        baseline = y + self.header_metrics.ascent()
+        for text, bold, color in ((row.sender, True, "primary"), (" → ", False, "text_muted"),
+                                  (row.receiver, False, "text_secondary"), ("  " + row.timestamp, False, "text_muted")):
+            painter.setFont(self.header_bold if bold else self.header_font)
+            painter.setPen(self.colors[color])
+            painter.drawText(x, baseline, text)
+            x += (self.header_bold_metrics if bold else self.header_metrics).horizontalAdvance(text)
+
+        # Content frame with the type's accent on the left
+        frame = QRect(rect.left(), y + self.header_metrics.height() + self.HEADER_GAP,
+                      rect.width(), rect.bottom() - y - self.header_metrics.height() - self.HEADER_GAP)
+        accent = "primary" if row.msg_type == "text" else MEDIA_LABELS.get(row.msg_type, ("", "primary"))[1]
+        painter.setPen(QPen(self.colors["border_subtle"], 1))
+        painter.setBrush(self.colors["bg_glass"])
+        painter.drawRoundedRect(frame, 12, 12)
+        painter.fillRect(QRect(frame.left(), frame.top() + 6, 3, frame.height() - 12), self.colors[accent])
+
+        painter.setFont(self.content_font)
+        painter.setPen(self.colors["text_primary" if row.msg_type == "text" else accent])
+        text_rect = frame.adjusted(self.PADDING + 3, self.PADDING, -self.PADDING, -self.PADDING)
+        painter.drawText(text_rect, Qt.TextWordWrap, self.content_text(row))
+        painter.restore()
+
+
+class MessageListView(QListView):
+    """Chat list: follows new messages while at the bottom, pages through the history at both ends."""
+
+    def __init__(self, model, parent=None):
+        super().__init__(parent)
+        self.setModel(model)
+        self.setItemDelegate(MessageDelegate(self))
+        self.setVerticalScrollMode(QAbstractItemView.ScrollPerPixel)
+        self.setHorizontalScrollBarPolicy(Qt.ScrollBarAlwaysOff)
+        self.setSelectionMode(QAbstractItemView.NoSelection)
+        self.setFocusPolicy(Qt.NoFocus)
+        # Row heights vary with wrapping; the model window keeps the layout pass short
+        self.setResizeMode(QListView.Adjust)
+        self.setUniformItemSizes(False)
+        self.follow = True
+        self.paging = False
+        scroll_bar = self.verticalScrollBar()
+        scroll_bar.setSingleStep(20)
+        scroll_bar.valueChanged.connect(self.on_scrolled)
+        scroll_bar.rangeChanged.connect(self.on_range_changed)
+
+    def at_bottom(self):
+        scroll_bar = self.verticalScrollBar()
+        return scroll_bar.value() >= scroll_bar.maximum() - 4
+
+    def on_scrolled(self, value):
+        if self.paging:
+            return
+        model = self.model()
+        scroll_bar = self.verticalScrollBar()
+        if value == scroll_bar.minimum() and model.can_load_older():
+            self.load_page(model.load_older)
+        elif value == scroll_bar.maximum() and model.can_load_newer():
+            self.load_page(model.load_newer)
+        self.follow = self.at_bottom() and not model.can_load_newer()
+
+    def load_page(self, load):
+        """Loads a page while keeping the row at the top of the viewport in place"""
+        model = self.model()
+        anchor = self.indexAt(QPoint(0, 0))
+        key = model.first + anchor.row() if anchor.isValid() else None
+        offset = self.visualRect(anchor).top() if anchor.isValid() else 0
+        self.paging = True
+        try:
+            if not load():
+                return
+            # Synchronous layout, so the anchor row's new position is known now
+            self.doItemsLayout()
+            if key is not None and model.first <= key < model.first + model.rowCount():
+                rect = self.visualRect(model.index(key - model.first))
+                scroll_bar = self.verticalScrollBar()
+                scroll_bar.setValue(scroll_bar.value() + rect.top() - offset)
+        finally:
+            self.paging = False
+
+    def scroll_to_latest(self):
+        if self.model().can_load_newer():
+            self.model().load_latest()
+        self.follow = True
+        self.verticalScrollBar().setValue(self.verticalScrollBar().maximum())
+
+    def on_range_changed(self, minimum, maximum):
+        if self.follow and not self.paging:
+            self.verticalScrollBar().setValue(maximum)
@@ -0,0 +1,100 @@
+"""
+Bandeau de mesures de performance du client graphique.
+"""
+import time
+
+from PyQt5.QtWidgets import QLabel
+from PyQt5.QtCore import QTimer
+
+from ..styles import COLORS
+
+
+class PerfOverlay(QLabel):
+    """One-line performance strip above the message list, refreshed every second.
+
+    Shows where the lag comes from: incoming messages/s and the queue between
+    QtWSClient and the UI (network side), server round trip (PING/PONG), the UI
+    event loop's frame interval (rendering side) and media decode time. Its timers
+    only run while it is shown, so a hidden overlay costs nothing.
+    """
+
+    SAMPLE_MS = 1000
+    FRAME_MS = 16
+
+    def __init__(self, media_panel, parent=None):
+        super().__init__(parent)
+        self.media_panel = media_panel
+        self.source = None  # QtWSClient, set by ChatWidget.set_perf_source
+        self.setStyleSheet(f"""
+            QLabel {{
+                background-color: {COLORS['bg_surface']};
+                color: {COLORS['text_secondary']};
+                border-bottom: 1px solid {COLORS['border_subtle']};
+                padding: 6px 16px;
+                font-family: monospace;
+                font-size: 11px;
+            }}
+        """)
+        self.sample_timer = QTimer(self)
+        self.sample_timer.setInterval(self.SAMPLE_MS)
+        self.sample_timer.timeout.connect(self.sample)
+        # Ticks every frame: the gap between two ticks is how long the event loop was busy
+        self.frame_timer = QTimer(self)
+        self.frame_timer.setInterval(self.FRAME_MS)
+        self.frame_timer.timeout.connect(self.on_frame)
+        self.frames = []
+        self.last_frame = None
+        self.last_messages = None
+        self.last_sample = None
+        self.setText("perf: waiting for the first sample...")
+        self.hide()
+
+    def start(self):
+        self.frames = []
+        self.last_frame = time.perf_counter()
+        self.last_messages = None
+        self.last_sample = time.perf_counter()
+        self.frame_timer.start()
+        self.sample_timer.start()
+        self.ping()
+        self.show()
+
+    def stop(self):
+        self.frame_timer.stop()
+        self.sample_timer.stop()
+        self.hide()
+
+    def toggle(self):
+        if self.isVisible():
+            self.stop()
+        else:
+            self.start()
+
+    def on_frame(self):
+        now = time.perf_counter()
+        self.frames.append((now - self.last_frame) * 1000)
+        self.last_frame = now
+
+    def ping(self):
+        if self.source is not None:
+            self.source.send_ping()
+
+    def sample(self):
+        now = time.perf_counter()
+        elapsed, self.last_sample = now - self.last_sample, now
+        frames, self.frames = sorted(self.frames), []
+        parts = []
+
+        source = self.source
+        if source is not None:
+            received = source.delivery_stats['messages']
+            rate = 0 if self.last_messages is None else (received - self.last_messages) / elapsed
+            self.last_messages = received
+            rtt = f"{source.rtt_ms:.0f} ms" if source.rtt_ms is not None else "-"
+            parts += [f"in {rate:.0f} msg/s", f"queue {source.queue_depth()}", f"rtt {rtt}"]
+        if frames:
+            parts.append(f"frame p50 {frames[len(frames) // 2]:.0f} / max {frames[-1]:.0f} ms")
+        decode = self.media_panel.latency_stats().get("image")
+        parts.append(f"image decode {decode['p50_ms']:.0f} ms" if decode else "image decode -")
+        self.setText("  |  ".join(parts))
+        self.ping()